@@ -0,0 +1,338 @@
+"""Offline benchmark for the song queue and chat commands.
+
+yt-dlp, pytube, Yandex Music and Twitch are replaced by deterministic in-process
+fakes with configurable latency, so results are reproducible without network.
+
+Usage:
+    python benchmark.py [--sizes 10 100 1000 10000] [--ops 200] [--latency-ms 0] [--jitter-ms 0]
+"""
+import argparse
+import asyncio
+import gc
+import hashlib
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+import music_player
+from music_player import MusicPlayer, SongRequest
+from wave_buffer import WaveBuffer
+
+class FakeLatency:
+    """Deterministic pseudo-random delay shared by all fake backends"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, seed=1):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.random = random.Random(seed)
+
+    def wait(self):
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+def _fake_video_id(text):
+    """Стабильный 11-символьный ID видео для строки запроса"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:11]
+
+def make_fake_yt_dlp(latency):
+    """Module-like stand-in for yt_dlp with a YoutubeDL context manager"""
+    class YoutubeDL:
+        def __init__(self, opts=None):
+            self.opts = opts or {}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def extract_info(self, url, download=False):
+            latency.wait()
+            if url.startswith('ytsearch'):
+                query = url.split(':', 1)[1]
+                video_id = _fake_video_id(query)
+                return {'entries': [{'id': video_id, 'title': f"Fake result for {query}", 'duration': 200}]}
+            return {'id': _fake_video_id(url), 'title': f"Fake video {url[-11:]}", 'duration': 200}
+
+    return types.SimpleNamespace(YoutubeDL=YoutubeDL)
+
+class FakeYandexMusicAPI:
+    """Stand-in for YandexMusicAPI that never touches the network"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.is_authorized = True
+        self.is_authorizing = False
+        self.token = "fake"
+        self._counter = 0
+        self.wave_buffer = WaveBuffer(self)
+
+    def wait_until_ready(self, timeout=None):
+        return True
+
+    def clean_temp_directory(self, max_age_hours=24):
+        pass
+
+    def _track(self, title):
+        self._counter += 1
+        artist = types.SimpleNamespace(name="Fake Artist")
+        album = types.SimpleNamespace(id=1000 + self._counter)
+        return types.SimpleNamespace(id=self._counter, title=title, artists=[artist],
+                                     albums=[album], duration_ms=180000)
+
+    def search_track(self, query, limit=10):
+        self.latency.wait()
+        return [self._track(query)]
+
+    def fetch_wave_batch(self, last_track_id=None):
+        self.latency.wait()
+        batch = []
+        for _ in range(5):
+            track = self._track("Wave track")
+            batch.append({'id': track.id, 'album_id': track.albums[0].id, 'title': track.title,
+                          'artists': ["Fake Artist"], 'duration': 180})
+        return batch
+
+    def get_wave_tracks(self, count=1):
+        return self.wave_buffer.take(count, wait=True)
+
+    def download_track(self, track_info):
+        self.latency.wait()
+        return None
+
+    def prefetch_download_info(self, track_info):
+        return None
+
+class FakePlayerFrame:
+    """GUI-less player frame: accepts every track immediately"""
+
+    def __init__(self):
+        self.pending_command = {"command": "none"}
+        self.volume = 50
+
+    def update_now_playing(self, song):
+        return song is not None
+
+    def set_volume(self, volume):
+        self.volume = volume
+        return True
+
+class FakeListbox:
+    """Stand-in for tk.Listbox used by TwitchBotGUI._update_queue_display"""
+
+    def __init__(self):
+        self.items = []
+
+    def delete(self, first, last=None):
+        self.items = []
+
+    def insert(self, index, item):
+        self.items.append(item)
+
+class FakeAuthor:
+    def __init__(self, name, is_mod=False):
+        self.name = name
+        self.is_mod = is_mod
+
+class FakeContext:
+    """Minimal twitchio Context: records replies instead of sending them"""
+
+    def __init__(self, author, channel_name="benchchannel"):
+        self.author = author
+        self.channel = types.SimpleNamespace(name=channel_name)
+        self.replies = []
+
+    async def send(self, content):
+        self.replies.append(content)
+
+def install_fakes(latency):
+    """Подменяет сетевые зависимости music_player фейками"""
+    music_player.HAS_YT_DLP = True
+    music_player.HAS_PYTUBE = False
+    music_player.yt_dlp = make_fake_yt_dlp(latency)
+    music_player._yandex_music_api_instance = FakeYandexMusicAPI(latency)
+
+def make_player(queue_size):
+    """MusicPlayer with a fake player frame and queue_size songs queued"""
+    player = MusicPlayer(message_callback=lambda message: None)
+    # Фоновая проверка воспроизводимости ходит в сеть мимо фейков и в замеры не входит
+    player.check_playability = False
+    player.initialize_player(FakePlayerFrame(), update_queue_callback=lambda: None)
+    # Заполняем очередь напрямую, без add_song, чтобы не мерить подготовку
+    player.queue = [
+        SongRequest(_fake_video_id(f"prefill {i}"), f"Prefill song {i}", f"user{i % 50}", 200)
+        for i in range(queue_size)
+    ]
+    player.current_song = SongRequest(_fake_video_id("current"), "Current song", "user0", 200)
+    player.is_playing = True
+    return player
+
+def run_ops(name, queue_size, ops, setup, op):
+    """Run op() ops times against a fresh setup(queue_size); return a result row"""
+    state = setup(queue_size)
+    latencies = []
+    gc.collect()
+    start = time.perf_counter()
+    for i in range(ops):
+        op_start = time.perf_counter()
+        op(state, i)
+        latencies.append(time.perf_counter() - op_start)
+    elapsed = time.perf_counter() - start
+    return summarize(name, queue_size, ops, elapsed, latencies)
+
+def summarize(name, queue_size, ops, elapsed, latencies):
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100)
+    else:
+        quantiles = latencies * 99
+    return {
+        "name": name,
+        "queue_size": queue_size,
+        "ops": ops,
+        "rps": ops / elapsed if elapsed else float('inf'),
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+def measure_memory(queue_size):
+    """Память, занятая плеером с очередью заданного размера (КБ)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    player = make_player(queue_size)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del player
+    return size / 1024
+
+def player_scenarios():
+    """(name, op) pairs exercised against MusicPlayer"""
+    def add_search(player, i):
+        player.add_to_queue(f"bench search {i}", f"viewer{i}")
+
+    def add_url(player, i):
+        player.add_to_queue(f"https://www.youtube.com/watch?v={_fake_video_id(str(i))}", f"viewer{i}")
+
+    def skip(player, i):
+        # Держим размер очереди постоянным
+        player.queue.append(SongRequest(_fake_video_id(f"refill {i}"), f"Refill {i}", "refill", 200))
+        player.skip_song()
+
+    def wrong_song_miss(player, i):
+        # Худший случай: у пользователя нет песен в очереди
+        player.wrong_song("nobody")
+
+    return [
+        ("add_to_queue(search)", add_search),
+        ("add_to_queue(url)", add_url),
+        ("skip_song", skip),
+        ("wrong_song(miss)", wrong_song_miss),
+    ]
+
+def queue_display_scenario():
+    """_update_queue_display from the GUI, driven with a fake listbox (needs customtkinter)"""
+    try:
+        from gui import TwitchBotGUI
+    except ImportError as e:
+        print(f"Skipping _update_queue_display: {e}")
+        return None
+
+    def setup(queue_size):
+        gui = types.SimpleNamespace(music_player=make_player(queue_size), queue_list=FakeListbox())
+        return gui
+
+    def op(gui, i):
+        TwitchBotGUI._update_queue_display(gui)
+
+    return ("_update_queue_display", setup, op)
+
+def bot_scenarios():
+    """Chat commands of BotInstance driven with fake contexts (needs twitchio)"""
+    try:
+        from twitch_bot import BotInstance
+    except ImportError as e:
+        print(f"Skipping BotInstance commands: {e}")
+        return []
+
+    loop = asyncio.new_event_loop()
+
+    def setup(queue_size):
+        # Экземпляр без подключения к Twitch: командам нужны только плееры и настройки каналов
+        bot = BotInstance.__new__(BotInstance)
+        bot.music_player = make_player(queue_size)
+        bot.music_players = {}
+        bot.channel_settings = {}
+        return bot
+
+    def command_op(command, make_kwargs, is_mod=False):
+        callback = command._callback
+
+        def op(bot, i):
+            ctx = FakeContext(FakeAuthor(f"viewer{i}", is_mod=is_mod))
+            loop.run_until_complete(callback(bot, ctx, **make_kwargs(i)))
+        return op
+
+    return [
+        ("!sr", setup, command_op(BotInstance.song_request, lambda i: {"query": f"chat search {i}"})),
+        ("!queue", setup, command_op(BotInstance.show_queue, lambda i: {})),
+        ("!wrongsong", setup, command_op(BotInstance.wrong_song, lambda i: {})),
+    ]
+
+def print_table(rows):
+    header = f"{'scenario':<24}{'queue':>8}{'ops':>7}{'req/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['name']:<24}{row['queue_size']:>8}{row['ops']:>7}{row['rps']:>12.1f}"
+              f"{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['p99_ms']:>10.3f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for TwitchMusicBot")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="queue sizes to benchmark")
+    parser.add_argument("--ops", type=int, default=200, help="operations per scenario")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake backend latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random latency")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    latency = FakeLatency(args.latency_ms, args.jitter_ms, args.seed)
+    install_fakes(latency)
+
+    # Логи print() из плеера не должны искажать замеры
+    real_stdout = sys.stdout
+    rows = []
+    memory = {}
+    try:
+        display = queue_display_scenario()
+        bot = bot_scenarios()
+        sys.stdout = open(os.devnull, 'w')
+        for size in args.sizes:
+            for name, op in player_scenarios():
+                rows.append(run_ops(name, size, args.ops, make_player, op))
+            if display:
+                rows.append(run_ops(display[0], size, args.ops, display[1], display[2]))
+            for name, setup, op in bot:
+                rows.append(run_ops(name, size, args.ops, setup, op))
+            memory[size] = measure_memory(size)
+    finally:
+        if sys.stdout is not real_stdout:
+            sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print_table(rows)
+    print()
+    for size, kib in memory.items():
+        print(f"memory with queue of {size}: {kib:.1f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import threading
+
+# Сколько секунд допускаем от начала загрузки трека до начала воспроизведения
+START_LATENCY_TARGET = 3.0
+MAX_BITRATE = 320
+# Вес последнего измерения в сглаженной оценке скорости
+THROUGHPUT_ALPHA = 0.3
+
+class BitratePolicy:
+    """Chooses the download bitrate from the measured download throughput.
+
+    Every finished download reports (bytes, seconds); the smoothed throughput
+    gives the expected download time of a track at each bitrate, and the
+    highest bitrate that fits start_latency_target is used. Until the first
+    measurement the best bitrate is assumed to fit. With fast_start a track
+    downloaded below the best bitrate is upgraded in the background.
+    """
+
+    def __init__(self, start_latency_target=START_LATENCY_TARGET, fast_start=False, max_bitrate=MAX_BITRATE):
+        self.start_latency_target = start_latency_target
+        self.fast_start = fast_start
+        self.max_bitrate = max_bitrate
+        self.throughput = None  # байт/с, сглаженная оценка
+        self._lock = threading.Lock()
+
+    def configure(self, start_latency_target=None, fast_start=None, max_bitrate=None):
+        """Apply settings from the "yandex_music" config section"""
+        if start_latency_target:
+            self.start_latency_target = start_latency_target
+        if fast_start is not None:
+            self.fast_start = fast_start
+        if max_bitrate:
+            self.max_bitrate = max_bitrate
+
+    def record(self, size, seconds):
+        """Account a finished download of size bytes that took seconds"""
+        if size <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            sample = size / seconds
+            if self.throughput is None:
+                self.throughput = sample
+            else:
+                self.throughput += THROUGHPUT_ALPHA * (sample - self.throughput)
+
+    def expected_seconds(self, duration, bitrate):
+        """Expected download time of a track, or None without measurements"""
+        if self.throughput is None or not duration:
+            return None
+        return duration * bitrate * 1000 / 8 / self.throughput
+
+    def plan(self, duration, bitrates):
+        """(bitrate to download now, bitrate to upgrade to later or None) from the available bitrates"""
+        allowed = sorted((b for b in bitrates if b <= self.max_bitrate), reverse=True) or sorted(bitrates)[:1]
+        if not allowed:
+            return None, None
+        best = allowed[0]
+        first = allowed[-1]
+        for bitrate in allowed:
+            expected = self.expected_seconds(duration, bitrate)
+            if expected is None or expected <= self.start_latency_target:
+                first = bitrate
+                break
+        upgrade = best if self.fast_start and first < best else None
+        return first, upgrade
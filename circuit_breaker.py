@@ -0,0 +1,95 @@
+import threading
+import time
+
+from metrics import get_metrics_registry
+
+# После стольких неудач подряд источник считается недоступным
+FAILURE_THRESHOLD = 3
+# Через столько секунд пропускаем одну пробную попытку
+RESET_TIMEOUT = 60
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name):
+    """Get shared CircuitBreaker for a playback source ("youtube", "yandex", "local")"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+class CircuitBreaker:
+    """Per-source circuit breaker for playback.
+
+    After failure_threshold consecutive failures the breaker opens and
+    allow() returns False, so the player skips that source's tracks without
+    trying them. After reset_timeout one trial track is let through
+    (half-open): success closes the breaker, failure opens it again. A trial
+    that reports neither within reset_timeout counts as a failure, so the
+    breaker can't stay half-open for good.
+    """
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_at = 0
+        self._lock = threading.Lock()
+
+        metrics = get_metrics_registry()
+        metrics.describe("playback_circuit_state", "Playback circuit breaker per source (0 closed, 1 half-open, 2 open)")
+        metrics.gauge_callback("playback_circuit_state", lambda: _STATE_VALUES[self.state], labels={"source": name})
+
+    def allow(self):
+        """True if a track from this source should be tried now"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN and now - self.trial_at >= self.reset_timeout:
+                # Пробный трек так и не сообщил о результате - считаем его неудачным
+                print(f"Playback source '{self.name}' trial track timed out")
+                self.state = OPEN
+                self.opened_at = now
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                # Одна пробная попытка; остальные ждут ее результата
+                self.state = HALF_OPEN
+                self.trial_at = now
+                return True
+            return self.state == CLOSED
+
+    def retry_in(self):
+        """Seconds until the next trial attempt (0 if tracks are allowed now)"""
+        with self._lock:
+            elapsed = time.monotonic() - (self.trial_at if self.state == HALF_OPEN else self.opened_at)
+            if self.state == CLOSED:
+                return 0
+            if self.state == HALF_OPEN:
+                # Ждем результата пробы, а если его не будет - еще полный интервал после тайм-аута
+                return max(0, self.reset_timeout - elapsed) + self.reset_timeout
+            return max(0, self.reset_timeout - elapsed)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"Playback source '{self.name}' recovered")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """Count a failed track; returns True if this failure opened the breaker"""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                print(f"Playback source '{self.name}' is failing, skipping its tracks for {self.reset_timeout}s")
+                return True
+            return False
@@ -1,9 +1,26 @@
+import atexit
 import json
 import os
+import threading
+import time
+
+# Изменения, сделанные за это время (например, перетаскивание ползунка громкости), пишутся одной записью
+SAVE_DELAY = 0.5
 
 class ConfigManager:
-    def __init__(self, config_path='config.json'):
+    def __init__(self, config_path='config.json', save_delay=SAVE_DELAY):
         self.config_path = config_path
+        self.save_delay = save_delay
+        
+        # Отложенная запись: последний снимок конфига ждет фонового потока
+        self._save_cond = threading.Condition()
+        self._write_lock = threading.Lock()  # Чтобы старый снимок не записался поверх нового
+        self._pending_data = None
+        self._save_due = 0
+        self._writer_thread = None
+        self._closed = False
+        atexit.register(self.close)
+        
         self.config = self._load_config()
         
     def _load_config(self):
@@ -30,28 +47,131 @@ class ConfigManager:
             "bot_username": "",
             "channels": [""],
             "channel": "",
+            "irc_server": "",
+            "channel_settings": {},
             "player": {
                 "volume": 50,
                 "auto_play": True,
-                "max_queue_size": 10
+                "max_queue_size": 10,
+                "max_playlist_tracks": 100,
+                "youtube_audio_only": False,
+                "check_playability": True
             },
             "yandex_music": {
                 "token": "",
-                "auto_play_from_wave": True
+                "auto_play_from_wave": True,
+                "start_latency_target": 3.0,
+                "fast_start": False,
+                "max_bitrate": 320
+            },
+            "tracing": {
+                "enabled": False,
+                "trace_file": "sr_trace.json",
+                "slow_threshold": 2.0
+            },
+            "endpoints": {},
+            "ytdlp_pool": {
+                "enabled": False,
+                "processes": 2,
+                "max_jobs_per_worker": 50,
+                "timeout": 30
+            },
+            "play_history": {
+                "enabled": True,
+                "db_path": "play_history.db",
+                "reject_duplicates": True,
+                "repeat_cooldown_minutes": 30
+            },
+            "song_index": {
+                "enabled": True,
+                "db_path": "song_index.db",
+                "max_entries": 5000,
+                "min_score": 0.7
+            },
+            "local_library": {
+                "enabled": False,
+                "directories": [],
+                "db_path": "local_library.db",
+                "workers": 4
             }
         }
         
-    def save_config(self, config=None):
-        """Save config to file."""
+    def save_config(self, config=None, immediate=False):
+        """Schedule a write of the config to file.
+        
+        Writes are coalesced over save_delay seconds and done on a background
+        thread; immediate=True writes synchronously and reports the result.
+        """
         if config is None:
             config = self.config
             
         try:
-            with open(self.config_path, 'w') as f:
-                json.dump(config, f, indent=4)
+            # Снимок делаем сразу, в потоке вызывающего
+            data = json.dumps(config, indent=4)
+        except Exception as e:
+            print(f"Error saving config: {e}")
+            return False
+        
+        with self._save_cond:
+            self._pending_data = data
+            self._save_due = time.monotonic() + self.save_delay
+            if self._writer_thread is None and not self._closed:
+                self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+                self._writer_thread.start()
+            self._save_cond.notify()
+        
+        if immediate or self._closed:
+            return self.flush()
+        return True
+    
+    def flush(self):
+        """Write a pending config change now."""
+        with self._write_lock:
+            with self._save_cond:
+                data = self._pending_data
+                self._pending_data = None
+            if data is None:
+                return True
+            return self._write_atomic(data)
+    
+    def close(self):
+        """Flush pending changes and stop the writer thread (called on shutdown)."""
+        with self._save_cond:
+            self._closed = True
+            self._save_cond.notify()
+        return self.flush()
+    
+    def _writer_loop(self):
+        """Фоновая запись: ждет, пока изменения не перестанут поступать save_delay секунд"""
+        while True:
+            with self._save_cond:
+                while self._pending_data is None and not self._closed:
+                    self._save_cond.wait()
+                if self._closed:
+                    return
+                remaining = self._save_due - time.monotonic()
+                if remaining > 0:
+                    self._save_cond.wait(remaining)
+                    continue
+            self.flush()
+    
+    def _write_atomic(self, data):
+        """Записать во временный файл и атомарно заменить config.json"""
+        tmp_path = self.config_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_path)
             return True
         except Exception as e:
             print(f"Error saving config: {e}")
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except OSError:
+                pass
             return False
     
     def get(self, key, default=None):
@@ -80,6 +200,21 @@ class ConfigManager:
         self.config[key] = value
         return True
         
+    def get_channels(self):
+        """Channels to join: "channel" first, then the "channels" list."""
+        channels = []
+        for name in [self.get('channel', '')] + list(self.get('channels', []) or []):
+            name = (name or '').strip().lstrip('#').lower()
+            if name and name not in channels:
+                channels.append(name)
+        return channels
+        
+    def get_channel_settings(self, channel):
+        """Per-channel settings: extra moderators and a fixed player server port."""
+        settings = {"moderators": [], "player_port": 0}
+        settings.update(self.config.get("channel_settings", {}).get(channel.lower(), {}))
+        return settings
+        
     def get_twitch_config(self):
         """Get Twitch configuration."""
         if "twitch" in self.config:
@@ -118,8 +253,11 @@ class ConfigManager:
     def set_player_volume(self, volume):
         """Set player volume."""
         player_config = self.get_player_config()
+        if player_config.get("volume") == volume:
+            return
         player_config["volume"] = volume
         self.set_player_config(player_config)
+        self.save_config()
         
     def get_yandex_music_config(self):
         """Get Yandex Music configuration."""
@@ -133,9 +271,33 @@ class ConfigManager:
         if "yandex_music" not in self.config:
             self.config["yandex_music"] = {}
         self.config["yandex_music"].update(yandex_config)
-        # Save changes immediately to ensure they're persisted
+        # Запись отложенная, но гарантированно выполнится при выходе
         self.save_config()
         
+    def get_tracing_config(self):
+        """Get request tracing configuration."""
+        return self.config.get("tracing", {"enabled": False, "trace_file": "sr_trace.json", "slow_threshold": 2.0})
+        
+    def get_endpoints_config(self):
+        """Get service endpoint overrides (name -> base URL)."""
+        return self.config.get("endpoints", {})
+        
+    def get_ytdlp_pool_config(self):
+        """Get yt-dlp worker process pool configuration."""
+        return self.config.get("ytdlp_pool", {"enabled": False})
+        
+    def get_play_history_config(self):
+        """Get play history and repeat-request settings."""
+        return self.config.get("play_history", {"enabled": True})
+        
+    def get_song_index_config(self):
+        """Get local song search index configuration."""
+        return self.config.get("song_index", {"enabled": True})
+        
+    def get_local_library_config(self):
+        """Get local music folder settings."""
+        return self.config.get("local_library", {"enabled": False, "directories": []})
+        
     def get_yandex_auto_wave(self):
         """Get auto play from wave setting."""
         yandex_config = self.get_yandex_music_config()
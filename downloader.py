@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+import requests
+
+from metrics import get_metrics_registry
+
+CHUNK_SIZE = 16 * 1024
+# Файлы больше этого качаются несколькими параллельными частями (если сервер поддерживает Range)
+SEGMENT_MIN_SIZE = 4 * 1024 * 1024
+SEGMENTS = 4
+# Сколько раз продолжать загрузку части после обрыва и пауза перед первой повторной попыткой
+RETRIES = 5
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 5.0
+TIMEOUT = (5, 15)  # (соединение, ожидание каждой порции данных)
+
+class DownloadError(Exception):
+    """Download failed after all retries or produced a file of the wrong size"""
+
+class _RangeIgnored(DownloadError):
+    """Server answered a Range request for a later segment with the whole file; retrying won't help"""
+
+def _content_range_total(response):
+    # "bytes 0-1023/4096" -> 4096
+    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+class _Range:
+    """Byte range of the file written by one thread; start moves forward as data arrives"""
+
+    def __init__(self, start, end):
+        self.origin = start
+        self.start = start
+        self.end = end  # включительно; None - до конца файла
+
+    @property
+    def done(self):
+        return self.end is not None and self.start > self.end
+
+def download_file(url, path, headers=None, proxies=None, segments=SEGMENTS, retries=RETRIES, timeout=TIMEOUT):
+    """Download url to path and return the file size.
+
+    Data goes to path + ".part"; after a dropped connection the download
+    resumes with an HTTP Range request from the last written byte. Large
+    files are fetched in parallel segments. The size is checked against
+    the server's before the file is atomically renamed to path.
+    """
+    metrics = get_metrics_registry()
+    metrics.describe("download_retries_total", "Downloads resumed after a dropped connection or error")
+    metrics.describe("download_segmented_total", "Downloads fetched in parallel segments")
+    partial_path = path + ".part"
+    session = requests.Session()
+    session.headers.update(headers or {})
+    if proxies:
+        session.proxies.update(proxies)
+
+    try:
+        # Первый запрос сразу с Range: по ответу 206 видно, можно ли докачивать и делить файл на части
+        response = _open_with_retries(session, url, retries, timeout)
+        ranges_supported = response.status_code == 206
+        if ranges_supported:
+            total = _content_range_total(response)
+        else:
+            length = response.headers.get("Content-Length", "")
+            total = int(length) if length.isdigit() else None
+
+        with open(partial_path, "wb") as f:
+            if total:
+                f.truncate(total)
+
+        if ranges_supported and total and total >= SEGMENT_MIN_SIZE and segments > 1:
+            size = total // segments
+            parts = [_Range(i * size, total - 1 if i == segments - 1 else (i + 1) * size - 1)
+                     for i in range(segments)]
+            metrics.inc("download_segmented_total")
+            errors = []
+            # Первая часть читается из уже открытого ответа (он обрывается на ее конце)
+            threads = [threading.Thread(target=_download_range, daemon=True,
+                                        args=(session, url, partial_path, part, response if i == 0 else None,
+                                              ranges_supported, retries, timeout, errors))
+                       for i, part in enumerate(parts)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+        else:
+            _download_range(session, url, partial_path, _Range(0, total - 1 if total else None), response,
+                            ranges_supported, retries, timeout)
+
+        written = os.path.getsize(partial_path)
+        if total is not None and written != total:
+            raise DownloadError(f"Downloaded {written} bytes of {total}")
+        if written == 0:
+            raise DownloadError("Downloaded file is empty")
+        # Под окончательным именем файл появляется только целиком
+        os.replace(partial_path, path)
+        return written
+    except Exception:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        session.close()
+
+def _retry_delay(attempt):
+    return min(RETRY_DELAY * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+
+def _open_with_retries(session, url, retries, timeout):
+    attempt = 0
+    while True:
+        try:
+            response = session.get(url, headers={"Range": "bytes=0-"}, stream=True, timeout=timeout)
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            attempt += 1
+            if attempt > retries:
+                raise DownloadError(f"Download failed after {retries} retries: {e}")
+            get_metrics_registry().inc("download_retries_total")
+            print(f"Download request failed ({e}), retry {attempt}/{retries}")
+            time.sleep(_retry_delay(attempt))
+
+def _download_range(session, url, partial_path, part, response, ranges_supported, retries, timeout, errors=None):
+    """Write part of the file, resuming after errors; response is an already opened first request"""
+    metrics = get_metrics_registry()
+    attempt = 0
+    try:
+        with open(partial_path, "r+b") as f:
+            while not part.done:
+                try:
+                    if response is None:
+                        end = "" if part.end is None else part.end
+                        response = session.get(url, headers={"Range": f"bytes={part.start}-{end}"},
+                                               stream=True, timeout=timeout)
+                        response.raise_for_status()
+                        if response.status_code != 206 and part.start:
+                            # Сервер прислал файл целиком - продолжить можно только с начала
+                            if part.origin:
+                                raise _RangeIgnored("Server ignored the Range header")
+                            part.start = 0
+                    f.seek(part.start)
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if part.end is not None:
+                            chunk = chunk[:part.end - part.start + 1]
+                        f.write(chunk)
+                        part.start += len(chunk)
+                        if part.done:
+                            break
+                    response.close()
+                    response = None
+                    if part.end is None:
+                        # Длина неизвестна - конец потока и есть конец файла
+                        f.truncate(part.start)
+                        return
+                    if not part.done:
+                        raise DownloadError(f"Connection closed at byte {part.start}")
+                except _RangeIgnored:
+                    response.close()
+                    raise
+                except (requests.RequestException, DownloadError) as e:
+                    if response is not None:
+                        response.close()
+                        response = None
+                    attempt += 1
+                    if attempt > retries:
+                        raise DownloadError(f"Download failed after {retries} retries: {e}")
+                    if not ranges_supported:
+                        # Без Range продолжить нельзя - начинаем заново
+                        part.start = 0
+                    metrics.inc("download_retries_total")
+                    print(f"Download interrupted at byte {part.start} ({e}), retry {attempt}/{retries}")
+                    time.sleep(_retry_delay(attempt))
+    except Exception as e:
+        if errors is None:
+            raise
+        errors.append(e)
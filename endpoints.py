@@ -0,0 +1,52 @@
+from urllib.parse import urlparse
+
+# Адреса внешних сервисов; "endpoints" в конфиге подменяет их (например, на mock_services.py)
+DEFAULT_ENDPOINTS = {
+    "youtube": "https://www.youtube.com",
+    "youtube_thumbnails": "https://img.youtube.com",
+    "yandex_music_api": "https://api.music.yandex.net",
+    "yandex_covers": "https://avatars.yandex.net",
+    "yandex_storage": "",  # Хост MP3 приходит от API; задается только для подмены
+}
+
+_endpoints_instance = None
+
+def get_endpoints():
+    """Get singleton instance of Endpoints"""
+    global _endpoints_instance
+    if _endpoints_instance is None:
+        _endpoints_instance = Endpoints()
+    return _endpoints_instance
+
+class Endpoints:
+    """Base URLs of YouTube and Yandex Music services with per-service overrides"""
+
+    def __init__(self, overrides=None):
+        self.overrides = {}
+        self.configure(overrides or {})
+
+    def configure(self, overrides):
+        """Apply the "endpoints" config section; empty values keep the defaults"""
+        self.overrides = {name: url.rstrip('/') for name, url in overrides.items()
+                          if name in DEFAULT_ENDPOINTS and url}
+        if self.overrides:
+            print(f"Using endpoint overrides: {self.overrides}")
+
+    def is_overridden(self, name):
+        return name in self.overrides
+
+    def base(self, name):
+        """Base URL of a service (without trailing slash)"""
+        return self.overrides.get(name) or DEFAULT_ENDPOINTS[name]
+
+    def url(self, name, path):
+        """Absolute URL of path on a service"""
+        return self.base(name) + path
+
+    def rewrite_storage_link(self, link):
+        """Перенаправить прямую ссылку на MP3 на подмененное хранилище"""
+        if not self.is_overridden("yandex_storage"):
+            return link
+        parsed = urlparse(link)
+        rest = link[len(f"{parsed.scheme}://{parsed.netloc}"):]
+        return self.base("yandex_storage") + rest
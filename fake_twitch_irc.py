@@ -0,0 +1,504 @@
+"""Local stand-in for Twitch chat (IRC over WebSocket) for load tests.
+
+Speaks enough of Twitch IRC for twitchio to connect (CAP/PASS/NICK/JOIN/PING,
+PRIVMSG with mod/broadcaster tags), replays a recorded chat log at 1x-100x
+speed and enforces Twitch-like send rate limits on the bot. Every reply of the
+bot is matched to the command that caused it and a latency report is printed.
+
+Usage:
+    python fake_twitch_irc.py --log chat.log --speed 10            # bot runs elsewhere
+    python fake_twitch_irc.py --log chat.log --speed 10 --with-bot # TwitchBot in-process
+    python fake_twitch_irc.py --synthetic 300 --speed 50 --with-bot --queue-messages 100
+
+Chat logs use the Chatterino format: "[HH:MM:SS] user: message". To point a
+running bot at the server set "irc_server": "ws://127.0.0.1:8765" in config.json.
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from aiohttp import web, WSMsgType
+
+# Лимиты Twitch: 20 сообщений за 30 секунд, для модераторов и стримера - 100
+DEFAULT_RATE_LIMIT = 20
+DEFAULT_MOD_RATE_LIMIT = 100
+DEFAULT_RATE_WINDOW = 30.0
+
+# Ответ бота, пришедший позже, уже не считается ответом на команду
+DEFAULT_REPLY_TIMEOUT = 30.0
+
+LOG_LINE_RE = re.compile(r"^\[(\d{1,2}):(\d{2}):(\d{2})(?:\.(\d+))?\]\s+([^:\s]+):\s?(.*)$")
+
+def parse_chat_log(path):
+    """Read a Chatterino-style log into [(offset_seconds, user, text)]"""
+    messages = []
+    first = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = LOG_LINE_RE.match(line.strip())
+            if not match:
+                continue
+            hours, minutes, seconds, fraction, user, text = match.groups()
+            timestamp = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+            if fraction:
+                timestamp += float("0." + fraction)
+            if first is None:
+                first = timestamp
+            offset = timestamp - first
+            if offset < 0:
+                offset += 24 * 3600  # Лог перешел через полночь
+            messages.append((offset, user.lower(), text))
+    return messages
+
+def synthetic_chat(count, interval=1.0):
+    """Generate a chat of song requests and queue checks from 50 viewers"""
+    messages = []
+    for i in range(count):
+        user = f"viewer{i % 50}"
+        if i % 10 == 9:
+            text = "!queue"
+        elif i % 25 == 24:
+            text = "!wrongsong"
+        else:
+            text = f"!sr loadtest song {i}"
+        messages.append((i * interval, user, text))
+    return messages
+
+class SendRateLimiter:
+    """Sliding-window limit on messages sent by one user"""
+
+    def __init__(self, limit, window=DEFAULT_RATE_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._sent = deque()
+
+    def allow(self, now=None):
+        now = time.monotonic() if now is None else now
+        while self._sent and now - self._sent[0] >= self.window:
+            self._sent.popleft()
+        if len(self._sent) >= self.limit:
+            return False
+        self._sent.append(now)
+        return True
+
+class LatencyReport:
+    """Collects command -> reply and queued message -> delivery latencies"""
+
+    def __init__(self, reply_timeout=DEFAULT_REPLY_TIMEOUT):
+        self.reply_timeout = reply_timeout
+        self._lock = threading.Lock()
+        self._pending = deque()      # (msg_id, command, sent_at)
+        self._pending_by_id = {}
+        self._expected_outgoing = {}  # content -> queued_at
+        self.command_latencies = {}   # command -> [seconds]
+        self.queue_latencies = []
+        self.commands_sent = 0
+        self.replies = 0
+        self.unanswered = 0
+        self.unmatched_replies = 0
+        self.rate_limited = 0
+
+    def command_sent(self, msg_id, command, sent_at):
+        with self._lock:
+            entry = (msg_id, command, sent_at)
+            self._pending.append(entry)
+            self._pending_by_id[msg_id] = entry
+            self.commands_sent += 1
+
+    def expect_outgoing(self, content, queued_at):
+        """Register a message queued through TwitchBot.send_message"""
+        with self._lock:
+            self._expected_outgoing[content] = queued_at
+
+    def message_received(self, content, received_at, parent_id=None, dropped=False):
+        """Attribute a bot message to a queued message or to a command.
+
+        Replies with a reply-parent-msg-id tag are matched exactly; plain
+        ctx.send() replies go to the oldest unanswered command (FIFO), which
+        is approximate when some commands never get an answer. Dropped
+        messages still consume their command but add no latency sample.
+        """
+        with self._lock:
+            if dropped:
+                self.rate_limited += 1
+            queued_at = self._expected_outgoing.pop(content, None)
+            if queued_at is not None:
+                if not dropped:
+                    self.queue_latencies.append(received_at - queued_at)
+                return
+
+            # Команды, оставшиеся без ответа слишком долго, больше не ждем
+            while self._pending and received_at - self._pending[0][2] > self.reply_timeout:
+                expired = self._pending.popleft()
+                if self._pending_by_id.pop(expired[0], None):
+                    self.unanswered += 1
+
+            entry = self._pending_by_id.pop(parent_id, None) if parent_id else None
+            while entry is None and self._pending:
+                candidate = self._pending.popleft()
+                entry = self._pending_by_id.pop(candidate[0], None)
+
+            if dropped:
+                return
+            if entry is None:
+                self.unmatched_replies += 1
+                return
+            self.replies += 1
+            self.command_latencies.setdefault(entry[1], []).append(received_at - entry[2])
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending_by_id) + len(self._expected_outgoing)
+
+    def render(self):
+        """Текстовый отчет: p50/p95/p99/max по каждой команде"""
+        def row(name, latencies):
+            if not latencies:
+                return f"{name:<20}{0:>8}"
+            if len(latencies) > 1:
+                quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+            else:
+                quantiles = latencies * 99
+            return (f"{name:<20}{len(latencies):>8}{quantiles[49] * 1000:>10.1f}"
+                    f"{quantiles[94] * 1000:>10.1f}{quantiles[98] * 1000:>10.1f}{max(latencies) * 1000:>10.1f}")
+
+        with self._lock:
+            header = f"{'path':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+            lines = [header, "-" * len(header)]
+            for command in sorted(self.command_latencies):
+                lines.append(row(command, self.command_latencies[command]))
+            if self.queue_latencies or self._expected_outgoing:
+                lines.append(row("_process_messages", self.queue_latencies))
+            lines.append("")
+            lines.append(f"commands sent: {self.commands_sent}, replies matched: {self.replies}, "
+                         f"unanswered: {self.unanswered + len(self._pending_by_id)}, "
+                         f"unmatched replies: {self.unmatched_replies}")
+            lines.append(f"queued messages never seen: {len(self._expected_outgoing)}, "
+                         f"dropped by rate limit: {self.rate_limited}")
+        return "\n".join(lines)
+
+class _Connection:
+    def __init__(self, ws):
+        self.ws = ws
+        self.nick = None
+        self.channels = set()
+        self.limiters = {}
+
+class FakeTwitchIRCServer:
+    """Twitch chat stand-in served over WebSocket on ws://host:port"""
+
+    def __init__(self, channel, host="127.0.0.1", port=8765, mods=(), bot_is_mod=False,
+                 rate_limit=DEFAULT_RATE_LIMIT, mod_rate_limit=DEFAULT_MOD_RATE_LIMIT,
+                 rate_window=DEFAULT_RATE_WINDOW, report=None):
+        self.channel = channel.lower().lstrip('#')
+        self.host = host
+        self.port = port
+        self.mods = {mod.lower() for mod in mods}
+        self.bot_is_mod = bot_is_mod
+        self.rate_limit = rate_limit
+        self.mod_rate_limit = mod_rate_limit
+        self.rate_window = rate_window
+        self.report = report or LatencyReport()
+
+        self._connections = set()
+        self._joined = None
+        self._runner = None
+        self._user_ids = {}
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        """Start listening; returns once the socket is bound"""
+        self._joined = asyncio.Event()
+        app = web.Application()
+        app.router.add_get("/", self._handle_ws)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        print(f"Fake Twitch IRC listening on {self.url} (#{self.channel})")
+
+    async def stop(self):
+        for connection in list(self._connections):
+            await connection.ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def wait_for_join(self, timeout=None):
+        """Дождаться, пока кто-нибудь зайдет в канал"""
+        await asyncio.wait_for(self._joined.wait(), timeout)
+
+    async def _handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        connection = _Connection(ws)
+        self._connections.add(connection)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                for line in msg.data.split("\r\n"):
+                    if line.strip():
+                        await self._handle_line(connection, line.strip())
+        finally:
+            self._connections.discard(connection)
+        return ws
+
+    async def _send(self, connection, *lines):
+        if connection.ws.closed:
+            return
+        await connection.ws.send_str("".join(line + "\r\n" for line in lines))
+
+    async def _handle_line(self, connection, line):
+        received_at = time.perf_counter()
+        tags = {}
+        if line.startswith("@"):
+            raw_tags, _, line = line.partition(" ")
+            for tag in raw_tags[1:].split(";"):
+                key, _, value = tag.partition("=")
+                tags[key] = value
+
+        command, _, params = line.partition(" ")
+        command = command.upper()
+
+        if command == "CAP":
+            caps = params.partition(":")[2]
+            await self._send(connection, f":tmi.twitch.tv CAP * ACK :{caps}")
+        elif command == "PASS":
+            pass
+        elif command == "NICK":
+            nick = params.strip().lower()
+            connection.nick = nick
+            await self._send(
+                connection,
+                f":tmi.twitch.tv 001 {nick} :Welcome, GLHF!",
+                f":tmi.twitch.tv 002 {nick} :Your host is tmi.twitch.tv",
+                f":tmi.twitch.tv 003 {nick} :This server is rather new",
+                f":tmi.twitch.tv 004 {nick} :-",
+                f":tmi.twitch.tv 375 {nick} :-",
+                f":tmi.twitch.tv 372 {nick} :You are in a maze of twisty passages, all alike.",
+                f":tmi.twitch.tv 376 {nick} :>",
+            )
+        elif command == "JOIN":
+            for channel in params.split(","):
+                await self._join(connection, channel.strip().lstrip("#").lower())
+        elif command == "PART":
+            channel = params.strip().lstrip("#").lower()
+            connection.channels.discard(channel)
+            nick = connection.nick
+            await self._send(connection, f":{nick}!{nick}@{nick}.tmi.twitch.tv PART #{channel}")
+        elif command == "PING":
+            await self._send(connection, f":tmi.twitch.tv PONG tmi.twitch.tv {params}")
+        elif command == "PRIVMSG":
+            target, _, content = params.partition(" ")
+            await self._bot_privmsg(connection, target.lstrip("#").lower(),
+                                    content[1:] if content.startswith(":") else content,
+                                    tags, received_at)
+
+    async def _join(self, connection, channel):
+        nick = connection.nick
+        connection.channels.add(channel)
+        is_mod = nick in self.mods or self.bot_is_mod
+        badges = "broadcaster/1" if nick == channel else ("moderator/1" if is_mod else "")
+        await self._send(
+            connection,
+            f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{channel}",
+            f":{nick}.tmi.twitch.tv 353 {nick} = #{channel} :{nick}",
+            f":{nick}.tmi.twitch.tv 366 {nick} #{channel} :End of /NAMES list",
+            f"@badge-info=;badges={badges};color=;display-name={nick};emote-sets=0;"
+            f"mod={int(is_mod)};subscriber=0;user-type= :tmi.twitch.tv USERSTATE #{channel}",
+            f"@emote-only=0;followers-only=-1;r9k=0;room-id=1;slow=0;subs-only=0 :tmi.twitch.tv ROOMSTATE #{channel}",
+        )
+        if channel == self.channel:
+            self._joined.set()
+
+    async def _bot_privmsg(self, connection, channel, content, tags, received_at):
+        """Сообщение от бота: проверка лимита и учет задержки"""
+        nick = connection.nick
+        privileged = nick == channel or nick in self.mods or self.bot_is_mod
+        limiter = connection.limiters.get(channel)
+        if limiter is None:
+            limiter = SendRateLimiter(self.mod_rate_limit if privileged else self.rate_limit, self.rate_window)
+            connection.limiters[channel] = limiter
+
+        if not limiter.allow():
+            # Twitch молча отбрасывает сообщение и присылает NOTICE
+            self.report.message_received(content, received_at, tags.get("reply-parent-msg-id"), dropped=True)
+            await self._send(connection, f"@msg-id=msg_ratelimit :tmi.twitch.tv NOTICE #{channel} "
+                                         f":Your message was not sent because you are sending messages too quickly.")
+            return
+
+        self.report.message_received(content, received_at, tags.get("reply-parent-msg-id"))
+
+    def _privmsg_line(self, user, text, msg_id):
+        """PRIVMSG зрителя с тегами, как их присылает Twitch"""
+        user_id = self._user_ids.setdefault(user, str(100000 + len(self._user_ids)))
+        if user == self.channel:
+            badges, mod, user_type = "broadcaster/1", 0, ""
+        elif user in self.mods:
+            badges, mod, user_type = "moderator/1", 1, "mod"
+        else:
+            badges, mod, user_type = "", 0, ""
+        tags = (f"@badge-info=;badges={badges};color=;display-name={user};emotes=;first-msg=0;flags=;"
+                f"id={msg_id};mod={mod};room-id=1;subscriber=0;tmi-sent-ts={int(time.time() * 1000)};"
+                f"turbo=0;user-id={user_id};user-type={user_type}")
+        return f"{tags} :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{self.channel} :{text}"
+
+    async def inject(self, user, text):
+        """Deliver one chat message from user to everyone in the channel"""
+        user = user.lower()
+        msg_id = str(uuid.uuid4())
+        line = self._privmsg_line(user, text, msg_id)
+        sent_at = time.perf_counter()
+        if text.startswith("!"):
+            self.report.command_sent(msg_id, text.split(maxsplit=1)[0], sent_at)
+        for connection in list(self._connections):
+            if self.channel in connection.channels:
+                await self._send(connection, line)
+
+    async def replay(self, messages, speed=1.0):
+        """Replay [(offset, user, text)] keeping the original pacing / speed"""
+        speed = max(0.01, speed)
+        started = time.monotonic()
+        for offset, user, text in messages:
+            delay = started + offset / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.inject(user, text)
+
+class _LoadTestConfig:
+    """In-memory replacement of ConfigManager for an in-process bot"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def get_channels(self):
+        return [self.values["channel"]]
+
+    def get_channel_settings(self, channel):
+        return {"moderators": [], "player_port": 0}
+
+    def set_player_volume(self, volume):
+        self.values["volume"] = volume
+
+    def save_config(self, config=None):
+        return True
+
+async def _drain(report, timeout):
+    """Ждем ответы на отправленные команды, но не дольше timeout"""
+    deadline = time.monotonic() + timeout
+    while report.pending_count() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+async def run(args):
+    if args.log:
+        messages = parse_chat_log(args.log)
+    else:
+        messages = synthetic_chat(args.synthetic)
+    if not messages:
+        print("Nothing to replay")
+        return
+
+    report = LatencyReport(args.reply_timeout)
+    server = FakeTwitchIRCServer(args.channel, args.host, args.port, mods=args.mods,
+                                 bot_is_mod=args.bot_is_mod, rate_limit=args.rate_limit,
+                                 mod_rate_limit=args.mod_rate_limit, report=report)
+    await server.start()
+
+    bot = None
+    real_stdout = sys.stdout
+    try:
+        if args.with_bot:
+            # Бот работает в своем потоке, как в приложении; музыкальные бэкенды - фейки бенчмарка
+            from benchmark import FakeLatency, install_fakes, make_player
+            from twitch_bot import TwitchBot
+
+            install_fakes(FakeLatency(args.latency_ms, 0.0))
+            config = _LoadTestConfig({
+                "access_token": "fake",
+                "bot_username": args.bot_nick,
+                "channel": args.channel,
+                "irc_server": server.url,
+            })
+            bot = TwitchBot(config, music_player=make_player(args.queue_size))
+            if args.quiet:
+                sys.stdout = open(os.devnull, 'w')
+            bot.start_bot()
+
+        print(f"Waiting for a client to join #{server.channel}...", file=real_stdout)
+        await server.wait_for_join(None if not args.with_bot else 30)
+        if bot:
+            # JOIN приходит раньше event_ready - ждем готовности бота
+            while not (bot.bot_instance and bot.bot_instance.is_ready):
+                await asyncio.sleep(0.05)
+
+        print(f"Replaying {len(messages)} messages at {args.speed}x", file=real_stdout)
+        tasks = [asyncio.ensure_future(server.replay(messages, args.speed))]
+        if bot and args.queue_messages:
+            tasks.append(asyncio.ensure_future(_queue_messages(bot, report, args.queue_messages,
+                                                               messages[-1][0] / args.speed)))
+        await asyncio.gather(*tasks)
+        await _drain(report, args.reply_timeout)
+    finally:
+        if bot:
+            bot.stop_bot()
+            if bot.bot_thread:
+                bot.bot_thread.join(5)
+        if sys.stdout is not real_stdout:
+            sys.stdout.close()
+            sys.stdout = real_stdout
+        await server.stop()
+
+    print()
+    print(report.render())
+
+async def _queue_messages(bot, report, count, duration):
+    """Равномерно кладет сообщения в исходящую очередь TwitchBot"""
+    interval = duration / count if count else 0
+    for i in range(count):
+        content = f"loadtest queued message {i}"
+        report.expect_outgoing(content, time.perf_counter())
+        bot.send_message(content)
+        await asyncio.sleep(interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Twitch chat server for load testing TwitchMusicBot")
+    parser.add_argument("--log", help="chat log to replay ([HH:MM:SS] user: message)")
+    parser.add_argument("--synthetic", type=int, default=200, help="generated messages when no --log is given")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier (1-100)")
+    parser.add_argument("--channel", default="loadtest")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mods", nargs="*", default=[], help="chatters that get moderator tags")
+    parser.add_argument("--bot-is-mod", action="store_true", help="use the moderator send limit for the bot")
+    parser.add_argument("--rate-limit", type=int, default=DEFAULT_RATE_LIMIT)
+    parser.add_argument("--mod-rate-limit", type=int, default=DEFAULT_MOD_RATE_LIMIT)
+    parser.add_argument("--reply-timeout", type=float, default=DEFAULT_REPLY_TIMEOUT)
+    parser.add_argument("--with-bot", action="store_true", help="run TwitchBot with fake music backends in-process")
+    parser.add_argument("--bot-nick", default="loadtestbot")
+    parser.add_argument("--queue-size", type=int, default=10, help="songs already queued (--with-bot)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake backend latency (--with-bot)")
+    parser.add_argument("--queue-messages", type=int, default=0,
+                        help="messages pushed through TwitchBot.send_message (--with-bot)")
+    parser.add_argument("--quiet", action="store_true", help="hide bot output while replaying")
+    args = parser.parse_args(argv)
+
+    if not 1 <= args.speed <= 100:
+        print("Warning: replay speed outside of 1x-100x")
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
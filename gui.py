@@ -2,8 +2,13 @@ import customtkinter as ctk
 import tkinter as tk
 from config import ConfigManager
 from twitch_bot import TwitchBot
-from music_player import MusicPlayer
+from music_player import MusicPlayer, get_yandex_music_api
 from youtube_player import YouTubePlayerFrame
+from tracing import get_tracer
+from endpoints import get_endpoints
+from ytdlp_pool import get_ytdlp_pool
+from local_library import get_local_library
+from youtube_audio import get_youtube_audio_cache
 import threading
 import queue
 import webbrowser
@@ -21,13 +26,69 @@ class TwitchBotGUI:
         # Initialize config manager
         self.config_manager = ConfigManager()
         
-        # Initialize music player
+        # Включаем трассировку запросов, если она настроена
+        tracing_config = self.config_manager.get_tracing_config()
+        get_tracer().configure(
+            enabled=tracing_config.get("enabled", False),
+            trace_file=tracing_config.get("trace_file"),
+            slow_threshold=tracing_config.get("slow_threshold")
+        )
+        
+        # Подмена адресов YouTube / Yandex Music (локальные mock-сервисы)
+        get_endpoints().configure(self.config_manager.get_endpoints_config())
+        
+        # yt-dlp в отдельных процессах, чтобы не тормозить интерфейс
+        ytdlp_pool_config = self.config_manager.get_ytdlp_pool_config()
+        get_ytdlp_pool().configure(
+            enabled=ytdlp_pool_config.get("enabled", False),
+            processes=ytdlp_pool_config.get("processes"),
+            max_jobs_per_worker=ytdlp_pool_config.get("max_jobs_per_worker"),
+            timeout=ytdlp_pool_config.get("timeout")
+        )
+        
+        # Битрейт загрузок Яндекса подбирается под скорость канала
+        yandex_config = self.config_manager.get_yandex_music_config()
+        get_yandex_music_api().bitrate_policy.configure(
+            start_latency_target=yandex_config.get("start_latency_target"),
+            fast_start=yandex_config.get("fast_start"),
+            max_bitrate=yandex_config.get("max_bitrate")
+        )
+        
+        # YouTube только звуком: аудио кешируется рядом с треками Яндекса
+        get_youtube_audio_cache().configure(
+            enabled=self.config_manager.get_player_config().get("youtube_audio_only", False),
+            directory=get_yandex_music_api().temp_dir
+        )
+        
+        # Локальная папка с музыкой (источник "local"), индексируется в фоне
+        library_config = self.config_manager.get_local_library_config()
+        if library_config.get("enabled", False) and library_config.get("directories"):
+            get_local_library().configure(
+                directories=library_config.get("directories"),
+                db_path=library_config.get("db_path"),
+                workers=library_config.get("workers")
+            )
+            get_local_library().scan_async()
+        
+        # Initialize music player (очередь основного канала)
         self.message_queue = queue.Queue()
+        channels = self.config_manager.get_channels()
+        self.main_channel = channels[0] if channels else ""
         self.music_player = MusicPlayer(
             message_callback=self._add_chat_message,
-            config_manager=self.config_manager  # Pass config_manager to MusicPlayer
+            config_manager=self.config_manager,  # Pass config_manager to MusicPlayer
+            channel=self.main_channel or None
         )
         
+        # Дополнительные каналы: своя очередь и свой плеер, общие Yandex-клиент, кеши и загрузчики
+        self.channel_players = {}
+        for channel in channels[1:]:
+            self.channel_players[channel] = MusicPlayer(
+                message_callback=lambda message, channel=channel: self._add_chat_message(f"[#{channel}] {message}"),
+                config_manager=self.config_manager,
+                channel=channel
+            )
+        
         # Create tabs and UI
         self._setup_gui()
         
@@ -56,6 +117,9 @@ class TwitchBotGUI:
         # Setup player tab
         self._setup_player_tab()
         
+        # Плееры дополнительных каналов
+        self._setup_channel_player_tabs()
+        
         # Setup queue tab
         self._setup_queue_tab()
         
@@ -117,7 +181,8 @@ class TwitchBotGUI:
             self.player_frame = YouTubePlayerFrame(
                 player_frame,
                 music_player=self.music_player,
-                config_manager=self.config_manager
+                config_manager=self.config_manager,
+                server_port=self._player_port(self.main_channel)
             )
             
             # Добавляем обработчик для пропуска песни
@@ -141,6 +206,39 @@ class TwitchBotGUI:
             ctk.CTkLabel(self.player_frame, text=f"Error loading player: {str(e)}").pack(pady=20)
             self.player_frame.pack(fill=tk.BOTH, expand=True)
 
+    def _player_port(self, channel):
+        """Fixed player server port of a channel (None - any free port)"""
+        if not channel:
+            return None
+        return self.config_manager.get_channel_settings(channel).get("player_port") or None
+    
+    def _setup_channel_player_tabs(self):
+        """One player tab per additional channel"""
+        self.channel_player_frames = {}
+        for channel, music_player in self.channel_players.items():
+            tab = self.tab_view.add(f"Player #{channel}")
+            try:
+                frame = YouTubePlayerFrame(
+                    tab,
+                    music_player=music_player,
+                    config_manager=self.config_manager,
+                    skip_callback=music_player.skip_song,
+                    server_port=self._player_port(channel)
+                )
+                frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+                music_player.initialize_player(player_frame=frame, update_queue_callback=lambda: None)
+                self.channel_player_frames[channel] = frame
+            except Exception as e:
+                print(f"Error creating player for #{channel}: {e}")
+                ctk.CTkLabel(tab, text=f"Error loading player: {str(e)}").pack(pady=20)
+    
+    def _music_players_by_channel(self):
+        """channel -> MusicPlayer for every joined channel"""
+        players = dict(self.channel_players)
+        if self.main_channel:
+            players[self.main_channel] = self.music_player
+        return players
+    
     def _setup_queue_tab(self):
         """Setup the song queue tab"""
         # Create a frame for the queue
@@ -467,7 +565,7 @@ class TwitchBotGUI:
         self.config_manager.set("channel", channel)
         
         # Save and notify
-        if self.config_manager.save_config():
+        if self.config_manager.save_config(immediate=True):
             self._add_chat_message("Twitch settings saved")
         else:
             self._add_chat_message("Failed to save Twitch settings")
@@ -606,10 +704,12 @@ class TwitchBotGUI:
             # Connect
             try:
                 # Pass the music player to the bot
-                self.bot = TwitchBot(self.config_manager, self._on_new_message, self.music_player)
+                self.bot = TwitchBot(self.config_manager, self._on_new_message, self.music_player,
+                                     music_players=self._music_players_by_channel())
                 if self.bot.start_bot():
                     self.connect_button.configure(text="Disconnect")
-                    self.status_label.configure(text=f"Connected to {self.config_manager.get('channel', '')}")
+                    channels = ", ".join(self.config_manager.get_channels())
+                    self.status_label.configure(text=f"Connected to {channels}")
                     self._add_chat_message("Bot connected to Twitch")
                 else:
                     self._add_chat_message("Failed to start bot")
@@ -0,0 +1,141 @@
+"""Headless daemon: Twitch bot, song queues and player servers without the Tk GUI.
+
+Usage:
+    python headless.py [--config config.json]
+
+Open the printed /player URL of each channel in a browser or an OBS browser
+source; it plays what the queue of that channel requests.
+"""
+import argparse
+import signal
+import threading
+
+from config import ConfigManager
+from endpoints import get_endpoints
+from headless_player import HeadlessPlayerFrame
+from local_library import get_local_library
+from music_player import MusicPlayer, get_yandex_music_api
+from tracing import get_tracer
+from twitch_bot import TwitchBot
+from youtube_audio import get_youtube_audio_cache
+from ytdlp_pool import get_ytdlp_pool
+
+class HeadlessApp:
+    """Wires ConfigManager, MusicPlayer, TwitchBot and the player servers together"""
+
+    def __init__(self, config_path='config.json'):
+        self.config_manager = ConfigManager(config_path)
+
+        # Те же настройки, что применяет TwitchBotGUI
+        tracing_config = self.config_manager.get_tracing_config()
+        get_tracer().configure(
+            enabled=tracing_config.get("enabled", False),
+            trace_file=tracing_config.get("trace_file"),
+            slow_threshold=tracing_config.get("slow_threshold")
+        )
+        get_endpoints().configure(self.config_manager.get_endpoints_config())
+        ytdlp_pool_config = self.config_manager.get_ytdlp_pool_config()
+        get_ytdlp_pool().configure(
+            enabled=ytdlp_pool_config.get("enabled", False),
+            processes=ytdlp_pool_config.get("processes"),
+            max_jobs_per_worker=ytdlp_pool_config.get("max_jobs_per_worker"),
+            timeout=ytdlp_pool_config.get("timeout")
+        )
+        # Битрейт загрузок Яндекса подбирается под скорость канала
+        yandex_config = self.config_manager.get_yandex_music_config()
+        get_yandex_music_api().bitrate_policy.configure(
+            start_latency_target=yandex_config.get("start_latency_target"),
+            fast_start=yandex_config.get("fast_start"),
+            max_bitrate=yandex_config.get("max_bitrate")
+        )
+        # YouTube только звуком: аудио кешируется рядом с треками Яндекса
+        get_youtube_audio_cache().configure(
+            enabled=self.config_manager.get_player_config().get("youtube_audio_only", False),
+            directory=get_yandex_music_api().temp_dir
+        )
+        # Локальная папка с музыкой (источник "local"), индексируется в фоне
+        library_config = self.config_manager.get_local_library_config()
+        if library_config.get("enabled", False) and library_config.get("directories"):
+            get_local_library().configure(
+                directories=library_config.get("directories"),
+                db_path=library_config.get("db_path"),
+                workers=library_config.get("workers")
+            )
+            get_local_library().scan_async()
+
+        self.channels = self.config_manager.get_channels()
+        self.music_players = {}
+        self.player_frames = {}
+        for channel in self.channels:
+            music_player = MusicPlayer(
+                message_callback=lambda message, channel=channel: self._log(channel, message),
+                config_manager=self.config_manager,
+                channel=channel
+            )
+            port = self.config_manager.get_channel_settings(channel).get("player_port") or None
+            player_frame = HeadlessPlayerFrame(music_player, self.config_manager, server_port=port)
+            music_player.initialize_player(player_frame=player_frame, update_queue_callback=lambda: None)
+            self.music_players[channel] = music_player
+            self.player_frames[channel] = player_frame
+
+        main_player = self.music_players[self.channels[0]] if self.channels else None
+        self.bot = TwitchBot(self.config_manager, self._on_bot_message, main_player,
+                             music_players=self.music_players)
+        self._stopped = threading.Event()
+
+    def _log(self, channel, message):
+        print(f"[#{channel}] {message}")
+
+    def _on_bot_message(self, message):
+        print(message)
+
+    def run(self):
+        """Start the bot and block until stop() or Ctrl+C"""
+        if not self.channels:
+            print("No channels configured: set \"channel\" or \"channels\" in config.json")
+            return False
+
+        for channel, player_frame in self.player_frames.items():
+            print(f"Player for #{channel}: {player_frame.player_url}")
+
+        self.bot.start_bot()
+        try:
+            while not self._stopped.is_set():
+                # Бот перезапускается, если поток завершился (например, после ошибки подключения)
+                if not self.bot.is_running:
+                    print("Bot is not running, reconnecting in 10 seconds")
+                    if self._stopped.wait(10):
+                        break
+                    self.bot.start_bot()
+                self._stopped.wait(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+        return True
+
+    def stop(self):
+        self._stopped.set()
+
+    def shutdown(self):
+        print("Shutting down")
+        self.bot.stop_bot()
+        if self.bot.bot_thread:
+            self.bot.bot_thread.join(5)
+        for player_frame in self.player_frames.values():
+            player_frame.stop()
+        get_ytdlp_pool().shutdown()
+        self.config_manager.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run TwitchMusicBot without the GUI")
+    parser.add_argument("--config", default="config.json", help="path to config.json")
+    args = parser.parse_args(argv)
+
+    app = HeadlessApp(args.config)
+    # SIGTERM (systemd, docker stop) - штатное завершение с сохранением настроек
+    signal.signal(signal.SIGTERM, lambda signum, frame: app.stop())
+    app.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import os
+import queue
+import threading
+import urllib.parse
+from player_interface import PlayerFrameInterface
+from player_server import PlayerServer, create_player_html, find_free_port
+from youtube_audio import get_youtube_audio_cache, youtube_cover_url
+
+class HeadlessPlayerFrame(PlayerFrameInterface):
+    """Player frame without Tk: the browser page at /player does the playback.
+
+    State changes coming from the player page run one by one on a dedicated
+    thread, the same way YouTubePlayerFrame runs them on the Tk main loop.
+    """
+
+    def __init__(self, music_player, config_manager=None, server_port=None, host="localhost"):
+        self.music_player = music_player
+        self.config_manager = config_manager
+        self.pending_command = {"command": "none"}
+
+        self.volume = 50
+        if self.config_manager:
+            self.volume = self.config_manager.get_player_volume()
+
+        self.current_video_id = None
+        self.current_audio_src = None
+        self.current_audio_info = None
+        self.current_title = ""
+        self.is_playing = False
+        self.safety_timer = None
+
+        # Очередь событий, выполняемых в потоке плеера
+        self._events = queue.Queue()
+        self._event_thread = threading.Thread(target=self._run_events, daemon=True)
+        self._event_thread.start()
+
+        self.server_port = server_port or find_free_port()
+        self.html_path = create_player_html(self.server_port, self.volume)
+        self.server = PlayerServer(self, self.server_port, host)
+        self.server.start()
+
+    @property
+    def player_url(self):
+        """Page to open in a browser / OBS browser source"""
+        return f"http://localhost:{self.server_port}/player"
+
+    def _run_events(self):
+        while True:
+            callback = self._events.get()
+            if callback is None:
+                return
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in headless player event: {e}")
+
+    def call_soon(self, callback):
+        self._events.put(callback)
+
+    def call_later(self, delay, callback):
+        """Run callback on the player thread after delay seconds"""
+        timer = threading.Timer(delay, self.call_soon, args=(callback,))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def get_current_title(self):
+        return self.current_title
+
+    def _cancel_safety_timer(self):
+        if self.safety_timer:
+            self.safety_timer.cancel()
+            self.safety_timer = None
+
+    def update_now_playing(self, song):
+        """Update the now playing state with the current song."""
+        try:
+            self._cancel_safety_timer()
+
+            if song is None:
+                self.current_title = ""
+                self.current_video_id = None
+                self.current_audio_src = None
+                self.current_audio_info = None
+                self.is_playing = False
+                self.pending_command = {"command": "clear"}
+                return False
+
+            self.is_playing = True
+
+            if song.source == 'local':
+                # Файл из локальной папки - сразу отдаем через /audio/
+                if not os.path.isfile(song.video_id):
+                    print(f"Local file not found: {song.video_id}")
+                    return False
+                self._on_track_downloaded(song.video_id, song)
+                return True
+
+            if song.source == 'yandex':
+                self.current_title = f"Загрузка: {song.title}"
+                self.current_video_id = None
+
+                from music_player import get_yandex_music_api
+                yandex_api = get_yandex_music_api()
+                if not yandex_api or not (yandex_api.is_authorized or yandex_api.is_authorizing):
+                    print("Yandex Music API not authorized")
+                    self.current_title = "Ошибка: API не авторизован"
+                    return False
+
+                # Скачиваем в отдельном потоке, результат обрабатываем в потоке плеера
+                threading.Thread(target=self._download_yandex_track, args=(yandex_api, song), daemon=True).start()
+                return True
+
+            video_id = getattr(song, 'video_id', None)
+            if not video_id:
+                print("Error: No video ID in song object")
+                return False
+
+            if get_youtube_audio_cache().available:
+                # Только звук: аудиодорожка играет через /audio/, видео - запасной вариант
+                self.current_title = f"Загрузка: {song.title}"
+                self.current_video_id = None
+                threading.Thread(target=self._fetch_youtube_audio, args=(song,), daemon=True).start()
+                return True
+
+            self._play_video(song)
+            return True
+
+        except Exception as e:
+            print(f"Error updating headless player: {e}")
+            return False
+
+    def _play_video(self, song):
+        """Play a YouTube song as video in the player page iframe"""
+        video_id = song.video_id
+        self.current_title = song.title
+        self.current_video_id = video_id
+        self.current_audio_src = None
+        self.current_audio_info = None
+        self.pending_command = {"command": "load", "video_id": video_id, "title": song.title}
+        self.music_player.record_track_started()
+
+        # Страховка на случай, если страница плеера не сообщит о конце видео
+        duration_secs = getattr(song, 'duration', 300)
+        self.safety_timer = self.call_later(duration_secs + 30, self._on_safety_timeout)
+
+    def _fetch_youtube_audio(self, song):
+        """Download the audio of a YouTube song in background thread"""
+        file_path = get_youtube_audio_cache().fetch(song.video_id)
+        self.call_soon(lambda: self._on_youtube_audio_ready(file_path, song))
+
+    def _on_youtube_audio_ready(self, file_path, song):
+        # Пока шла загрузка, трек могли пропустить
+        if self.music_player.current_song is not song:
+            return
+        if file_path:
+            self._on_track_downloaded(file_path, song)
+        else:
+            print(f"Audio-only playback failed, playing video: {song.title}")
+            self._play_video(song)
+
+    def _download_yandex_track(self, yandex_api, song):
+        """Download Yandex track in background thread"""
+        try:
+            file_path = yandex_api.download_track(song.track_info)
+        except Exception as e:
+            print(f"Error downloading Yandex track: {e}")
+            file_path = None
+        self.call_soon(lambda: self._on_track_downloaded(file_path, song))
+
+    def _on_track_downloaded(self, file_path, song):
+        if not file_path or not os.path.exists(file_path):
+            self.current_title = f"Ошибка загрузки: {song.title}"
+            # Плеер переходит к следующему треку и учитывает сбой источника
+            self.music_player.report_track_failed(song)
+            return
+
+        audio_info = {
+            "title": song.title,
+            "artist": " & ".join(song.track_info.get('artists', [])) if isinstance(song.track_info, dict) else "Unknown Artist",
+            "cover": youtube_cover_url(song)
+        }
+        audio_src = f"http://localhost:{self.server_port}/audio/{urllib.parse.quote(file_path)}"
+
+        self.current_title = song.title
+        self.current_audio_src = audio_src
+        self.current_audio_info = audio_info
+        self.current_video_id = None
+        self.pending_command = {"command": "load", "audio_src": audio_src, "audio_info": audio_info}
+        self.music_player.record_track_started()
+
+    def set_volume(self, volume_fraction):
+        """Set the player volume (0-1 or 0-100)."""
+        try:
+            if isinstance(volume_fraction, str):
+                volume_fraction = float(volume_fraction)
+            if volume_fraction <= 1.0 and isinstance(volume_fraction, float):
+                self.volume = int(volume_fraction * 100)
+            else:
+                self.volume = int(volume_fraction)
+            self.volume = max(0, min(100, self.volume))
+
+            self.pending_command = {"command": "volume", "value": self.volume}
+            if self.config_manager:
+                self.config_manager.set_player_volume(self.volume)
+            return True
+        except Exception as e:
+            print(f"Error setting volume: {e}")
+            return False
+
+    def _on_player_ready(self):
+        print("Player ready callback received")
+        self.pending_command = {"command": "volume", "value": self.volume}
+        # Громкость должна примениться до загрузки текущего трека
+        if self.current_video_id:
+            self.call_later(0.3, self._send_video_to_player)
+        elif self.current_audio_src:
+            self.call_later(0.3, self._send_audio_to_player)
+
+    def _send_video_to_player(self):
+        if self.current_video_id:
+            self.pending_command = {"command": "load", "video_id": self.current_video_id, "title": self.current_title}
+
+    def _send_audio_to_player(self):
+        if self.current_audio_src:
+            self.pending_command = {"command": "load", "audio_src": self.current_audio_src,
+                                    "audio_info": self.current_audio_info or {}}
+
+    def _on_media_ended(self):
+        print("Media ended, playing next song")
+        self._cancel_safety_timer()
+        self.music_player.skip_song()
+
+        # Это была последняя песня - явно очищаем плеер
+        if not self.music_player.is_playing:
+            self.current_video_id = None
+            self.current_audio_src = None
+            self.current_audio_info = None
+            self.is_playing = False
+            self.pending_command = {"command": "clear"}
+
+    def _on_player_error(self, error_code):
+        print(f"Player error: {error_code}")
+        self._cancel_safety_timer()
+        # Сразу к следующему треку: пауза перед пропуском - тишина в эфире
+        self.music_player.report_player_error(error_code)
+
+    def _on_safety_timeout(self):
+        print("Safety timeout triggered - video might be stuck")
+        self.safety_timer = None
+        self.music_player.skip_song()
+
+    def _skip_song(self):
+        self.music_player.skip_song()
+
+    def stop(self):
+        """Stop the HTTP server and the event thread"""
+        self._cancel_safety_timer()
+        try:
+            self.server.shutdown()
+        except Exception as e:
+            print(f"Error stopping HTTP server: {e}")
+        self._events.put(None)
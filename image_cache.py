@@ -0,0 +1,157 @@
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+class ImageCache:
+    """Two-tier cache for pre-scaled images (thumbnails and album art).
+
+    Memory tier: LRU of PIL images limited by a byte budget.
+    Disk tier: resized JPEG files keyed by video_id / album_id, limited by total size.
+    """
+
+    def __init__(self, memory_budget_bytes=32 * 1024 * 1024, disk_budget_bytes=200 * 1024 * 1024,
+                 cache_dir=None, jpeg_quality=85):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        self.jpeg_quality = jpeg_quality
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "twitch_music_bot_images")
+
+        self._memory = OrderedDict()  # key -> PIL.Image
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+
+        # Статистика попаданий
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # Создаем папку кеша, если её нет
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._prune_disk()
+        except Exception as e:
+            print(f"Error preparing image cache directory: {e}")
+
+    @staticmethod
+    def make_key(kind, item_id, size):
+        """Build a cache key like 'youtube_<id>_640x360'"""
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(item_id))
+        return f"{kind}_{safe_id}_{size[0]}x{size[1]}"
+
+    def _image_bytes(self, img):
+        """Примерный объем изображения в памяти"""
+        return img.size[0] * img.size[1] * len(img.getbands())
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    def get_memory(self, key):
+        """Get an image from the memory tier only (cheap, safe on the Tk thread)"""
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return img
+
+    def get(self, key):
+        """Get an image from memory or disk; None on miss"""
+        img = self.get_memory(key)
+        if img is not None:
+            return img
+
+        path = self._disk_path(key)
+        try:
+            if os.path.exists(path):
+                with Image.open(path) as disk_img:
+                    img = disk_img.convert("RGB")
+                # Обновляем mtime, чтобы очистка удаляла самые старые файлы
+                os.utime(path, None)
+                self._put_memory(key, img)
+                with self._lock:
+                    self.disk_hits += 1
+                return img
+        except Exception as e:
+            print(f"Error reading cached image {key}: {e}")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, img):
+        """Store a pre-scaled image in both tiers"""
+        self._put_memory(key, img)
+
+        try:
+            path = self._disk_path(key)
+            tmp_path = path + ".tmp"
+            img.convert("RGB").save(tmp_path, "JPEG", quality=self.jpeg_quality)
+            os.replace(tmp_path, path)
+
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 20:
+                self._prune_disk()
+        except Exception as e:
+            print(f"Error writing cached image {key}: {e}")
+
+    def _put_memory(self, key, img):
+        size = self._image_bytes(img)
+        if size > self.memory_budget_bytes:
+            return
+
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= self._image_bytes(previous)
+
+            self._memory[key] = img
+            self._memory_bytes += size
+
+            # Вытесняем самые давно использованные изображения
+            while self._memory_bytes > self.memory_budget_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= self._image_bytes(evicted)
+
+    def _prune_disk(self):
+        """Удаляет самые старые файлы, пока кеш на диске не уложится в бюджет"""
+        self._writes_since_prune = 0
+        try:
+            entries = []
+            total = 0
+            for filename in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, filename)
+                if os.path.isfile(path):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.disk_budget_bytes:
+                    break
+                os.remove(path)
+                total -= size
+        except Exception as e:
+            print(f"Error pruning image cache: {e}")
+
+    def clear_memory(self):
+        """Очистить кеш в памяти"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def stats(self):
+        """Статистика кеша"""
+        with self._lock:
+            return {
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
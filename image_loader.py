@@ -0,0 +1,142 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+from image_cache import ImageCache
+from metrics import get_metrics_registry
+
+# Фильтр масштабирования (в новых версиях Pillow он перенесен в Image.Resampling)
+try:
+    RESAMPLE_FILTER = Image.Resampling.LANCZOS
+except AttributeError:
+    RESAMPLE_FILTER = Image.LANCZOS
+
+_image_loader_instance = None
+
+def get_image_loader():
+    """Get singleton instance of AsyncImageLoader"""
+    global _image_loader_instance
+    if _image_loader_instance is None:
+        _image_loader_instance = AsyncImageLoader()
+    return _image_loader_instance
+
+class AsyncImageLoader:
+    """Loads, decodes and resizes images on a worker pool.
+
+    Each load belongs to a "slot" (for example the thumbnail of a player frame).
+    A new load in the same slot makes the previous one stale: it is cancelled if it
+    has not started yet, and its result is dropped if it has.
+    Only the final callback runs on the Tk thread (via widget.after).
+    Loads with a cache_key go through the shared two-tier ImageCache first.
+    """
+
+    def __init__(self, max_workers=2, timeout=10, cache=None):
+        self.timeout = timeout
+        self.cache = cache or ImageCache()
+        self.metrics = get_metrics_registry()
+        self.metrics.describe("image_fetch_seconds", "Thumbnail / cover download, decode and resize time")
+        self.metrics.describe("image_cache_requests_total", "Image cache lookups by tier that served them")
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-loader")
+        self._lock = threading.Lock()
+        self._slots = {}  # slot -> (generation, future)
+        self._generation = 0
+
+    def load(self, slot, url, size, widget, on_loaded, on_error=None, cache_key=None):
+        """Загрузить изображение в фоне и передать PIL.Image в on_loaded в потоке Tk"""
+        # Попадание в кеш памяти обслуживаем сразу, без пула потоков
+        cached = self.cache.get_memory(cache_key) if cache_key else None
+        if cached is not None:
+            self.metrics.inc("image_cache_requests_total", labels={"tier": "memory"})
+
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+
+            # Отменяем предыдущую загрузку в этом слоте
+            previous = self._slots.pop(slot, None)
+            if previous:
+                previous[1].cancel()
+
+            if cached is None:
+                future = self._executor.submit(self._fetch, url, size, cache_key)
+                self._slots[slot] = (generation, future)
+
+        if cached is not None:
+            on_loaded(cached)
+            return None
+
+        future.add_done_callback(
+            lambda f: self._on_done(f, slot, generation, widget, on_loaded, on_error)
+        )
+        return future
+
+    def cancel(self, slot):
+        """Отменить текущую загрузку в слоте"""
+        with self._lock:
+            previous = self._slots.pop(slot, None)
+        if previous:
+            previous[1].cancel()
+
+    def is_current(self, slot, generation):
+        """Проверить, что загрузка все еще актуальна"""
+        with self._lock:
+            current = self._slots.get(slot)
+            return current is not None and current[0] == generation
+
+    def shutdown(self):
+        """Остановить пул потоков"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch(self, url, size, cache_key=None):
+        """Скачать, декодировать и масштабировать изображение (в рабочем потоке)"""
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.metrics.inc("image_cache_requests_total", labels={"tier": "disk"})
+                return cached
+            self.metrics.inc("image_cache_requests_total", labels={"tier": "miss"})
+
+        with self.metrics.timer("image_fetch_seconds"):
+            response = requests.get(url, timeout=self.timeout)
+            response.raise_for_status()
+
+            img = Image.open(io.BytesIO(response.content))
+            img = img.convert("RGB")
+            if size and img.size != tuple(size):
+                img = img.resize(size, RESAMPLE_FILTER)
+
+        if cache_key:
+            self.cache.put(cache_key, img)
+        return img
+
+    def _on_done(self, future, slot, generation, widget, on_loaded, on_error):
+        """Передать результат в поток Tk, если загрузка не устарела"""
+        if future.cancelled() or not self.is_current(slot, generation):
+            return
+
+        error = future.exception()
+
+        def deliver():
+            # Повторная проверка уже в потоке Tk: слот мог смениться за это время
+            if not self.is_current(slot, generation):
+                return
+            with self._lock:
+                self._slots.pop(slot, None)
+            try:
+                if error is not None:
+                    print(f"Error loading image: {error}")
+                    if on_error and callable(on_error):
+                        on_error(error)
+                else:
+                    on_loaded(future.result())
+            except Exception as e:
+                print(f"Error delivering image: {e}")
+
+        try:
+            widget.after(0, deliver)
+        except Exception as e:
+            # Виджет мог быть уничтожен
+            print(f"Error scheduling image delivery: {e}")
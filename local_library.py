@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Теги и длительность читаем через mutagen, если он установлен; иначе берем из имени файла
+try:
+    import mutagen
+    HAS_MUTAGEN = True
+except ImportError:
+    HAS_MUTAGEN = False
+
+from song_index import TrigramIndex, normalize
+from sqlite_store import connect
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.ogg', '.oga', '.opus', '.m4a', '.aac', '.wav')
+# Запрос к локальной библиотеке явный, поэтому порог ниже, чем у индекса найденных песен
+MIN_SCORE = 0.5
+MIN_QUERY_TRIGRAMS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    duration REAL
+);
+"""
+
+_library_instance = None
+
+def get_local_library():
+    """Get singleton instance of LocalLibrary"""
+    global _library_instance
+    if _library_instance is None:
+        _library_instance = LocalLibrary()
+    return _library_instance
+
+def read_tags(path):
+    """(title, artist, album, duration) of an audio file; None where unknown"""
+    title = artist = album = duration = None
+    if HAS_MUTAGEN:
+        try:
+            audio = mutagen.File(path, easy=True)
+            if audio is not None:
+                title = (audio.get('title') or [None])[0]
+                artist = (audio.get('artist') or [None])[0]
+                album = (audio.get('album') or [None])[0]
+                if audio.info and getattr(audio.info, 'length', None):
+                    duration = audio.info.length
+        except Exception as e:
+            print(f"Error reading tags of {path}: {e}")
+
+    if not title:
+        # "Исполнитель - Название.mp3"
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if " - " in stem:
+            file_artist, title = [part.strip() for part in stem.split(" - ", 1)]
+            artist = artist or file_artist
+        else:
+            title = stem
+    return title, artist, album, duration
+
+class LocalLibrary:
+    """Audio files from local folders as a third request source ("local").
+
+    scan() walks the folders and reads tags in parallel, but only for new
+    or changed files (by mtime and size); the results are kept in SQLite
+    between runs. Requests are matched against an in-memory trigram index.
+    """
+
+    def __init__(self, directories=None, db_path='local_library.db', workers=4):
+        self.directories = directories or []
+        self.db_path = db_path
+        self.workers = workers
+        self._tracks = {}  # путь -> {'path', 'title', 'artist', 'album', 'duration'}
+        self._search = TrigramIndex()
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+
+    def configure(self, directories=None, db_path=None, workers=None):
+        """Apply settings from the "local_library" config section"""
+        if directories is not None:
+            self.directories = directories
+        if db_path:
+            self.db_path = db_path
+        if workers:
+            self.workers = workers
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def scan_async(self):
+        """Scan in a background thread"""
+        thread = threading.Thread(target=self.scan, daemon=True)
+        thread.start()
+        return thread
+
+    def scan(self):
+        """Update the index from the folders; returns (total, re-read, removed) file counts"""
+        with self._scan_lock:
+            started = time.perf_counter()
+            conn = connect(self.db_path)
+            try:
+                conn.executescript(SCHEMA)
+                known = {row[0]: row for row in conn.execute(
+                    "SELECT path, mtime, size, title, artist, album, duration FROM files")}
+
+                found = {}
+                changed = []
+                for directory in self.directories:
+                    for root, _, files in os.walk(directory):
+                        for name in files:
+                            if not name.lower().endswith(AUDIO_EXTENSIONS):
+                                continue
+                            path = os.path.abspath(os.path.join(root, name))
+                            try:
+                                stat = os.stat(path)
+                            except OSError:
+                                continue
+                            found[path] = (stat.st_mtime, stat.st_size)
+                            row = known.get(path)
+                            if not row or row[1] != stat.st_mtime or row[2] != stat.st_size:
+                                changed.append(path)
+
+                # Теги читаются параллельно: это в основном ожидание диска
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    tags = dict(zip(changed, executor.map(read_tags, changed)))
+
+                removed = [path for path in known if path not in found]
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO files (path, mtime, size, title, artist, album, duration) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(path, *found[path], *tags[path]) for path in changed])
+                    conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+
+                rows = [(path, *found[path], *tags[path]) if path in tags else known[path] for path in found]
+            finally:
+                conn.close()
+
+            tracks = {}
+            search = TrigramIndex()
+            for path, _, _, title, artist, album, duration in rows:
+                tracks[path] = {'path': path, 'title': title, 'artist': artist, 'album': album, 'duration': duration}
+                stem = os.path.splitext(os.path.basename(path))[0]
+                search.add(path, [normalize(f"{artist or ''} {title}"), normalize(stem)])
+            with self._lock:
+                self._tracks, self._search = tracks, search
+
+            print(f"Local library: {len(tracks)} files, {len(changed)} re-read, {len(removed)} removed "
+                  f"in {time.perf_counter() - started:.1f}s")
+            return len(tracks), len(changed), len(removed)
+
+    def search(self, query):
+        """Best matching track for query, or None"""
+        with self._lock:
+            scored = self._search.search(normalize(query), min_query_trigrams=MIN_QUERY_TRIGRAMS)
+            if not scored or scored[0][0] < MIN_SCORE:
+                return None
+            return dict(self._tracks[scored[0][1]])
@@ -1,5 +1,6 @@
 import customtkinter as ctk
 from gui import TwitchBotGUI
+from ytdlp_pool import get_ytdlp_pool
 import os
 import sys
 import subprocess
@@ -50,6 +51,10 @@ def main():
     
     # Start the application
     root.mainloop()
+    
+    # Останавливаем процессы yt-dlp и дописываем отложенные изменения настроек
+    get_ytdlp_pool().shutdown()
+    app.config_manager.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
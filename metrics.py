@@ -0,0 +1,138 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограмм задержек (в секундах)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics_registry_instance = None
+
+def get_metrics_registry():
+    """Get singleton instance of MetricsRegistry"""
+    global _metrics_registry_instance
+    if _metrics_registry_instance is None:
+        _metrics_registry_instance = MetricsRegistry()
+    return _metrics_registry_instance
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+def _format_labels(label_key, extra=None):
+    items = list(label_key)
+    if extra:
+        items.extend(extra)
+    if not items:
+        return ""
+    parts = []
+    for name, value in items:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}    # name -> {label_key: value}
+        self._gauges = {}      # name -> {label_key: value}
+        self._gauge_callbacks = {}  # name -> {label_key: callable returning a number}
+        self._histograms = {}  # name -> {label_key: [bucket_counts, sum, count]}
+        self._buckets = {}     # name -> buckets
+
+    def describe(self, name, help_text):
+        """Задать описание метрики (строка # HELP)"""
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, labels=None):
+        """Увеличить счетчик"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=None):
+        """Установить значение gauge"""
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def gauge_callback(self, name, callback, labels=None):
+        """Gauge, значение которого вычисляется при каждом чтении /metrics"""
+        with self._lock:
+            self._gauge_callbacks.setdefault(name, {})[_label_key(labels)] = callback
+
+    def observe(self, name, value, labels=None, buckets=DEFAULT_BUCKETS):
+        """Добавить наблюдение в гистограмму"""
+        key = _label_key(labels)
+        with self._lock:
+            bucket_bounds = self._buckets.setdefault(name, tuple(buckets))
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = [[0] * len(bucket_bounds), 0.0, 0]
+                series[key] = state
+            for i, bound in enumerate(bucket_bounds):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def timer(self, name, labels=None):
+        """Измерить длительность блока; labels можно дополнить внутри блока"""
+        labels = dict(labels or {})
+        start = time.perf_counter()
+        try:
+            yield labels
+        except Exception:
+            labels.setdefault("result", "error")
+            raise
+        finally:
+            labels.setdefault("result", "ok")
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def render(self):
+        """Render all metrics in Prometheus text exposition format"""
+        lines = []
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            callbacks = {name: dict(series) for name, series in self._gauge_callbacks.items()}
+            histograms = {name: {k: [list(v[0]), v[1], v[2]] for k, v in series.items()}
+                          for name, series in self._histograms.items()}
+            buckets = dict(self._buckets)
+
+        for name, series in callbacks.items():
+            for key, callback in series.items():
+                try:
+                    gauges.setdefault(name, {})[key] = callback()
+                except Exception as e:
+                    print(f"Error reading gauge {name}: {e}")
+
+        def header(name, metric_type):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for name in sorted(counters):
+            header(name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name in sorted(gauges):
+            header(name, "gauge")
+            for key, value in sorted(gauges[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for key, (bucket_counts, total, count) in sorted(histograms[name].items()):
+                for bound, bucket_count in zip(buckets[name], bucket_counts):
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,411 @@
+"""Local stand-ins for YouTube and Yandex Music HTTP services.
+
+Serves canned search results, oEmbed, thumbnails, Yandex Music API responses
+(search, tracks, download info, My Wave batches), album covers and MP3 bodies,
+with injectable latency, bandwidth throttling, errors and dropped connections
+(MP3 bodies honour Range requests, so downloads can resume). Point the bot at it
+with the "endpoints" config section printed on startup.
+
+Usage:
+    python mock_services.py [--port 8780] [--latency-ms 50] [--jitter-ms 20]
+                            [--error-rate 0.05] [--drop-rate 0.1] [--throttle-kbps 512]
+                            [--track-seconds 180]
+
+yt-dlp and pytube cannot be redirected, so with a "youtube" override the player
+resolves requests through the web search and oEmbed fallbacks. oEmbed answers
+401 for video IDs starting with "noembed" and 404 for "removed", like YouTube
+does for videos that can't be embedded or no longer exist.
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+# Префиксы путей сервисов на mock-сервере
+YOUTUBE_PREFIX = "/youtube"
+YOUTUBE_THUMBNAILS_PREFIX = "/ytimg"
+YANDEX_API_PREFIX = "/yandex-api"
+YANDEX_COVERS_PREFIX = "/yandex-avatars"
+YANDEX_STORAGE_PREFIX = "/yandex-storage"
+
+WAVE_BATCH_SIZE = 5
+SEARCH_RESULTS = 5
+PLAYLIST_LENGTH = 100  # Столько видео YouTube отдает на первой странице плейлиста
+# ID видео, для которых oEmbed отвечает как для запрещенного к встраиванию / удаленного
+NOEMBED_VIDEO_PREFIX = "noembed"
+REMOVED_VIDEO_PREFIX = "removed"
+
+# Кадр MPEG-1 Layer III, 128 кбит/с, 44.1 кГц, моно; нулевые данные - тишина
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0xC0]) + bytes(413)
+MP3_FRAMES_PER_SECOND = 44100 / 1152
+
+def _stable_int(text):
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+
+def _video_id(text):
+    """Стабильный 11-символьный ID видео для строки"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:11]
+
+@lru_cache(maxsize=256)
+def _jpeg(seed, width, height):
+    """Одноцветная JPEG-картинка, цвет зависит от seed"""
+    value = _stable_int(seed)
+    color = (value & 0xFF, (value >> 8) & 0xFF, (value >> 16) & 0xFF)
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+@lru_cache(maxsize=8)
+def _mp3(seconds):
+    return MP3_FRAME * max(1, int(seconds * MP3_FRAMES_PER_SECOND))
+
+def _yandex_track(track_id, query=None):
+    """Трек в формате ответа API Yandex Music"""
+    track_id = str(track_id)
+    title = f"Mock track {track_id}" if query is None else f"{query} (mock {track_id})"
+    album_id = 100000 + _stable_int(track_id) % 100000
+    return {
+        "id": track_id,
+        "realId": track_id,
+        "title": title,
+        "available": True,
+        "durationMs": 180000,
+        "artists": [{"id": 1, "name": "Mock Artist", "various": False, "composer": False}],
+        "albums": [{"id": album_id, "title": "Mock Album", "trackCount": 10}],
+        "coverUri": f"avatars.yandex.net/get-music-content/{album_id}/{track_id}/%%",
+    }
+
+class FaultInjector:
+    """Latency, errors and bandwidth limits applied to every response"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, throttle_kbps=0, seed=1, drop_rate=0.0):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.throttle_kbps = throttle_kbps
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def should_drop(self):
+        if not self.drop_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.drop_rate
+
+    def write_body(self, wfile, body):
+        """Отдать тело порциями с ограничением скорости; False, если соединение "оборвано" на середине"""
+        if self.should_drop():
+            wfile.write(body[:len(body) // 2])
+            return False
+        if not self.throttle_kbps:
+            wfile.write(body)
+            return True
+        chunk_size = 16 * 1024
+        bytes_per_second = self.throttle_kbps * 1024 / 8
+        for offset in range(0, len(body), chunk_size):
+            chunk = body[offset:offset + chunk_size]
+            wfile.write(chunk)
+            time.sleep(len(chunk) / bytes_per_second)
+        return True
+
+class MockServicesHandler(BaseHTTPRequestHandler):
+    """Routes requests by service prefix; self.server carries the settings"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.form = parse_qs(self.rfile.read(length).decode('utf-8')) if length else {}
+        self._dispatch()
+
+    def _dispatch(self):
+        faults = self.server.faults
+        faults.delay()
+        if faults.should_fail():
+            self._send(503, b"Service Unavailable (injected)", "text/plain")
+            return
+
+        parsed = urlparse(self.path)
+        path = parsed.path
+        self.query = parse_qs(parsed.query)
+        routes = (
+            (YOUTUBE_PREFIX, self._youtube),
+            (YOUTUBE_THUMBNAILS_PREFIX, self._youtube_thumbnail),
+            (YANDEX_API_PREFIX, self._yandex_api),
+            (YANDEX_COVERS_PREFIX, self._yandex_cover),
+            (YANDEX_STORAGE_PREFIX, self._yandex_storage),
+        )
+        try:
+            for prefix, handler in routes:
+                if path.startswith(prefix + "/"):
+                    handler(path[len(prefix):])
+                    return
+            self._send(404, b"Not Found", "text/plain")
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент закрыл соединение, не дочитав ответ (например, докачка частями)
+            self.close_connection = True
+        except Exception as e:
+            print(f"Mock handler error for {self.path}: {e}")
+            self._send(500, str(e).encode('utf-8'), "text/plain")
+
+    def _param(self, name, default=""):
+        values = self.query.get(name) or getattr(self, 'form', {}).get(name)
+        return values[0] if values else default
+
+    def _send(self, status, body, content_type, throttle=False, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if throttle:
+            if not self.server.faults.write_body(self.wfile, body):
+                self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def _send_ranged(self, body, content_type):
+        """Ответ с поддержкой Range: bytes=start-[end]"""
+        spec = self.headers.get("Range", "")
+        if not spec.startswith("bytes="):
+            self._send(200, body, content_type, throttle=True, headers={"Accept-Ranges": "bytes"})
+            return
+        start, _, end = spec[len("bytes="):].partition("-")
+        start = int(start or 0)
+        end = min(int(end), len(body) - 1) if end else len(body) - 1
+        if start >= len(body) or start > end:
+            self._send(416, b"", content_type, headers={"Content-Range": f"bytes */{len(body)}"})
+            return
+        self._send(206, body[start:end + 1], content_type, throttle=True,
+                   headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{len(body)}"})
+
+    def _send_json(self, data):
+        self._send(200, json.dumps(data, ensure_ascii=False).encode('utf-8'), "application/json; charset=utf-8")
+
+    def _own_base(self):
+        return f"http://{self.headers.get('Host') or f'127.0.0.1:{self.server.server_port}'}"
+
+    # --- YouTube ---
+
+    def _youtube(self, path):
+        if path == "/results":
+            query = self._param("search_query")
+            # Страница результатов: нас интересуют только "videoId":"..."
+            video_ids = [_video_id(f"{query} {i}") for i in range(SEARCH_RESULTS)]
+            items = ",".join(f'{{"videoRenderer":{{"videoId":"{video_id}"}}}}' for video_id in video_ids)
+            html = f"<html><body><script>var ytInitialData = {{\"contents\":[{items}]}};</script></body></html>"
+            self._send(200, html.encode('utf-8'), "text/html; charset=utf-8")
+        elif path == "/oembed":
+            video_id = parse_qs(urlparse(self._param("url")).query).get("v", [""])[0]
+            if not video_id:
+                self._send(400, b"Bad Request", "text/plain")
+                return
+            if video_id.startswith(NOEMBED_VIDEO_PREFIX):
+                self._send(401, b"Unauthorized", "text/plain")
+                return
+            if video_id.startswith(REMOVED_VIDEO_PREFIX):
+                self._send(404, b"Not Found", "text/plain")
+                return
+            self._send_json({
+                "title": f"Mock video {video_id}",
+                "author_name": "Mock Channel",
+                "type": "video",
+                "provider_name": "YouTube",
+                "thumbnail_url": f"{self._own_base()}{YOUTUBE_THUMBNAILS_PREFIX}/vi/{video_id}/hqdefault.jpg",
+                "thumbnail_width": 480,
+                "thumbnail_height": 360,
+            })
+        elif path == "/playlist":
+            # Страница плейлиста: playlistVideoRenderer с videoId, названием и длительностью
+            playlist_id = self._param("list")
+            items = ",".join(
+                f'{{"playlistVideoRenderer":{{"videoId":"{_video_id(f"{playlist_id} {i}")}",'
+                f'"title":{{"runs":[{{"text":"Mock playlist video {i}"}}]}},"lengthSeconds":"{120 + i}"}}}}'
+                for i in range(PLAYLIST_LENGTH))
+            html = f"<html><body><script>var ytInitialData = {{\"contents\":[{items}]}};</script></body></html>"
+            self._send(200, html.encode('utf-8'), "text/html; charset=utf-8")
+        elif path == "/watch":
+            video_id = self._param("v")
+            html = f"<html><head><title>Mock video {video_id} - YouTube</title></head></html>"
+            self._send(200, html.encode('utf-8'), "text/html; charset=utf-8")
+        else:
+            self._send(404, b"Not Found", "text/plain")
+
+    def _youtube_thumbnail(self, path):
+        # /vi/<id>/hqdefault.jpg
+        parts = path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "vi":
+            self._send(404, b"Not Found", "text/plain")
+            return
+        self._send(200, _jpeg(parts[1], 480, 360), "image/jpeg", throttle=True)
+
+    # --- Yandex Music ---
+
+    def _yandex_result(self, result):
+        self._send_json({"invocationInfo": {"hostname": "mock", "req-id": str(time.time()), "exec-duration-millis": 0},
+                         "result": result})
+
+    def _yandex_api(self, path):
+        path = path.rstrip("/")
+        parts = path.strip("/").split("/")
+
+        if path == "/account/status":
+            self._yandex_result({
+                "account": {"uid": 1, "login": "mock", "displayName": "Mock User", "now": "2024-01-01T00:00:00+00:00",
+                            "serviceAvailable": True},
+                "permissions": {"until": "2099-01-01T00:00:00+00:00", "values": [], "default": []},
+                "plus": {"hasPlus": True, "isTutorialCompleted": True},
+                "defaultEmail": "mock@example.com",
+            })
+        elif path == "/search":
+            query = self._param("text")
+            tracks = [_yandex_track(_stable_int(f"{query} {i}") % 10000000, query) for i in range(SEARCH_RESULTS)]
+            self._yandex_result({
+                "searchRequestId": "mock",
+                "text": query,
+                "misspellCorrected": False,
+                "nocorrect": False,
+                "tracks": {"type": "track", "total": len(tracks), "perPage": len(tracks), "order": 0,
+                           "results": tracks},
+            })
+        elif path == "/tracks":
+            # Клиент передает несколько id повторяющимся полем формы, а не через запятую
+            values = (self.query.get("track-ids") or getattr(self, 'form', {}).get("track-ids")
+                      or self.query.get("trackIds") or [])
+            track_ids = [track_id for value in values for track_id in value.split(",") if track_id]
+            self._yandex_result([_yandex_track(track_id.split(":")[0]) for track_id in track_ids])
+        elif len(parts) == 3 and parts[0] == "tracks" and parts[2] == "download-info":
+            track_id = parts[1]
+            base = f"{self._own_base()}{YANDEX_STORAGE_PREFIX}"
+            self._yandex_result([
+                {"codec": "mp3", "bitrateInKbps": bitrate, "gain": False, "preview": False, "direct": False,
+                 "downloadInfoUrl": f"{base}/download-info/{track_id}/{bitrate}.xml"}
+                for bitrate in (320, 192, 128)
+            ])
+        elif len(parts) == 4 and parts[0] == "rotor" and parts[1] == "station" and parts[3] == "tracks":
+            self._wave_batch(parts[2])
+        elif path == "/rotor/stations/list":
+            self._yandex_result([])
+        else:
+            self._send(404, b"Not Found", "text/plain")
+
+    def _wave_batch(self, station):
+        # Продолжаем последовательность после queue, как настоящая станция
+        last = self._param("queue")
+        start = (int(last) + 1) if last.isdigit() else 5000000
+        sequence = [{"type": "track", "liked": False, "track": _yandex_track(start + i)}
+                    for i in range(WAVE_BATCH_SIZE)]
+        tag = station.split(":", 1)[-1]
+        self._yandex_result({"id": {"type": "user", "tag": tag}, "sequence": sequence,
+                             "batchId": f"mock-{start}", "pumpkin": False})
+
+    def _yandex_cover(self, path):
+        # /get-music-content/<album>/<track>/400x400
+        parts = path.strip("/").split("/")
+        if len(parts) != 4 or parts[0] != "get-music-content":
+            self._send(404, b"Not Found", "text/plain")
+            return
+        width, _, height = parts[3].partition("x")
+        size = (int(width), int(height or width)) if width.isdigit() else (400, 400)
+        self._send(200, _jpeg(f"{parts[1]}/{parts[2]}", *size), "image/jpeg", throttle=True)
+
+    def _yandex_storage(self, path):
+        parts = path.strip("/").split("/")
+        if parts[0] == "download-info" and len(parts) == 3:
+            # XML, из которого клиент собирает https://<host>/get-mp3/<sign>/<ts><path>
+            track_id = parts[1]
+            xml = (f"<?xml version=\"1.0\" encoding=\"utf-8\"?><download-info><host>mock-storage</host>"
+                   f"<path>/{track_id}.mp3</path><ts>0</ts><region>-1</region><s>mock</s></download-info>")
+            self._send(200, xml.encode('utf-8'), "text/xml")
+        elif parts[0] == "get-mp3":
+            self._send_ranged(_mp3(self.server.track_seconds), "audio/mpeg")
+        else:
+            self._send(404, b"Not Found", "text/plain")
+
+class MockServicesServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, faults, track_seconds=180, verbose=False):
+        super().__init__(address, MockServicesHandler)
+        self.faults = faults
+        self.track_seconds = track_seconds
+        self.verbose = verbose
+
+    def endpoints_config(self, host="127.0.0.1"):
+        """Секция "endpoints" для config.json, указывающая на этот сервер"""
+        base = f"http://{host}:{self.server_port}"
+        return {
+            "youtube": base + YOUTUBE_PREFIX,
+            "youtube_thumbnails": base + YOUTUBE_THUMBNAILS_PREFIX,
+            "yandex_music_api": base + YANDEX_API_PREFIX,
+            "yandex_covers": base + YANDEX_COVERS_PREFIX,
+            "yandex_storage": base + YANDEX_STORAGE_PREFIX,
+        }
+
+def start_mock_services(port=0, host="127.0.0.1", **kwargs):
+    """Start the mock server in a daemon thread (port 0 - any free port)"""
+    faults = FaultInjector(**{key: kwargs.pop(key) for key in
+                              ("latency_ms", "jitter_ms", "error_rate", "drop_rate", "throttle_kbps", "seed") if key in kwargs})
+    server = MockServicesServer((host, port), faults, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock YouTube / Yandex Music services for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="fraction of image/MP3 responses cut off halfway through")
+    parser.add_argument("--throttle-kbps", type=int, default=0, help="bandwidth for images and MP3 (0 - unlimited)")
+    parser.add_argument("--track-seconds", type=int, default=180, help="length of served MP3 files")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = start_mock_services(args.port, args.host, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                 error_rate=args.error_rate, drop_rate=args.drop_rate, throttle_kbps=args.throttle_kbps, seed=args.seed,
+                                 track_seconds=args.track_seconds, verbose=args.verbose)
+    print(f"Mock services listening on http://{args.host}:{server.server_port}")
+    print("Add to config.json:")
+    print(json.dumps({"endpoints": server.endpoints_config(args.host)}, indent=4))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
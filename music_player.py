@@ -9,6 +9,8 @@ import random
 import os
 import subprocess
 import tempfile
+import threading
+from collections import Counter
 
 # Пытаемся импортировать pytube, но также настраиваем альтернативное получение данных
 try:
@@ -26,11 +28,30 @@ except ImportError:
 
 # Импортируем наш модуль для работы с Yandex Music
 from yandex_music_api import YandexMusicAPI
+from metrics import get_metrics_registry
+from tracing import get_tracer
+from endpoints import get_endpoints
+from play_history import get_play_history
+from song_index import get_song_index
+from local_library import get_local_library
+from youtube_audio import get_youtube_audio_cache
+from circuit_breaker import CLOSED, HALF_OPEN, get_circuit_breaker
+from playability import describe, error_reason, get_playability_checker, info_reason, oembed_reason
+from ytdlp_pool import SEARCH_OPTS, INFO_OPTS, get_ytdlp_pool, iter_playlist, search_entry, video_info
 
 # Добавим функцию для получения экземпляра YandexMusicAPI
 
 _yandex_music_api_instance = None
 
+# Импорт плейлиста: треки попадают в очередь пачками, а не по одному и не все в конце
+PLAYLIST_BATCH_SIZE = 25
+PLAYLIST_BATCH_INTERVAL = 0.5
+MAX_PLAYLIST_TRACKS = 100
+
+# Заявки от этого "зрителя" - автоматическое заполнение очереди, их можно выбрасывать
+WAVE_REQUESTER = "Моя Волна"
+SOURCE_NAMES = {'youtube': 'YouTube', 'yandex': 'Yandex Music', 'local': 'локальные файлы'}
+
 def get_yandex_music_api():
     """Get singleton instance of YandexMusicAPI"""
     global _yandex_music_api_instance
@@ -52,11 +73,98 @@ class SongRequest:
     def __str__(self):
         return f"{self.title} (запрошено: {self.requester})"
 
+    @property
+    def track_key(self):
+        return (self.source, self.video_id)
+
+class SongQueue(list):
+    """Song queue that counts tracks and requesters, so duplicate checks don't scan it"""
+
+    def __init__(self, songs=()):
+        super().__init__(songs)
+        self._rebuild()
+
+    def _rebuild(self):
+        self._tracks = Counter(song.track_key for song in self)
+        self._requesters = Counter(song.requester.lower() for song in self)
+        self._sources = Counter(song.source for song in self)
+
+    def _added(self, song):
+        self._tracks[song.track_key] += 1
+        self._requesters[song.requester.lower()] += 1
+        self._sources[song.source] += 1
+
+    def _removed(self, song):
+        for counter, key in ((self._tracks, song.track_key), (self._requesters, song.requester.lower()),
+                             (self._sources, song.source)):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+
+    def append(self, song):
+        super().append(song)
+        self._added(song)
+
+    def extend(self, songs):
+        for song in songs:
+            self.append(song)
+
+    def insert(self, index, song):
+        super().insert(index, song)
+        self._added(song)
+
+    def pop(self, index=-1):
+        song = super().pop(index)
+        self._removed(song)
+        return song
+
+    def remove(self, song):
+        super().remove(song)
+        self._removed(song)
+
+    def clear(self):
+        super().clear()
+        self._rebuild()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            super().__setitem__(index, value)
+            self._rebuild()
+            return
+        # Одна позиция (например, random.shuffle) - поправляем счетчики, а не пересчитываем всю очередь
+        old = self[index]
+        super().__setitem__(index, value)
+        self._removed(old)
+        self._added(value)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            super().__delitem__(index)
+            self._rebuild()
+            return
+        old = self[index]
+        super().__delitem__(index)
+        self._removed(old)
+
+    def __iadd__(self, songs):
+        self.extend(songs)
+        return self
+
+    def contains_track(self, source, track_id):
+        return (source, track_id) in self._tracks
+
+    def has_requester(self, requester):
+        return requester.lower() in self._requesters
+
+    def has_source(self, source):
+        return source in self._sources
+
 class MusicPlayer:
-    def __init__(self, message_callback=None, config_manager=None):
+    def __init__(self, message_callback=None, config_manager=None, channel=None):
         self.message_callback = message_callback
         self.config_manager = config_manager
-        self.queue = []
+        self.channel = channel  # Канал Twitch, чью очередь ведет этот плеер
+        self._queue = SongQueue()
         self.current_song = None
         self.volume = 50  # Default volume (0-100)
         self.is_playing = False
@@ -65,9 +173,32 @@ class MusicPlayer:
         self.player_initialized = False
         self.update_queue_callback = None
         
+        # Метрики для /metrics
+        self.metrics = get_metrics_registry()
+        self.metrics.describe("sr_resolve_seconds", "Song request resolution time per backend")
+        self.metrics.describe("track_transition_seconds", "Gap between the end of a track and loading the next one")
+        self.metrics.describe("music_queue_depth", "Number of songs waiting in the queue")
+        self.metrics.gauge_callback("music_queue_depth", lambda: len(self.queue),
+                                    labels={"channel": channel} if channel else None)
+        self.transition_started_at = None
+        self.current_started_at = None  # Время (unix) начала текущего трека, для оверлея
+        self._retry_timer = None  # Повторный запуск отложенных заявок
+        self.metrics.describe("playback_failures_total", "Tracks that failed to start, by source")
+        
+        # Фоновая проверка YouTube-заявок в очереди (удалено, запрещено встраивание, трансляция)
+        self.check_playability = True
+        if config_manager:
+            self.check_playability = config_manager.get_player_config().get("check_playability", True)
+        
+        # Трассировка запросов песен
+        self.tracer = get_tracer()
+        
         # Инициализация Yandex Music API
         self.yandex_music = get_yandex_music_api()
         
+        # Локальная папка с музыкой (настраивается и сканируется приложением)
+        self.local_library = get_local_library()
+        
         # Load auto_play_from_wave setting from config
         self.auto_play_from_wave = False  # Default value
         if config_manager:
@@ -77,9 +208,75 @@ class MusicPlayer:
             except Exception as e:
                 print(f"Error loading Yandex Music settings: {e}")
         
+        # История воспроизведения: отказ в повторах и дублях до поиска трека
+        self.play_history = None
+        self.reject_duplicates = True
+        self.repeat_cooldown = 0
+        if config_manager:
+            history_config = config_manager.get_play_history_config()
+            self.reject_duplicates = history_config.get("reject_duplicates", True)
+            self.repeat_cooldown = history_config.get("repeat_cooldown_minutes", 30) * 60
+            if history_config.get("enabled", True):
+                try:
+                    self.play_history = get_play_history(history_config.get("db_path", "play_history.db"))
+                except Exception as e:
+                    print(f"Error opening play history: {e}")
+        
+        # Локальный нечеткий поиск по уже найденным трекам (без сети)
+        self.song_index = None
+        if config_manager:
+            index_config = config_manager.get_song_index_config()
+            if index_config.get("enabled", True):
+                try:
+                    self.song_index = get_song_index(index_config.get("db_path", "song_index.db"),
+                                                     index_config.get("max_entries", 5000),
+                                                     index_config.get("min_score", 0.7))
+                except Exception as e:
+                    print(f"Error opening song index: {e}")
+        
         # Очистка временной папки от старых файлов при запуске
         self.yandex_music.clean_temp_directory()
+        
+        # Заранее наполняем буфер Моей Волны, чтобы пополнение очереди было локальным
+        if self.auto_play_from_wave:
+            self.yandex_music.wave_buffer.request_refill()
                 
+    @property
+    def queue(self):
+        return self._queue
+
+    @queue.setter
+    def queue(self, songs):
+        self._queue = songs if isinstance(songs, SongQueue) else SongQueue(songs)
+
+    def check_repeat(self, source, track_id):
+        """Error message if the track is already queued or was played recently, else None"""
+        if self.reject_duplicates:
+            current = self.current_song
+            if current and current.track_key == (source, track_id):
+                return "Эта песня играет прямо сейчас."
+            if self.queue.contains_track(source, track_id):
+                return "Эта песня уже в очереди."
+
+        if self.play_history and self.repeat_cooldown > 0:
+            played_at = self.play_history.last_played_at(self.channel, source, track_id)
+            if played_at is not None:
+                elapsed = time.time() - played_at
+                if elapsed < self.repeat_cooldown:
+                    return f"Эта песня уже играла {int(elapsed // 60)} мин. назад."
+        return None
+
+    def search_local(self, query, source):
+        """Confident match for query among already resolved tracks, or None"""
+        if not self.song_index:
+            return None
+        with self.metrics.timer("sr_resolve_seconds", {"backend": "local_index"}) as labels, \
+                self.tracer.span("song_index_lookup"):
+            result = self.song_index.lookup(query, source)
+            if not result:
+                labels["result"] = "empty"
+        return result
+
     def extract_youtube_id(self, url):
         """Extract YouTube video ID from a URL or search term."""
         # Check if it's a URL
@@ -100,36 +297,37 @@ class MusicPlayer:
         
     def search_youtube(self, query):
         """Search YouTube for a query and return the top result."""
+        # yt-dlp и pytube ходят на настоящий YouTube - при подмене адреса используем только веб-запросы
+        use_libraries = not get_endpoints().is_overridden("youtube")
+        
         # Первый метод: используем yt-dlp (более надежный)
-        if HAS_YT_DLP:
+        if HAS_YT_DLP and use_libraries:
             try:
-                ydl_opts = {
-                    'format': 'bestaudio',
-                    'quiet': True,
-                    'no_warnings': True,
-                    'default_search': 'ytsearch1:',
-                    'noplaylist': True,
-                    'extract_flat': True
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(f'ytsearch1:{query}', download=False)
-                    if 'entries' in info and len(info['entries']) > 0:
-                        entry = info['entries'][0]
-                        return {
-                            'id': entry['id'],
-                            'title': entry['title'],
-                            'duration': entry.get('duration', 180)  # Если длительность недоступна, используем стандартные 3 минуты
-                        }
+                pool = get_ytdlp_pool()
+                with self.metrics.timer("sr_resolve_seconds", {"backend": "yt_dlp_search"}) as labels, \
+                        self.tracer.span("yt_dlp_search", pool=pool.enabled):
+                    # С пулом извлечение идет в отдельном процессе и не держит GIL этого
+                    if pool.enabled:
+                        entry = pool.search(query)
+                    else:
+                        with yt_dlp.YoutubeDL(SEARCH_OPTS) as ydl:
+                            entry = search_entry(ydl, query)
+                    if entry:
+                        return entry
+                    labels["result"] = "empty"
             except Exception as e:
                 print(f"Error searching with yt-dlp: {e}")
                 # Fallback to pytube
                 
         # Второй метод: используем pytube
-        if HAS_PYTUBE:
+        if HAS_PYTUBE and use_libraries:
             try:
                 # Perform a search using pytube
-                search_results = Search(query).results
+                with self.metrics.timer("sr_resolve_seconds", {"backend": "pytube_search"}) as labels, \
+                        self.tracer.span("pytube_search"):
+                    search_results = Search(query).results
+                    if not search_results:
+                        labels["result"] = "empty"
                 
                 if not search_results:
                     return None
@@ -151,14 +349,18 @@ class MusicPlayer:
         try:
             # Простой поиск через URL
             query_string = urllib.parse.quote(query)
-            url = f"https://www.youtube.com/results?search_query={query_string}"
+            url = get_endpoints().url("youtube", f"/results?search_query={query_string}")
             
             # Получаем HTML страницы
-            response = requests.get(url)
-            html = response.text
-            
-            # Ищем ID видео
-            video_ids = re.findall(r'"videoId":"([^"]+)"', html)
+            with self.metrics.timer("sr_resolve_seconds", {"backend": "scrape_search"}) as labels, \
+                    self.tracer.span("scrape_search"):
+                response = requests.get(url)
+                html = response.text
+                
+                # Ищем ID видео
+                video_ids = re.findall(r'"videoId":"([^"]+)"', html)
+                if not video_ids:
+                    labels["result"] = "empty"
             
             if not video_ids:
                 return None
@@ -179,35 +381,45 @@ class MusicPlayer:
         # Construct URL if not provided
         if url is None:
             url = f"https://www.youtube.com/watch?v={video_id}"
+        use_libraries = not get_endpoints().is_overridden("youtube")
             
         # Метод 1: использовать yt-dlp (наиболее надежный)
-        if HAS_YT_DLP:
+        if HAS_YT_DLP and use_libraries:
             try:
-                ydl_opts = {
-                    'format': 'bestaudio',
-                    'quiet': True,
-                    'no_warnings': True
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
+                pool = get_ytdlp_pool()
+                with self.metrics.timer("sr_resolve_seconds", {"backend": "yt_dlp_info"}), \
+                        self.tracer.span("yt_dlp_info", pool=pool.enabled):
+                    if pool.enabled:
+                        info = pool.video_info(url)
+                    else:
+                        with yt_dlp.YoutubeDL(INFO_OPTS) as ydl:
+                            info = video_info(ydl, url)
                     return {
                         'id': video_id,
-                        'title': info.get('title', f"YouTube Video {video_id}"),
-                        'duration': info.get('duration', 180)  # Если длительность не найдена, 3 минуты
+                        'title': info.get('title') or f"YouTube Video {video_id}",
+                        'duration': info.get('duration') or 180,  # Если длительность не найдена, 3 минуты
+                        'unplayable': info_reason(info)
                     }
             except Exception as e:
+                reason = error_reason(e)
+                if reason:
+                    # Видео удалено, закрыто или заблокировано - запасные способы не помогут
+                    return {'id': video_id, 'title': f"YouTube Video {video_id}", 'duration': 180,
+                            'unplayable': reason}
                 print(f"Error getting video info with yt-dlp: {e}")
                 # Continue to fallbacks
                 
         # Метод 2: использовать pytube
-        if HAS_PYTUBE:
+        if HAS_PYTUBE and use_libraries:
             try:
-                yt = YouTube(url)
+                with self.metrics.timer("sr_resolve_seconds", {"backend": "pytube_info"}), \
+                        self.tracer.span("pytube_info"):
+                    yt = YouTube(url)
+                    title, length = yt.title, yt.length
                 return {
                     'id': video_id,
-                    'title': yt.title,
-                    'duration': yt.length
+                    'title': title,
+                    'duration': length
                 }
                 
             except Exception as e:
@@ -217,8 +429,19 @@ class MusicPlayer:
         # Метод 3: получить информацию через API без ключа
         try:
             # Запрашиваем JSON с базовыми метаданными с YouTube
-            oembed_url = f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json"
-            response = requests.get(oembed_url)
+            oembed_url = get_endpoints().url(
+                "youtube", f"/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json")
+            with self.metrics.timer("sr_resolve_seconds", {"backend": "oembed"}) as labels, \
+                    self.tracer.span("oembed"):
+                response = requests.get(oembed_url)
+                if response.status_code != 200:
+                    labels["result"] = f"http_{response.status_code}"
+            
+            # 401 - автор запретил встраивание, 404 - видео нет
+            reason = oembed_reason(response.status_code)
+            if reason:
+                return {'id': video_id, 'title': f"YouTube Video {video_id}", 'duration': 180,
+                        'unplayable': reason}
             
             if response.status_code == 200:
                 data = response.json()
@@ -228,7 +451,8 @@ class MusicPlayer:
                 return {
                     'id': video_id,
                     'title': title,
-                    'duration': 180  # По умолчанию 3 минуты
+                    'duration': 180,  # По умолчанию 3 минуты
+                    'unplayable': None
                 }
         except Exception as e:
             print(f"Error getting video info via oEmbed: {e}")
@@ -240,14 +464,118 @@ class MusicPlayer:
             'duration': 180  # По умолчанию 3 минуты
         }
     
+    def extract_playlist_id(self, url):
+        """YouTube playlist ID from a URL with list=, or None"""
+        if not re.search(r'(youtube|youtu|youtube-nocookie)\.(com|be)/', url):
+            return None
+        match = re.search(r'[?&]list=([A-Za-z0-9_-]+)', url)
+        return match.group(1) if match else None
+
+    def _iter_playlist(self, playlist_id, limit):
+        """Yield {'id', 'title', 'duration'} of playlist entries as they are extracted"""
+        url = f"https://www.youtube.com/playlist?list={playlist_id}"
+        if HAS_YT_DLP and not get_endpoints().is_overridden("youtube"):
+            try:
+                yielded = False
+                for entry in iter_playlist(url, limit):
+                    yielded = True
+                    yield entry
+                return
+            except Exception as e:
+                print(f"Error reading playlist with yt-dlp: {e}")
+                if yielded:
+                    return
+
+        # Запасной вариант: первая страница плейлиста (до 100 видео) из HTML
+        response = requests.get(get_endpoints().url("youtube", f"/playlist?list={playlist_id}"))
+        html = response.text
+        starts = [m.start() for m in re.finditer(r'"playlistVideoRenderer":\{"videoId":"', html)] + [len(html)]
+        for start, end in zip(starts[:limit], starts[1:limit + 1]):
+            chunk = html[start:end]
+            video_id = re.search(r'"videoId":"([^"]+)"', chunk).group(1)
+            title = re.search(r'"title":\{"runs":\[\{"text":"((?:[^"\\]|\\.)*)"', chunk)
+            length = re.search(r'"lengthSeconds":"(\d+)"', chunk)
+            yield {
+                'id': video_id,
+                'title': json.loads(f'"{title.group(1)}"') if title else f"YouTube Video {video_id}",
+                'duration': int(length.group(1)) if length else 180
+            }
+
+    def import_playlist(self, url, requester, limit=None):
+        """Start adding a YouTube playlist to the queue in the background (for mods)."""
+        playlist_id = self.extract_playlist_id(url)
+        if not playlist_id:
+            return False, "Это не ссылка на плейлист YouTube."
+        
+        max_tracks = MAX_PLAYLIST_TRACKS
+        if self.config_manager:
+            max_tracks = self.config_manager.get_player_config().get("max_playlist_tracks", MAX_PLAYLIST_TRACKS)
+        limit = min(limit or max_tracks, max_tracks)
+        
+        threading.Thread(target=self._import_playlist, args=(playlist_id, requester, limit), daemon=True).start()
+        return True, f"Добавляю плейлист (до {limit} треков)..."
+
+    def _import_playlist(self, playlist_id, requester, limit):
+        """Add playlist entries as they arrive, in batches (one queue update per batch)"""
+        with self.tracer.trace("import_playlist", requester=requester, limit=limit):
+            self._remove_yandex_tracks_from_queue(preserve_current=True)
+            
+            added = skipped = 0
+            batch = []
+            last_flush = time.monotonic()
+            seen = set()
+            try:
+                for entry in self._iter_playlist(playlist_id, limit):
+                    key = ('youtube', entry['id'])
+                    current = self.current_song
+                    # Повторы внутри плейлиста и то, что уже в очереди или играет, пропускаем
+                    if key in seen or self.queue.contains_track(*key) or (current and current.track_key == key):
+                        skipped += 1
+                        continue
+                    seen.add(key)
+                    batch.append(SongRequest(entry['id'], entry['title'], requester, entry['duration'], source="youtube"))
+                    
+                    # Первый трек сразу (чтобы началось воспроизведение), дальше пачками
+                    if added == 0 or len(batch) >= PLAYLIST_BATCH_SIZE or \
+                            time.monotonic() - last_flush >= PLAYLIST_BATCH_INTERVAL:
+                        added += self._flush_playlist_batch(batch)
+                        batch = []
+                        last_flush = time.monotonic()
+            except Exception as e:
+                print(f"Error importing playlist {playlist_id}: {e}")
+            
+            added += self._flush_playlist_batch(batch)
+            message = f"Из плейлиста добавлено треков: {added}"
+            if skipped:
+                message += f" (пропущено повторов: {skipped})"
+            print(message)
+            if self.message_callback:
+                self.message_callback(message)
+            return added
+
+    def _flush_playlist_batch(self, batch):
+        if not batch:
+            return 0
+        self.queue.extend(batch)
+        for song in batch:
+            self._check_playability(song)
+        if self.update_queue_callback:
+            self.update_queue_callback()
+        if not self.is_playing and self.player_initialized:
+            self._play_next()
+        return len(batch)
+
     def search_yandex_music(self, query):
         """Поиск трека в Yandex Music."""
-        if not self.yandex_music.is_authorized:
+        if not self.yandex_music.wait_until_ready():
             return None, "Необходима авторизация в Yandex Music"
         
         try:
             # Поиск треков по запросу
-            tracks = self.yandex_music.search_track(query)
+            with self.metrics.timer("sr_resolve_seconds", {"backend": "yandex_search"}) as labels:
+                tracks = self.yandex_music.search_track(query)
+                if not tracks:
+                    labels["result"] = "empty"
             if not tracks or len(tracks) == 0:
                 return None, "Треки не найдены"
             
@@ -279,6 +607,12 @@ class MusicPlayer:
             
     def add_to_queue(self, url_or_search, requester, source=None):
         """Add a song to the queue from a URL or search term."""
+        # Внутри трассы чата это вложенный спан, иначе (GUI) - отдельная трасса
+        with self.tracer.trace("add_to_queue", requester=requester, source=source or "auto"):
+            return self._add_to_queue(url_or_search, requester, source)
+
+    def _add_to_queue(self, url_or_search, requester, source=None):
+        """Resolve a URL or search term and add the song to the queue."""
         try:
             # Определяем источник, если не указан явно
             if source is None:
@@ -289,21 +623,45 @@ class MusicPlayer:
                 elif url_or_search.startswith('ym:'):
                     source = 'yandex'
                     url_or_search = url_or_search[3:].strip()  # Убираем префикс
+                # Или трек из локальной папки ('local:')
+                elif url_or_search.startswith('local:'):
+                    source = 'local'
+                    url_or_search = url_or_search[6:].strip()
                 else:
                     source = 'youtube'  # По умолчанию YouTube
             
+            # Ссылку на плейлист без конкретного видео добавляют модераторы через !playlist
+            if source == 'youtube' and self.extract_playlist_id(url_or_search) \
+                    and not self.extract_youtube_id(url_or_search):
+                return False, "Плейлисты добавляют модераторы командой !playlist <ссылка>."
+            
             # Если это YouTube запрос, удаляем все последующие треки Yandex Music из очереди
             if source == 'youtube':
                 self._remove_yandex_tracks_from_queue(preserve_current=True)
 
             # Обрабатываем запрос в зависимости от источника
             if source == 'yandex':
-                # Проверяем авторизацию
-                if not self.yandex_music.is_authorized:
+                # Проверяем авторизацию (ждем, если она еще идет в фоне)
+                if not self.yandex_music.wait_until_ready():
                     return False, "Для использования Yandex Music необходимо авторизоваться. Используйте настройки."
                 
-                # Ищем трек в Yandex Music
-                track_info, error = self.search_yandex_music(url_or_search)
+                is_url = 'music.yandex' in url_or_search
+                local_match = None if is_url else self.search_local(url_or_search, 'yandex')
+                if local_match and local_match['track_info']:
+                    track_info = local_match['track_info']
+                else:
+                    # Ищем трек в Yandex Music
+                    with self.tracer.span("search_yandex_music"):
+                        track_info, error = self.search_yandex_music(url_or_search)
+                    if error:
+                        return False, error
+                    if self.song_index:
+                        self.song_index.add('yandex', f"{track_info['album_id']}:{track_info['id']}",
+                                            track_info['title'], track_info['duration'],
+                                            artist=track_info.get('artists', ""), track_info=track_info,
+                                            query=None if is_url else url_or_search)
+                
+                error = self.check_repeat('yandex', f"{track_info['album_id']}:{track_info['id']}")
                 if error:
                     return False, error
                 
@@ -320,25 +678,81 @@ class MusicPlayer:
                 # Добавляем в очередь
                 return self.add_song(song)
                 
+            elif source == 'local':
+                if not len(self.local_library):
+                    return False, "Локальная библиотека пуста или не настроена."
+                
+                with self.metrics.timer("sr_resolve_seconds", {"backend": "local_library"}) as labels, \
+                        self.tracer.span("local_library_search"):
+                    track = self.local_library.search(url_or_search)
+                    if not track:
+                        labels["result"] = "empty"
+                if not track:
+                    return False, "В локальной библиотеке ничего не найдено."
+                
+                error = self.check_repeat('local', track['path'])
+                if error:
+                    return False, error
+                
+                title = f"{track['artist']} - {track['title']}" if track['artist'] else track['title']
+                track['artists'] = [track['artist']] if track['artist'] else []
+                song = SongRequest(track['path'], title, requester, track['duration'] or 180,
+                                   source='local', track_info=track)
+                return self.add_song(song)
+                
             else:
                 # Стандартный поиск YouTube
-                video_id = self.extract_youtube_id(url_or_search)
+                with self.tracer.span("extract_youtube_id"):
+                    video_id = self.extract_youtube_id(url_or_search)
                 
                 # If not a URL, search for it
                 if not video_id:
-                    search_result = self.search_youtube(url_or_search)
+                    search_result = self.search_local(url_or_search, 'youtube')
                     if not search_result:
-                        return False, "Не найдено результатов по вашему запросу."
+                        with self.tracer.span("search_youtube"):
+                            search_result = self.search_youtube(url_or_search)
+                        if not search_result:
+                            return False, "Не найдено результатов по вашему запросу."
+                        if self.song_index:
+                            self.song_index.add('youtube', search_result['id'], search_result['title'],
+                                                search_result['duration'], query=url_or_search)
                     
                     video_id = search_result['id']
                     title = search_result['title']
                     duration = search_result['duration']
+                    
+                    error = self.check_repeat('youtube', video_id)
+                    if error:
+                        return False, error
+                    
+                    reason = self._unplayable_reason(video_id, search_result)
+                    if reason:
+                        return False, f"Не добавлено: {title} - {describe(reason)}."
                 else:
+                    # Для ссылки проверяем повтор до запроса метаданных
+                    error = self.check_repeat('youtube', video_id)
+                    if error:
+                        return False, error
+                    
                     # Use minimal info for direct URLs
-                    video_info = self._get_minimal_video_info(video_id, url_or_search)
+                    # Видео, о котором уже известно, что оно не сыграет, не запрашиваем заново
+                    reason = self._unplayable_reason(video_id)
+                    if reason:
+                        return False, f"Не добавлено: {describe(reason)}."
+                    
+                    with self.tracer.span("get_minimal_video_info"):
+                        video_info = self._get_minimal_video_info(video_id, url_or_search)
                     title = video_info['title']
                     duration = video_info['duration']
                     
+                    reason = self._unplayable_reason(video_id, video_info)
+                    if reason:
+                        return False, f"Не добавлено: {describe(reason)}."
+                    
+                    # Заглушку вместо названия (все способы не сработали) не индексируем
+                    if self.song_index and title != f"YouTube Video {video_id}":
+                        self.song_index.add('youtube', video_id, title, duration)
+                    
                 # Create song request and add to queue
                 song = SongRequest(video_id, title, requester, duration, source="youtube")
                 return self.add_song(song)
@@ -351,7 +765,8 @@ class MusicPlayer:
     def _remove_yandex_tracks_from_queue(self, preserve_current=True):
         """Удаляет все треки Yandex Music из очереди"""
         # Удаляем из очереди все треки Yandex Music (но не текущий трек)
-        self.queue = [song for song in self.queue if song.source != 'yandex']
+        if self.queue.has_source('yandex'):
+            self.queue = [song for song in self.queue if song.source != 'yandex']
         
         # Уведомляем о изменении очереди
         if self.message_callback:
@@ -385,9 +800,19 @@ class MusicPlayer:
         tracks_to_add = max_tracks - len(self.queue)
         
         try:
-            # Добавляем треки из Моей Волны
-            success, message = self.add_yandex_wave_tracks(tracks_to_add)
-            return success
+            # Берем треки из локального буфера Моей Волны, без запроса к API
+            wave_buffer = self.yandex_music.wave_buffer
+            wave_tracks = wave_buffer.take(tracks_to_add)
+            
+            if not wave_tracks:
+                # Буфер пуст - пополняем его в фоне и повторяем, когда треки появятся
+                wave_buffer.request_refill(
+                    on_refilled=lambda: self.ensure_queue_has_tracks(min_tracks, max_tracks)
+                )
+                return False
+            
+            self._add_wave_tracks_to_queue(wave_tracks)
+            return True
         except Exception as e:
             print(f"Error ensuring queue has tracks: {e}")
             return False
@@ -395,7 +820,7 @@ class MusicPlayer:
     def add_yandex_wave_tracks(self, count=25):  # По умолчанию добавляем 5 треков
         """Добавляет треки из Моей Волны в очередь."""
         try:
-            if not self.yandex_music.is_authorized:
+            if not self.yandex_music.wait_until_ready():
                 return False, "Для использования Моей Волны необходимо авторизоваться в Yandex Music"
                 
             # Получаем треки из Моей Волны
@@ -404,21 +829,7 @@ class MusicPlayer:
             if not wave_tracks or len(wave_tracks) == 0:
                 return False, "Не удалось получить треки из Моей Волны"
                 
-            tracks_added = 0
-            for track in wave_tracks:
-                # Создаем запрос на песню
-                song = SongRequest(
-                    video_id=f"{track['album_id']}:{track['id']}",
-                    title=f"{' & '.join(track['artists'])} - {track['title']}",
-                    requester="Моя Волна",
-                    duration=track['duration'],
-                    source='yandex',
-                    track_info=track
-                )
-                
-                # Добавляем в очередь
-                self.add_song(song)
-                tracks_added += 1
+            tracks_added = self._add_wave_tracks_to_queue(wave_tracks)
                 
             # Меняем сообщение в зависимости от количества добавленных треков
             if tracks_added == 1:
@@ -430,6 +841,25 @@ class MusicPlayer:
             print(f"Error adding wave tracks: {e}")
             return False, f"Ошибка при добавлении треков из Моей Волны: {str(e)}"
 
+    def _add_wave_tracks_to_queue(self, wave_tracks):
+        """Добавляет уже полученные треки Моей Волны в очередь"""
+        tracks_added = 0
+        for track in wave_tracks:
+            # Создаем запрос на песню
+            song = SongRequest(
+                video_id=f"{track['album_id']}:{track['id']}",
+                title=f"{' & '.join(track['artists'])} - {track['title']}",
+                requester=WAVE_REQUESTER,
+                duration=track['duration'],
+                source='yandex',
+                track_info=track
+            )
+            
+            # Добавляем в очередь
+            self.add_song(song)
+            tracks_added += 1
+        return tracks_added
+
     def initialize_player(self, player_frame=None, update_queue_callback=None):
         """Initialize the player interface."""
         print(f"Initializing player with frame: {player_frame}, callback: {update_queue_callback}")
@@ -477,16 +907,21 @@ class MusicPlayer:
         """Skip to the next song in the queue."""
         # Stop the current song
         if self.current_song:
+            # Отсчет паузы между треками (закрывается в record_track_started)
+            self.transition_started_at = time.perf_counter()
+            
             old_song = self.current_song.title
             
             # Если в очереди больше нет песен или мало песен, проверяем возможность добавления из Моей Волны
-            if len(self.queue) < 3 and self.auto_play_from_wave and self.yandex_music.is_authorized:
+            if len(self.queue) < 3 and self.auto_play_from_wave and self.yandex_music.is_authorized \
+                    and not get_circuit_breaker('yandex').retry_in():
                 # Пополняем очередь, только если нет YouTube реквестов
                 if not any(song.source == 'youtube' for song in self.queue):
                     self.ensure_queue_has_tracks(min_tracks=25, max_tracks=25)
             
             # Если в очереди больше нет песен, просто остановим текущую
             if not self.queue:
+                self._abandon_unstarted_trial()
                 self.current_song = None
                 self.is_playing = False
                 
@@ -571,54 +1006,232 @@ class MusicPlayer:
                 print(f"Error saving auto_wave setting: {e}")
         
         if self.auto_play_from_wave:
+            self.yandex_music.wave_buffer.request_refill()
             return True, "Автоматическое добавление треков из Моей Волны включено"
         else:
             return True, "Автоматическое добавление треков из Моей Волны выключено"
             
-    def _play_next(self):
-        """Play the next song in the queue."""
+    def _play_next(self, failed=None):
+        """Play the next playable song in the queue.
+        
+        Songs that fail to start are passed over in a loop (not recursively).
+        Songs of a source whose circuit breaker is open are not tried at all:
+        My Wave filler is dropped, requests stay at the head of the queue.
+        All failures of one call are reported in a single chat message.
+        """
         try:
-            if not self.queue:
-                print("Queue is empty, nothing to play")
-                self.current_song = None
-                self.is_playing = False
+            failed = failed or Counter()  # источник -> треков, не запустившихся
+            skipped = Counter()           # источник -> треков Моей Волны, выброшенных без попытки
+            deferred = []                 # заявки, отложенные до восстановления источника
+            started = False
+            player_frame = getattr(self, 'player_frame', None)
+            self._abandon_unstarted_trial()
+            
+            while self.queue:
+                song = self.queue.pop(0)
+                # До allow(): заявка, которую не будем запускать, не должна занимать пробную попытку источника
+                if song.source == 'youtube' and self._unplayable_reason(song.video_id):
+                    # Проверка успела найти проблему, но заявку еще не убрали из очереди
+                    skipped[song.source] += 1
+                    continue
+                breaker = get_circuit_breaker(song.source)
+                if not breaker.allow():
+                    if song.requester == WAVE_REQUESTER:
+                        skipped[song.source] += 1
+                    else:
+                        deferred.append(song)
+                    continue
                 
-                # Update player if available
-                if hasattr(self, 'player_frame') and self.player_frame:
-                    try:
-                        self.player_frame.update_now_playing(None)
-                    except Exception as e:
-                        print(f"Error updating player frame: {e}")
+                self.current_song = song
+                self.current_started_at = None
+                print(f"Now playing: '{song.title}' (Source: {song.source})")
+                self.is_playing = True
                 
-                return False
-                
-            # Get the next song
-            self.current_song = self.queue.pop(0)
-            print(f"Now playing: '{self.current_song.title}' (Source: {self.current_song.source})")
-            self.is_playing = True
-            
-            # Update player if available
-            if hasattr(self, 'player_frame') and self.player_frame:
+                if not player_frame:
+                    started = True
+                    break
                 try:
-                    success = self.player_frame.update_now_playing(self.current_song)
+                    success = player_frame.update_now_playing(song)
                     print(f"Player update result: {success}")
-                    if not success:
-                        print("Player failed to update, trying next song")
-                        return self._play_next()
                 except Exception as e:
                     print(f"Error updating player frame: {e}")
-                    # Try next song in case of error
-                    return self._play_next()
+                    success = False
+                if success:
+                    started = True
+                    break
+                
+                print("Player failed to update, trying next song")
+                self.metrics.inc("playback_failures_total", labels={"source": song.source})
+                failed[song.source] += 1
+                breaker.record_failure()
+            
+            # Отложенные заявки возвращаются в начало очереди в прежнем порядке
+            if deferred:
+                self.queue[0:0] = deferred
+            
+            if not started:
+                print("Queue is empty or nothing in it is playable now")
+                self.current_song = None
+                self.is_playing = False
+                if player_frame:
+                    try:
+                        player_frame.update_now_playing(None)
+                    except Exception as e:
+                        print(f"Error updating player frame: {e}")
+                if deferred:
+                    self._schedule_deferred_retry(deferred)
+            else:
+                self._prefetch_next()
+            
+            self._report_playback_failures(failed, skipped, deferred)
             
             # Update queue display if callback is set
-            if self.update_queue_callback:
+            if self.update_queue_callback and (started or failed or skipped or deferred):
                 self.update_queue_callback()
                 
-            return True
+            return started
         except Exception as e:
             print(f"Error in _play_next: {e}")
             return False
 
+    def _report_playback_failures(self, failed, skipped, deferred):
+        """Одно сообщение в чат обо всех треках, которые не удалось запустить"""
+        deferred_counts = Counter(song.source for song in deferred)
+        parts = []
+        for source in sorted(set(failed) | set(skipped) | set(deferred_counts)):
+            details = []
+            if failed[source]:
+                details.append(f"не запустилось {failed[source]}")
+            if skipped[source]:
+                details.append(f"пропущено {skipped[source]}")
+            if deferred_counts[source]:
+                details.append(f"отложено {deferred_counts[source]}")
+            if get_circuit_breaker(source).state != CLOSED:
+                details.append("источник временно отключен")
+            parts.append(f"{SOURCE_NAMES.get(source, source)}: {', '.join(details)}")
+        if parts and self.message_callback:
+            self.message_callback("Ошибка воспроизведения - " + "; ".join(parts))
+
+    def _schedule_deferred_retry(self, deferred):
+        """Повторить запуск, когда источник отложенных заявок можно будет проверить снова"""
+        delay = min(get_circuit_breaker(song.source).retry_in() for song in deferred)
+        if self._retry_timer:
+            self._retry_timer.cancel()
+        self._retry_timer = threading.Timer(delay + 0.1, self._retry_deferred)
+        self._retry_timer.daemon = True
+        self._retry_timer.start()
+
+    def _retry_deferred(self):
+        self._retry_timer = None
+        if self.is_playing or not self.queue:
+            return
+        # Состояние плеера меняем в его потоке (Tk / поток headless-плеера)
+        player_frame = getattr(self, 'player_frame', None)
+        if player_frame:
+            player_frame.call_soon(self._play_next)
+        else:
+            self._play_next()
+
+    def _abandon_unstarted_trial(self):
+        """Текущий трек меняется, так и не начав играть: если это была проба источника, она не удалась"""
+        song = self.current_song
+        if song and self.current_started_at is None:
+            breaker = get_circuit_breaker(song.source)
+            if breaker.state == HALF_OPEN:
+                breaker.record_failure()
+
+    def report_track_failed(self, song):
+        """Called by the player frame when a song it accepted could not be started (e.g. download failed)"""
+        if song is not self.current_song:
+            return
+        self.metrics.inc("playback_failures_total", labels={"source": song.source})
+        get_circuit_breaker(song.source).record_failure()
+        self._play_next(failed=Counter({song.source: 1}))
+
+    def _prefetch_next(self):
+        """Готовим следующий трек, пока играет текущий: ссылку Яндекса или аудио YouTube"""
+        if not self.queue:
+            return
+        song = self.queue[0]
+        if song.source == 'yandex':
+            self.yandex_music.prefetch_download_info(song.track_info)
+        elif song.source == 'youtube':
+            get_youtube_audio_cache().prefetch(song.video_id)
+
+    def _unplayable_reason(self, video_id, info=None):
+        """Reason the YouTube video won't play (from fresh metadata or an earlier check), None if not known"""
+        checker = get_playability_checker()
+        if info and 'unplayable' in info:
+            # Полные метаданные (yt-dlp или ответ oEmbed) - результат окончательный
+            checker.remember(video_id, info['unplayable'])
+        elif info and info_reason(info):
+            # В выдаче поиска есть только часть полей: запоминаем лишь найденную проблему
+            checker.remember(video_id, info_reason(info))
+        # Для воспроизведения только звука запрет встраивания не мешает
+        return checker.known_reason(video_id, embed_required=not get_youtube_audio_cache().available)
+
+    def _check_playability(self, song):
+        """Проверить YouTube-заявку в фоне; если видео не сыграет, она будет удалена из очереди"""
+        if song.source != 'youtube' or not self.check_playability:
+            return
+        checker = get_playability_checker()
+        if checker.is_checked(song.video_id):
+            return
+        checker.check_async(song.video_id, lambda reason: self._on_unplayable(song))
+
+    def _on_unplayable(self, song):
+        # Очередь меняем в потоке плеера (Tk / поток headless-плеера)
+        player_frame = getattr(self, 'player_frame', None)
+        if player_frame:
+            player_frame.call_soon(lambda: self._prune_unplayable(song))
+        else:
+            self._prune_unplayable(song)
+
+    def _prune_unplayable(self, song):
+        """Remove a queued song whose video turned out to be unplayable"""
+        reason = self._unplayable_reason(song.video_id)
+        index = next((i for i, queued in enumerate(self.queue) if queued is song), None)
+        if not reason or index is None:
+            return
+        self.queue.pop(index)
+        print(f"Removed unplayable video from queue: '{song.title}' ({reason})")
+        if self.message_callback:
+            self.message_callback(f"Удалено из очереди: {song.title} - {describe(reason)}")
+        if self.update_queue_callback:
+            self.update_queue_callback()
+        if index == 0 and self.is_playing:
+            self._prefetch_next()
+
+    def report_player_error(self, error_code):
+        """Called by the player frame when the page's YouTube player reports an error"""
+        song = self.current_song
+        if not song:
+            return
+        reason = None
+        if song.source == 'youtube':
+            reason = get_playability_checker().record_player_error(song.video_id, error_code)
+        if not reason:
+            # Непонятная ошибка плеера считается сбоем источника
+            self.report_track_failed(song)
+            return
+        # Проблема в самом видео, а не в YouTube: сразу переходим дальше, не трогая счетчик сбоев
+        if self.message_callback:
+            self.message_callback(f"Пропущено: {song.title} - {describe(reason)}")
+        self.skip_song()
+
+    def record_track_started(self):
+        """Called by the player frame once the next track is handed to the player."""
+        self.current_started_at = time.time()
+        song = self.current_song
+        if song:
+            get_circuit_breaker(song.source).record_success()
+        if self.play_history and song:
+            self.play_history.record_play(self.channel, song.source, song.video_id, song.title,
+                                          song.requester, song.request_time, self.current_started_at)
+        if self.transition_started_at is not None:
+            self.metrics.observe("track_transition_seconds", time.perf_counter() - self.transition_started_at)
+            self.transition_started_at = None
+
     def set_volume(self, volume):
         """Set player volume (0-100)"""
         try:
@@ -633,11 +1246,9 @@ class MusicPlayer:
                 print(f"Setting volume to {self.volume}% in player frame")
                 success = self.player_frame.set_volume(self.volume)
                 
-                # If we have config manager, save the volume setting
+                # If we have config manager, save the volume setting (запись на диск отложенная)
                 if hasattr(self, 'config_manager') and self.config_manager:
                     self.config_manager.set_player_volume(self.volume)
-                    self.config_manager.save_config()
-                    print("Volume setting saved to configuration from music player")
                     
                 return success
             return False
@@ -656,7 +1267,10 @@ class MusicPlayer:
 
     def wrong_song(self, requester):
         """Remove the last song requested by the user from the queue."""
-        # Проверяем всю очередь на предмет песен этого пользователя, начиная с конца
+        if not self.queue.has_requester(requester):
+            return False, "В очереди нет песен от вас."
+        
+        # Ищем последнюю песню этого пользователя, начиная с конца
         for i in range(len(self.queue) - 1, -1, -1):
             if self.queue[i].requester.lower() == requester.lower():
                 song = self.queue.pop(i)
@@ -683,19 +1297,26 @@ class MusicPlayer:
         try:
             self.queue.append(song)
             print(f"Song added to queue: '{song.title}' from {song.source}")
+            self._check_playability(song)
             
             # Update queue display if callback is set
             if self.update_queue_callback:
-                self.update_queue_callback()
+                with self.tracer.span("update_queue_callback"):
+                    self.update_queue_callback()
             
             # Send notification
             if self.message_callback:
-                self.message_callback(f"Added to queue: {song.title}")
+                with self.tracer.span("message_callback"):
+                    self.message_callback(f"Added to queue: {song.title}")
                 
             # Start playing if nothing is currently playing
             if not self.is_playing and self.player_initialized:
                 print("Queue was empty, starting playback...")
-                self._play_next()
+                with self.tracer.span("play_next"):
+                    self._play_next()
+            elif len(self.queue) == 1:
+                # Песня встала следующей в очереди
+                self._prefetch_next()
             
             return True, f"Added to queue: {song.title}"
         except Exception as e:
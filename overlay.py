@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Сколько следующих песен показывает оверлей
+OVERLAY_NEXT_COUNT = 10
+# Состояние пересобирается не чаще, чем раз в это время, сколько бы оверлеев ни опрашивало сервер
+REFRESH_INTERVAL = 0.5
+# Сколько последних версий помнить для ответов с изменениями (?since=)
+HISTORY_SIZE = 64
+
+def _song_entry(song):
+    return {
+        "title": song.title,
+        "requester": song.requester,
+        "duration": song.duration,
+        "source": song.source
+    }
+
+class OverlayState:
+    """Versioned now-playing/queue document for stream overlays.
+
+    The document only changes when the playlist does: instead of an elapsed
+    counter it carries started_at (unix time), so clients compute elapsed
+    time themselves and an idle overlay keeps getting 304 Not Modified.
+    Listeners added with add_listener are called after each version bump.
+    """
+
+    def __init__(self, music_player, next_count=OVERLAY_NEXT_COUNT):
+        self.music_player = music_player
+        self.next_count = next_count
+        self.version = 0
+        self.document = None
+        self.body = b""
+        self._history = OrderedDict()  # версия -> документ
+        self._refreshed_at = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def etag(self):
+        return f'"{self.version}"'
+
+    def _build(self):
+        player = self.music_player
+        current = player.current_song if player else None
+        queue = list(player.queue) if player else []
+        return {
+            "current": dict(_song_entry(current), started_at=player.current_started_at) if current else None,
+            "is_playing": bool(player and player.is_playing),
+            "next": [_song_entry(song) for song in queue[:self.next_count]],
+            "queue_length": len(queue)
+        }
+
+    def add_listener(self, callback):
+        """Call callback(version) whenever the document changes"""
+        self._listeners.append(callback)
+
+    def refresh(self, force=False):
+        """Rebuild the document if it is stale; bumps the version on changes"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self.document is not None and now - self._refreshed_at < REFRESH_INTERVAL:
+                return self.version
+            self._refreshed_at = now
+
+            document = self._build()
+            changed = document != self.document
+            if changed:
+                self.version += 1
+                self.document = document
+                self.body = json.dumps(dict(document, version=self.version), ensure_ascii=False).encode('utf-8')
+                self._history[self.version] = document
+                while len(self._history) > HISTORY_SIZE:
+                    self._history.popitem(last=False)
+            version = self.version
+        # Слушатели вызываются без блокировки: они могут сами читать состояние
+        if changed:
+            for callback in self._listeners:
+                callback(version)
+        return version
+
+    def full(self):
+        """(etag, JSON body) of the current document"""
+        with self._lock:
+            return self.etag, self.body
+
+    def delta_since(self, since):
+        """Fields changed after version since, or None if that version is too old"""
+        with self._lock:
+            old = self._history.get(since)
+            if old is None:
+                return None
+            changes = {key: value for key, value in self.document.items() if old.get(key) != value}
+            return {"version": self.version, "since": since, "changes": changes}
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from sqlite_store import BatchWriter, connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    id INTEGER PRIMARY KEY,
+    channel TEXT NOT NULL,
+    source TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    title TEXT,
+    requester TEXT,
+    requested_at REAL,
+    played_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plays_track ON plays (channel, source, track_id, played_at);
+CREATE INDEX IF NOT EXISTS plays_requester ON plays (requester, played_at);
+CREATE INDEX IF NOT EXISTS plays_time ON plays (played_at);
+"""
+
+INSERT_PLAY = """
+INSERT INTO plays (channel, source, track_id, title, requester, requested_at, played_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+_history_instances = {}
+
+def get_play_history(db_path='play_history.db'):
+    """Get shared PlayHistory for db_path"""
+    if db_path not in _history_instances:
+        _history_instances[db_path] = PlayHistory(db_path)
+    return _history_instances[db_path]
+
+class PlayHistory:
+    """SQLite log of played tracks (WAL mode, indexed by track, requester and time).
+
+    record_play only queues the row; a background thread writes batches,
+    so the player never waits on disk. Lookups also see rows that are
+    still waiting to be written.
+    """
+
+    def __init__(self, db_path='play_history.db'):
+        self.db_path = db_path
+        self._unflushed = {}  # (channel, source, track_id) -> played_at еще не записанных строк
+        self._lock = threading.Lock()
+
+        # Соединение для чтения (из любого потока, под _lock); запись - в потоке BatchWriter
+        self._read_conn = connect(db_path)
+        self._read_conn.executescript(SCHEMA)
+        self._writer = BatchWriter(db_path, on_written=self._on_written)
+
+    def record_play(self, channel, source, track_id, title, requester, requested_at=None, played_at=None):
+        """Queue a play for writing"""
+        played_at = played_at or time.time()
+        with self._lock:
+            self._unflushed[(channel or "", source, track_id)] = played_at
+        self._writer.execute(INSERT_PLAY, (channel or "", source, track_id, title, requester, requested_at, played_at))
+
+    def last_played_at(self, channel, source, track_id):
+        """Unix time the track was last played in channel, or None"""
+        key = (channel or "", source, track_id)
+        with self._lock:
+            unflushed = self._unflushed.get(key)
+            if unflushed is not None:
+                return unflushed
+            row = self._read_conn.execute(
+                "SELECT MAX(played_at) FROM plays WHERE channel = ? AND source = ? AND track_id = ?", key
+            ).fetchone()
+        return row[0] if row else None
+
+    def _on_written(self, items):
+        with self._lock:
+            for _, row in items:
+                key = row[:3]
+                if self._unflushed.get(key) == row[6]:
+                    del self._unflushed[key]
+
+    def close(self):
+        """Write queued plays and stop the writer thread"""
+        self._writer.close()
@@ -0,0 +1,223 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from endpoints import get_endpoints
+from metrics import get_metrics_registry
+from ytdlp_pool import HAS_YT_DLP, INFO_OPTS, get_ytdlp_pool, video_info
+
+if HAS_YT_DLP:
+    import yt_dlp
+
+# Причины, по которым видео не сыграет (код -> текст для чата)
+EMBED_DISABLED = "embed_disabled"
+UNAVAILABLE = "unavailable"
+PRIVATE = "private"
+REGION_BLOCKED = "region_blocked"
+AGE_RESTRICTED = "age_restricted"
+LIVE = "live"
+UPCOMING = "upcoming"
+POST_LIVE = "post_live"
+
+REASONS = {
+    EMBED_DISABLED: "автор запретил воспроизведение на других сайтах",
+    UNAVAILABLE: "видео удалено или недоступно",
+    PRIVATE: "видео закрыто автором",
+    REGION_BLOCKED: "видео недоступно в этой стране",
+    AGE_RESTRICTED: "видео с ограничением по возрасту",
+    LIVE: "это прямая трансляция",
+    UPCOMING: "трансляция еще не началась",
+    POST_LIVE: "запись трансляции еще обрабатывается",
+}
+
+# Коды ошибок YouTube IFrame API, которые относятся к самому видео, а не к сети или плееру
+PLAYER_ERRORS = {
+    100: UNAVAILABLE,
+    101: EMBED_DISABLED,
+    150: EMBED_DISABLED,
+}
+
+# Фрагменты сообщений об ошибках yt-dlp
+_ERROR_PATTERNS = (
+    ("private video", PRIVATE),
+    ("not available in your country", REGION_BLOCKED),
+    ("blocked it in your country", REGION_BLOCKED),
+    ("confirm your age", AGE_RESTRICTED),
+    ("age-restricted", AGE_RESTRICTED),
+    ("premieres in", UPCOMING),
+    ("live event will begin", UPCOMING),
+    ("video unavailable", UNAVAILABLE),
+    ("has been removed", UNAVAILABLE),
+    ("video is unavailable", UNAVAILABLE),
+)
+
+# Сколько помнить результат проверки и сколько результатов держать
+RESULT_TTL = 3600
+MAX_RESULTS = 5000
+
+_checker_instance = None
+
+def get_playability_checker():
+    """Get singleton instance of PlayabilityChecker"""
+    global _checker_instance
+    if _checker_instance is None:
+        _checker_instance = PlayabilityChecker()
+    return _checker_instance
+
+def info_reason(info):
+    """Reason code for video metadata (see ytdlp_pool.video_info), None if it looks playable"""
+    live_status = info.get('live_status')
+    if live_status == 'is_live':
+        return LIVE
+    if live_status == 'is_upcoming':
+        return UPCOMING
+    if live_status == 'post_live':
+        # Трансляция закончилась, но запись еще не готова
+        return POST_LIVE
+    availability = info.get('availability')
+    if availability == 'private':
+        return PRIVATE
+    if availability in ('needs_auth', 'premium_only', 'subscriber_only'):
+        return UNAVAILABLE
+    if (info.get('age_limit') or 0) >= 18:
+        return AGE_RESTRICTED
+    if info.get('playable_in_embed') is False:
+        return EMBED_DISABLED
+    return None
+
+def error_reason(error):
+    """Reason code for a yt-dlp extraction error, None if it isn't about the video itself"""
+    message = str(error).lower()
+    for pattern, reason in _ERROR_PATTERNS:
+        if pattern in message:
+            return reason
+    return None
+
+def oembed_reason(status_code):
+    """Reason code for an oEmbed response status: 401/403 - embedding disabled, 404 - no such video"""
+    return {401: EMBED_DISABLED, 403: EMBED_DISABLED, 404: UNAVAILABLE}.get(status_code)
+
+def describe(reason):
+    return REASONS.get(reason, reason)
+
+class PlayabilityChecker:
+    """Finds out whether a YouTube video will play before its turn comes.
+
+    Checks use the same metadata request as a song request (yt-dlp, or the
+    oEmbed endpoint without it, which answers 401 for videos that can't be
+    embedded and 404 for removed ones). Results are remembered per video,
+    including errors reported by the player page, so a bad video is
+    rejected right away when someone requests it again.
+
+    Embedding doesn't matter for audio-only playback, so EMBED_DISABLED is
+    ignored when embed_required is False.
+    """
+
+    def __init__(self, workers=2, ttl=RESULT_TTL, max_results=MAX_RESULTS):
+        self.ttl = ttl
+        self.max_results = max_results
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="playability")
+        self._results = {}  # video_id -> (код причины или None, время проверки)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+        self.metrics = get_metrics_registry()
+        self.metrics.describe("youtube_playability_checks_total", "Background YouTube playability checks by result")
+
+    def remember(self, video_id, reason):
+        """Store a check result (reason code or None)"""
+        now = time.monotonic()
+        with self._lock:
+            # Словарь упорядочен по вставке: свежий результат переносим в конец
+            self._results.pop(video_id, None)
+            self._results[video_id] = (reason, now)
+            self._evict(now)
+
+    def _evict(self, now):
+        """Выбросить истекшие результаты, а сверх max_results - самые старые (под _lock)"""
+        for video_id in [video_id for video_id, result in self._results.items() if now - result[1] > self.ttl]:
+            del self._results[video_id]
+        if len(self._results) > self.max_results:
+            for video_id in list(self._results)[:len(self._results) - self.max_results]:
+                del self._results[video_id]
+
+    def known_reason(self, video_id, embed_required=True):
+        """Remembered reason the video won't play, None if it is playable or wasn't checked"""
+        with self._lock:
+            result = self._results.get(video_id)
+        if not result or time.monotonic() - result[1] > self.ttl:
+            return None
+        reason = result[0]
+        if reason == EMBED_DISABLED and not embed_required:
+            return None
+        return reason
+
+    def record_player_error(self, video_id, error_code):
+        """Remember a player page error about the video itself; returns its reason code or None"""
+        try:
+            reason = PLAYER_ERRORS.get(int(error_code))
+        except (TypeError, ValueError):
+            reason = None
+        if reason:
+            self.remember(video_id, reason)
+        return reason
+
+    def is_checked(self, video_id):
+        with self._lock:
+            result = self._results.get(video_id)
+        return result is not None and time.monotonic() - result[1] <= self.ttl
+
+    def check(self, video_id):
+        """Query metadata and return the reason code (None if playable or the check itself failed)"""
+        url = f"https://www.youtube.com/watch?v={video_id}"
+        if HAS_YT_DLP and not get_endpoints().is_overridden("youtube"):
+            try:
+                pool = get_ytdlp_pool()
+                if pool.enabled:
+                    info = pool.video_info(url)
+                else:
+                    with yt_dlp.YoutubeDL(INFO_OPTS) as ydl:
+                        info = video_info(ydl, url)
+                reason = info_reason(info)
+                self.remember(video_id, reason)
+                return reason
+            except Exception as e:
+                reason = error_reason(e)
+                if reason:
+                    self.remember(video_id, reason)
+                    return reason
+                print(f"Error checking video {video_id} with yt-dlp: {e}")
+
+        try:
+            response = requests.get(get_endpoints().url(
+                "youtube", f"/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json"), timeout=10)
+        except requests.RequestException as e:
+            print(f"Error checking video {video_id} via oEmbed: {e}")
+            return None
+        reason = oembed_reason(response.status_code)
+        if reason or response.status_code == 200:
+            self.remember(video_id, reason)
+        return reason
+
+    def check_async(self, video_id, callback):
+        """Check the video in the background and call callback(reason) if it won't play"""
+        with self._lock:
+            if video_id in self._pending:
+                return
+            self._pending.add(video_id)
+        self._executor.submit(self._check_job, video_id, callback)
+
+    def _check_job(self, video_id, callback):
+        try:
+            reason = self.check(video_id)
+            self.metrics.inc("youtube_playability_checks_total",
+                             labels={"result": reason or "playable"})
+            if reason:
+                callback(reason)
+        except Exception as e:
+            print(f"Error in playability check for {video_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(video_id)
@@ -0,0 +1,51 @@
+import abc
+
+class PlayerFrameInterface(abc.ABC):
+    """What MusicPlayer and PlayerServer expect from a player frame.
+
+    MusicPlayer calls update_now_playing / set_volume and may write
+    pending_command; PlayerServer reads the current media and pending_command
+    and reports player page events through call_soon. YouTubePlayerFrame is
+    the Tk implementation, HeadlessPlayerFrame the GUI-less one. A frame that
+    misses one of the abstract methods fails when it is created.
+    """
+
+    # Команда, которую страница плеера заберет при следующем опросе /check_for_commands
+    pending_command = {"command": "none"}
+    music_player = None
+    volume = 50
+    server_port = None
+    html_path = None
+    current_video_id = None
+    current_audio_src = None
+    current_audio_info = None
+
+    @abc.abstractmethod
+    def update_now_playing(self, song):
+        """Start playing song (None clears the player); returns True on success"""
+
+    @abc.abstractmethod
+    def set_volume(self, volume):
+        """Set the player volume (0-100 or 0.0-1.0); returns True on success"""
+
+    @abc.abstractmethod
+    def call_soon(self, callback):
+        """Run callback on the thread that owns the player state"""
+
+    @abc.abstractmethod
+    def get_current_title(self):
+        """Title shown for the current media"""
+
+    # События страницы плеера (вызываются через call_soon)
+
+    def _on_player_ready(self):
+        pass
+
+    def _on_media_ended(self):
+        pass
+
+    def _on_player_error(self, error_code):
+        pass
+
+    def _skip_song(self):
+        pass
@@ -0,0 +1,1065 @@
+import asyncio
+import json
+import mimetypes
+import os
+import socket
+import tempfile
+import threading
+import urllib.parse
+from http import HTTPStatus
+from metrics import get_metrics_registry
+from overlay import OverlayState, REFRESH_INTERVAL
+
+# Маршруты локального сервера (для метрик; остальные пути считаются как "other")
+PLAYER_ROUTES = ('/player_ready', '/video_ended', '/player_error', '/get_current_video',
+                 '/check_for_commands', '/skip_song', '/metrics', '/player', '/overlay')
+
+# Соединение браузера держится открытым между опросами, пока не простаивает дольше этого
+KEEP_ALIVE_TIMEOUT = 15
+AUDIO_CHUNK_SIZE = 64 * 1024
+# Дольше этого длинный опрос /overlay?since=...&wait=... не держится
+OVERLAY_MAX_WAIT = 30
+
+def find_free_port():
+    """Find a free port to use for the server."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def create_player_html(server_port, volume):
+    """Create an HTML file for the media player that supports both YouTube and audio files; returns its path."""
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Music Bot Player</title>
+        <style>
+            body {{ 
+                margin: 0; 
+                padding: 0; 
+                background-color: #000; 
+                overflow: hidden;
+                font-family: Arial, sans-serif;
+            }}
+            #player {{ 
+                width: 100%; 
+                height: 100vh; 
+            }}
+            #audio-player {{
+                position: fixed;
+                top: 0;
+                left: 0;
+                width: 100%;
+                height: 100vh;
+                display: flex;
+                flex-direction: column;
+                justify-content: center;
+                align-items: center;
+                color: white;
+                background: #000;
+                z-index: 100;
+                display: none;
+            }}
+            #audio-player.active {{
+                display: flex;
+            }}
+            .cover-art {{
+                width: 300px;
+                height: 300px;
+                background-color: #FFCC00;
+                margin-bottom: 20px;
+                display: flex;
+                justify-content: center;
+                align-items: center;
+                font-size: 24px;
+                color: black;
+                overflow: hidden;
+                position: relative;
+            }}
+            .cover-art img {{
+                width: 100%;
+                height: 100%;
+                object-fit: cover;
+            }}
+            .track-info {{
+                text-align: center;
+                margin-bottom: 20px;
+                width: 80%;
+                max-width: 600px;
+            }}
+            .track-title {{
+                font-size: 24px;
+                font-weight: bold;
+                margin-bottom: 10px;
+            }}
+            .track-artist {{
+                font-size: 18px;
+                opacity: 0.8;
+            }}
+            .audio-controls {{
+                display: flex;
+                justify-content: center;
+                gap: 15px;
+                margin-top: 20px;
+            }}
+            .audio-control-btn {{
+                background: #4CAF50;
+                color: white;
+                border: none;
+                padding: 10px 20px;
+                border-radius: 5px;
+                cursor: pointer;
+                font-size: 16px;
+                min-width: 100px;
+            }}
+            #audio-progress {{
+                width: 80%;
+                max-width: 500px;
+                margin: 10px 0;
+            }}
+            #audio-volume {{
+                width: 200px;
+                margin: 10px 0;
+            }}
+            #controls {{
+                position: fixed;
+                bottom: 0;
+                left: 0;
+                right: 0;
+                background: rgba(0,0,0,0.7);
+                color: white;
+                padding: 10px;
+                display: flex;
+                justify-content: space-between;
+                align-items: center;
+                z-index: 1000;
+            }}
+            .control-button {{
+                background: #4CAF50;
+                border: none;
+                color: white;
+                padding: 5px 10px;
+                cursor: pointer;
+                border-radius: 3px;
+                margin: 0 5px;
+            }}
+            #status {{
+                margin-left: 10px;
+            }}
+            #song-info {{
+                flex-grow: 1;
+                text-align: center;
+                overflow: hidden;
+                text-overflow: ellipsis;
+                white-space: nowrap;
+            }}
+            #autoplay-overlay {{
+                position: fixed;
+                top: 0;
+                left: 0;
+                right: 0;
+                bottom: 0;
+                background: rgba(0,0,0,0.85);
+                display: flex;
+                flex-direction: column;
+                justify-content: center;
+                align-items: center;
+                z-index: 2000;
+                color: white;
+            }}
+            #autoplay-button {{
+                background: #4CAF50;
+                color: white;
+                border: none;
+                padding: 15px 30px;
+                font-size: 18px;
+                cursor: pointer;
+                border-radius: 4px;
+                margin-top: 20px;
+                transition: background 0.3s;
+            }}
+            #autoplay-button:hover {{
+                background: #3e8e41;
+            }}
+            .source-indicator {{
+                position: absolute;
+                top: 10px;
+                right: 10px;
+                background: rgba(0,0,0,0.6);
+                color: white;
+                padding: 5px 10px;
+                border-radius: 4px;
+                font-size: 12px;
+            }}
+        </style>
+    </head>
+    <body>
+        <!-- YouTube Player -->
+        <div id="player"></div>
+        
+        <!-- Audio Player for Yandex Music -->
+        <div id="audio-player">
+            <div class="source-indicator">Yandex Music</div>
+            <div class="cover-art" id="cover-container">
+                <div id="cover-placeholder">Yandex Music</div>
+                <img id="cover-image" style="display:none;">
+            </div>
+            <div class="track-info">
+                <div class="track-title" id="audio-title">Трек не выбран</div>
+                <div class="track-artist" id="audio-artist">Исполнитель</div>
+            </div>
+            <audio id="audio-element" preload="auto"></audio>
+            <input type="range" id="audio-progress" min="0" max="100" value="0">
+            <div class="time-display">
+                <span id="current-time">0:00</span> / <span id="total-time">0:00</span>
+            </div>
+            <div class="audio-controls">
+                <button class="audio-control-btn" id="audio-play-pause">Play</button>
+                <button class="audio-control-btn" id="audio-skip">Skip</button>
+            </div>
+            <div class="volume-control">
+                <label for="audio-volume">Громкость:</label>
+                <input type="range" id="audio-volume" min="0" max="100" value="{volume}">
+            </div>
+        </div>
+        
+        <!-- Оверлей для нажатия кнопки автовоспроизведения -->
+        <div id="autoplay-overlay">
+            <h2>Музыкальный плеер готов к работе</h2>
+            <p>Для запуска автоматического воспроизведения нажмите кнопку ниже</p>
+            <button id="autoplay-button" onclick="enableAutoplay()">Запустить воспроизведение</button>
+        </div>
+        
+        <div id="controls">
+            <div id="status">Ready</div>
+            <div id="song-info">No song playing</div>
+            <div>
+                <button class="control-button" onclick="skipSong()">Skip</button>
+            </div>
+        </div>
+        
+        <script>
+            // Communication with the main app
+            const PORT = {server_port};
+            const BASE_URL = `http://localhost:${{PORT}}`;
+            
+            // Сохраняем настройку громкости, чтобы применить её сразу после инициализации
+            let pendingVolume = {volume};
+            let pendingVideoId = null;
+            let pendingVideoTitle = null;
+            let pendingAudioSrc = null;
+            let pendingAudioInfo = null;
+            let autoplayEnabled = false;
+            let currentMediaType = null; // 'youtube' или 'audio'
+            
+            // Получаем элементы аудио-плеера
+            const audioPlayer = document.getElementById('audio-player');
+            const audioElement = document.getElementById('audio-element');
+            const audioTitle = document.getElementById('audio-title');
+            const audioArtist = document.getElementById('audio-artist');
+            const audioProgress = document.getElementById('audio-progress');
+            const audioVolume = document.getElementById('audio-volume');
+            const audioPlayPause = document.getElementById('audio-play-pause');
+            const audioSkip = document.getElementById('audio-skip');
+            const currentTimeDisplay = document.getElementById('current-time');
+            const totalTimeDisplay = document.getElementById('total-time');
+            const coverImage = document.getElementById('cover-image');
+            const coverPlaceholder = document.getElementById('cover-placeholder');
+            
+            // Настраиваем аудио-плеер
+            function setupAudioPlayer() {{
+                // Обновление прогресса
+                audioElement.addEventListener('timeupdate', function() {{
+                    if (audioElement.duration) {{
+                        const percent = (audioElement.currentTime / audioElement.duration) * 100;
+                        audioProgress.value = percent;
+                        
+                        // Обновляем отображение времени
+                        currentTimeDisplay.textContent = formatTime(audioElement.currentTime);
+                    }}
+                }});
+                
+                // При изменении ползунка прогресса
+                audioProgress.addEventListener('input', function() {{
+                    const seekTime = (audioProgress.value / 100) * audioElement.duration;
+                    audioElement.currentTime = seekTime;
+                }});
+                
+                // При изменении громкости
+                audioVolume.addEventListener('input', function() {{
+                    const volume = audioVolume.value / 100;
+                    audioElement.volume = volume;
+                    pendingVolume = audioVolume.value;
+                }});
+                
+                // Кнопка Play/Pause
+                audioPlayPause.addEventListener('click', function() {{
+                    if (audioElement.paused) {{
+                        audioElement.play();
+                        audioPlayPause.textContent = 'Pause';
+                    }} else {{
+                        audioElement.pause();
+                        audioPlayPause.textContent = 'Play';
+                    }}
+                }});
+                
+                // Кнопка Skip
+                audioSkip.addEventListener('click', skipSong);
+                
+                // При загрузке метаданных трека
+                audioElement.addEventListener('loadedmetadata', function() {{
+                    totalTimeDisplay.textContent = formatTime(audioElement.duration);
+                }});
+                
+                // При окончании трека
+                audioElement.addEventListener('ended', function() {{
+                    console.log('Audio ended, playing next song');
+                    audioPlayPause.textContent = 'Play';
+                    skipSong();
+                }});
+                
+                // Устанавливаем начальную громкость
+                audioVolume.value = pendingVolume;
+                audioElement.volume = pendingVolume / 100;
+            }}
+            
+            // Форматирование времени в формат MM:SS
+            function formatTime(seconds) {{
+                const min = Math.floor(seconds / 60);
+                const sec = Math.floor(seconds % 60);
+                return `${{min}}:${{sec < 10 ? '0' : ''}}${{sec}}`;
+            }}
+            
+            // Показать аудио-плеер
+            function showAudioPlayer() {{
+                audioPlayer.classList.add('active');
+                if (document.querySelector('#player iframe')) {{
+                    document.querySelector('#player iframe').style.display = 'none';
+                }}
+                currentMediaType = 'audio';
+                console.log("Audio player activated");
+            }}
+            
+            // Показать YouTube-плеер
+            function showYouTubePlayer() {{
+                audioPlayer.classList.remove('active');
+                if (document.querySelector('#player iframe')) {{
+                    document.querySelector('#player iframe').style.display = 'block';
+                }}
+                currentMediaType = 'youtube';
+                console.log("YouTube player activated");
+            }}
+            
+            // Загрузить аудиофайл и начать воспроизведение
+            function loadAudio(src, info) {{
+                console.log('Loading audio:', src, info);
+                
+                if (!autoplayEnabled) {{
+                    pendingAudioSrc = src;
+                    pendingAudioInfo = info;
+                    document.getElementById('song-info').innerText = "Нажмите кнопку 'Запустить воспроизведение'";
+                    return false;
+                }}
+                
+                showAudioPlayer();
+                
+                // Остановим YouTube плеер если он играет
+                if (player && typeof player.stopVideo === 'function') {{
+                    player.stopVideo();
+                }}
+                
+                // Загружаем аудиофайл
+                audioElement.src = src;
+                
+                // Обновляем информацию о треке
+                if (info) {{
+                    audioTitle.textContent = info.title || 'Неизвестный трек';
+                    audioArtist.textContent = info.artist || 'Неизвестный исполнитель';
+                    document.getElementById('song-info').innerText = `${{info.title}} - ${{info.artist}}`;
+                    
+                    // Обновляем обложку если есть
+                    if (info.cover) {{
+                        coverImage.src = info.cover;
+                        coverImage.style.display = 'block';
+                        coverPlaceholder.style.display = 'none';
+                    }} else {{
+                        coverImage.style.display = 'none';
+                        coverPlaceholder.style.display = 'block';
+                    }}
+                }}
+                
+                // Воспроизводим трек
+                audioElement.play()
+                    .then(() => {{
+                        audioPlayPause.textContent = 'Pause';
+                        document.getElementById('status').innerText = "Now playing";
+                    }})
+                    .catch(e => {{
+                        console.error('Error playing audio:', e);
+                        document.getElementById('status').innerText = "Error: " + e;
+                    }});
+                
+                return true;
+            }}
+            
+            // Функция для разрешения автовоспроизведения
+            function enableAutoplay() {{
+                console.log('Enabling autoplay');
+                
+                // Скрываем оверлей
+                document.getElementById('autoplay-overlay').style.display = 'none';
+                autoplayEnabled = true;
+                
+                // Настраиваем аудио-плеер
+                setupAudioPlayer();
+                
+                // Явно применяем громкость сразу после активации
+                if (player && player.setVolume) {{
+                    player.setVolume(pendingVolume);
+                    console.log(`Applied volume on autoplay enable: ${{pendingVolume}}`);
+                    
+                    // Убедимся, что звук не выключен
+                    if (player.isMuted && player.isMuted()) {{
+                        player.unMute();
+                        console.log("Unmuted player");
+                    }}
+                }}
+                
+                // Небольшая задержка перед проверкой контента
+                setTimeout(() => {{
+                    // Проверяем, что у нас есть в очереди
+                    if (pendingVideoId) {{
+                        console.log('Loading pending video:', pendingVideoId);
+                        loadVideo(pendingVideoId, pendingVideoTitle);
+                        pendingVideoId = null;
+                        pendingVideoTitle = null;
+                    }} else if (pendingAudioSrc) {{
+                        console.log('Loading pending audio:', pendingAudioSrc);
+                        loadAudio(pendingAudioSrc, pendingAudioInfo);
+                        pendingAudioSrc = null;
+                        pendingAudioInfo = null;
+                    }} else {{
+                        // Иначе просто проверяем, есть ли текущее видео
+                        checkForPendingMedia();
+                    }}
+                }}, 300);
+            }}
+            
+            // YouTube Player API
+            var tag = document.createElement('script');
+            tag.src = "https://www.youtube.com/iframe_api";
+            var firstScriptTag = document.getElementsByTagName('script')[0];
+            firstScriptTag.parentNode.insertBefore(tag, firstScriptTag);
+            
+            var player;
+            function onYouTubeIframeAPIReady() {{
+                console.log('YouTube API ready');
+                player = new YT.Player('player', {{
+                    height: '100%',
+                    width: '100%',
+                    videoId: '',
+                    playerVars: {{
+                        'autoplay': 0, // Начинаем без автовоспроизведения
+                        'controls': 1,
+                        'rel': 0,
+                        'modestbranding': 1
+                    }},
+                    events: {{
+                        'onReady': onPlayerReady,
+                        'onStateChange': onPlayerStateChange,
+                        'onError': onPlayerError
+                    }}
+                }});
+            }}
+            
+            function onPlayerReady(event) {{
+                console.log('Player ready');
+                document.getElementById('status').innerText = "Player ready";
+                
+                // Устанавливаем сохраненную громкость
+                if (pendingVolume) {{
+                    player.setVolume(pendingVolume);
+                    console.log(`Applied initial volume: ${{pendingVolume}}`);
+                }}
+                
+                // Notify main app that player is ready
+                fetch(`${{BASE_URL}}/player_ready`)
+                    .catch(e => console.error('Error notifying ready:', e));
+                
+                // Check for pending media
+                setTimeout(() => {{
+                    checkForPendingMedia();
+                }}, 500);
+            }}
+            
+            function onPlayerStateChange(event) {{
+                // Check if video ended (0 = ended)
+                if (event.data === 0) {{
+                    console.log('Video ended');
+                    document.getElementById('status').innerText = "Video ended";
+                    
+                    // Notify main app
+                    fetch(`${{BASE_URL}}/video_ended`)
+                        .catch(e => console.error('Error notifying video ended:', e));
+                }}
+            }}
+            
+            function onPlayerError(event) {{
+                console.log('Player error: ' + event.data);
+                document.getElementById('status').innerText = "Error: " + event.data;
+                
+                // Notify main app
+                fetch(`${{BASE_URL}}/player_error?code=${{event.data}}`)
+                    .catch(e => console.error('Error notifying error:', e));
+            }}
+            
+            function loadVideo(videoId, title = "Unknown Title") {{
+                console.log('Loading video:', videoId, title);
+                
+                if (player && player.loadVideoById) {{
+                    if (autoplayEnabled) {{
+                        console.log(`Loading video: ${{videoId}} with volume ${{pendingVolume}}`);
+                        
+                        // Проверяем громкость перед загрузкой видео
+                        if (player.getVolume() != pendingVolume) {{
+                            player.setVolume(pendingVolume);
+                            console.log(`Re-applied volume before loading: ${{pendingVolume}}`);
+                        }}
+                        
+                        // Убедимся, что звук не выключен
+                        if (player.isMuted && player.isMuted()) {{
+                            player.unMute();
+                        }}
+                        
+                        // Показываем YouTube плеер
+                        showYouTubePlayer();
+                        
+                        // Останавливаем аудио если играет
+                        if (audioElement && !audioElement.paused) {{
+                            audioElement.pause();
+                            audioPlayPause.textContent = 'Play';
+                        }}
+                        
+                        // Загружаем видео
+                        player.loadVideoById(videoId);
+                        document.getElementById('song-info').innerText = title;
+                        document.getElementById('status').innerText = "Now playing";
+                        
+                        // Force play
+                        player.playVideo();
+                        
+                        return true;
+                    }} else {{
+                        // Сохраняем видео для автовоспроизведения после нажатия кнопки
+                        console.log(`Saving video for autoplay: ${{videoId}}`);
+                        pendingVideoId = videoId;
+                        pendingVideoTitle = title;
+                        document.getElementById('song-info').innerText = "Нажмите кнопку 'Запустить воспроизведение'";
+                        return false;
+                    }}
+                }} else {{
+                    console.error("Player not ready");
+                    document.getElementById('status').innerText = "Player not ready";
+                    pendingVideoId = videoId;
+                    pendingVideoTitle = title;
+                    return false;
+                }}
+            }}
+            
+            function skipSong() {{
+                // Tell the main app to skip the song
+                fetch(`${{BASE_URL}}/skip_song`)
+                    .catch(e => console.error('Error sending skip command:', e));
+            }}
+            
+            // Check for pending media from the main app
+            function checkForPendingMedia() {{
+                fetch(`${{BASE_URL}}/get_current_video`)
+                    .then(response => response.json())
+                    .then(data => {{
+                        console.log('Checking for pending media, received:', data);
+                        if (data.video_id) {{
+                            console.log(`Got pending video: ${{data.video_id}}`);
+                            loadVideo(data.video_id, data.title);
+                        }} else if (data.audio_src) {{
+                            console.log(`Got pending audio: ${{data.audio_src}}`);
+                            loadAudio(data.audio_src, data.audio_info);
+                        }}
+                    }})
+                    .catch(e => console.error('Error checking for pending media:', e));
+            }}
+            
+            // Poll for changes
+            setInterval(() => {{
+                fetch(`${{BASE_URL}}/check_for_commands`)
+                    .then(response => response.json())
+                    .then(data => {{
+                        if (data.command === 'load') {{
+                            console.log('Load command received:', data);
+                            if (data.video_id) {{
+                                loadVideo(data.video_id, data.title);
+                            }} else if (data.audio_src) {{
+                                loadAudio(data.audio_src, data.audio_info);
+                            }}
+                        }} else if (data.command === 'pause') {{
+                            console.log('Pause command received');
+                            if (autoplayEnabled) {{
+                                if (currentMediaType === 'youtube' && player && player.pauseVideo) {{
+                                    player.pauseVideo();
+                                }} else if (currentMediaType === 'audio') {{
+                                    audioElement.pause();
+                                    audioPlayPause.textContent = 'Play';
+                                }}
+                            }}
+                        }} else if (data.command === 'play') {{
+                            console.log('Play command received');
+                            if (autoplayEnabled) {{
+                                if (currentMediaType === 'youtube' && player && player.playVideo) {{
+                                    player.playVideo();
+                                }} else if (currentMediaType === 'audio') {{
+                                    audioElement.play().then(() => {{
+                                        audioPlayPause.textContent = 'Pause';
+                                    }}).catch(e => console.error('Error playing audio:', e));
+                                }}
+                            }} else {{
+                                // Если воспроизведение не разрешено, подсказываем пользователю
+                                document.getElementById('autoplay-button').style.animation = 'pulse 1s infinite';
+                            }}
+                        }} else if (data.command === 'volume' && data.value !== undefined) {{
+                            console.log('Volume command received:', data.value);
+                            pendingVolume = data.value;
+                            
+                            // Применяем громкость к активному плееру
+                            if (currentMediaType === 'youtube' && player && player.setVolume) {{
+                                player.setVolume(data.value);
+                                console.log(`YouTube volume set to ${{data.value}}`);
+                            }} else if (currentMediaType === 'audio') {{
+                                audioElement.volume = data.value / 100;
+                                audioVolume.value = data.value;
+                                console.log(`Audio volume set to ${{data.value}}`);
+                            }} else {{
+                                console.log(`Volume value ${{data.value}} saved for later`);
+                            }}
+                        }} else if (data.command === 'clear') {{
+                            console.log('Clear command received');
+                            // Остановка текущего медиа
+                            if (currentMediaType === 'youtube' && player && player.stopVideo) {{
+                                player.stopVideo();
+                                player.clearVideo();
+                            }} else if (currentMediaType === 'audio') {{
+                                audioElement.pause();
+                                audioElement.currentTime = 0;
+                                audioElement.src = '';  // Очищаем источник
+                                audioPlayPause.textContent = 'Play';
+                            }}
+                            
+                            document.getElementById('song-info').innerText = "No song playing";
+                            document.getElementById('status').innerText = "Ready";
+                            
+                            console.log("Playlist ended, player cleared");
+                        }}
+                    }})
+                    .catch(e => console.error('Error checking for commands:', e));
+            }}, 1000);
+        </script>
+    </body>
+    </html>
+    """
+    
+    try:
+        # Create a temporary HTML file that will persist for the session
+        fd, path = tempfile.mkstemp(suffix='.html')
+        
+        # Важно: явно указываем кодировку UTF-8 при записи файла
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        
+        # Закрываем файловый дескриптор, открытый tempfile.mkstemp()
+        os.close(fd)
+        
+        return path
+        
+    except Exception as e:
+        print(f"Error creating player HTML file: {e}")
+        
+        # Запасной вариант без специальных символов
+        backup_html = html_content.replace("Оверлей", "Overlay").replace("Запустить воспроизведение", "Start playback")
+        
+        fd, path = tempfile.mkstemp(suffix='.html')
+        with os.fdopen(fd, 'w') as f:
+            f.write(backup_html)
+            
+        return path
+
+
+class PlayerServer:
+    """HTTP server the browser player page polls; works with any PlayerFrameInterface.
+
+    Runs on its own asyncio loop in a background thread: a request costs a
+    coroutine rather than a thread, connections are kept alive between polls
+    and at most max_concurrency requests are handled at once. Overlay
+    long-polls wait for a change outside that limit, so they never hold up
+    the player page.
+    """
+
+    def __init__(self, player_frame, port, host="localhost", max_concurrency=16):
+        self.player_frame = player_frame
+        self.overlay = OverlayState(player_frame.music_player if player_frame else None)
+        self.server_address = (host, port)
+        self.max_concurrency = max_concurrency
+        self._loop = None
+        self._thread = None
+        self._stop_event = None
+        self._connections = set()
+        self._ready = threading.Event()
+        self._start_error = None
+        # Долгие опросы оверлея: событие текущего поколения и число ожидающих
+        self._overlay_changed = None
+        self._overlay_waiters = 0
+        self.overlay.add_listener(self._on_overlay_changed)
+
+    def start(self):
+        """Run the server in a background thread; raises if the port can't be bound"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._start_error:
+            raise self._start_error
+        print(f"Server started on port {self.server_address[1]}")
+        return self._thread
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            self._start_error = e
+        finally:
+            self._ready.set()
+            self._loop.close()
+
+    async def _serve(self):
+        self._stop_event = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._overlay_changed = asyncio.Event()
+        server = await asyncio.start_server(self._handle_connection, *self.server_address)
+        self.server_address = server.sockets[0].getsockname()[:2]
+        self._ready.set()
+        watcher = asyncio.ensure_future(self._watch_overlay())
+
+        await self._stop_event.wait()
+        watcher.cancel()
+        server.close()
+        # Закрываем и соединения, ожидающие следующего запроса (keep-alive)
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await server.wait_closed()
+
+    def shutdown(self):
+        """Stop serving and wait for the server thread"""
+        if self._loop and self._stop_event and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass  # Цикл уже остановлен
+        if self._thread:
+            self._thread.join(5)
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    self._write_head(writer, 400, 'text/plain', 0, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # Тело запроса не используется, но его нужно дочитать до следующего запроса
+                content_length = int(headers.get('content-length') or 0)
+                if content_length:
+                    await reader.readexactly(content_length)
+
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.1':
+                    keep_alive = connection != 'close'
+                else:
+                    keep_alive = connection == 'keep-alive'
+
+                # Долгий опрос оверлея ждет изменений, не занимая слот: иначе
+                # несколько оверлеев заблокировали бы запросы страницы плеера
+                await self._wait_overlay_change(target)
+                async with self._semaphore:
+                    keep_alive = await self._handle_request(method, target, headers, writer, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # Клиент отключился или сервер останавливается
+        except Exception as e:
+            print(f"Error in player server connection: {e}")
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    def _write_head(self, writer, status, content_type, content_length, keep_alive, extra_headers=None):
+        lines = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {content_length}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        for name, value in (extra_headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+    async def _handle_request(self, method, target, headers, writer, keep_alive):
+        """Write the response; returns whether the connection stays open"""
+        if method not in ('GET', 'HEAD'):
+            self._write_head(writer, 405, 'text/plain', 0, keep_alive, {'Allow': 'GET, HEAD'})
+            return keep_alive
+
+        parsed_path = urllib.parse.urlparse(target)
+        path = parsed_path.path
+
+        # Считаем запросы по маршрутам
+        if path.startswith('/audio/'):
+            route = '/audio/'
+        else:
+            route = path if path in PLAYER_ROUTES else 'other'
+        get_metrics_registry().inc("player_http_requests_total", labels={"route": route})
+
+        if path.startswith('/audio/'):
+            return await self._send_audio(path, writer, keep_alive, send_body=method == 'GET')
+        if path == '/overlay':
+            return await self._send_overlay(parsed_path.query, headers, writer, keep_alive,
+                                            send_body=method == 'GET')
+
+        try:
+            status, content_type, body, extra_headers = self._route(path, parsed_path.query)
+        except Exception as e:
+            print(f"Error handling request {target}: {e}")
+            status, content_type = 500, 'application/json'
+            body, extra_headers = json.dumps({"error": str(e)}).encode(), {}
+
+        self._write_head(writer, status, content_type, len(body), keep_alive, extra_headers)
+        if method == 'GET':
+            writer.write(body)
+        return keep_alive
+
+    def _route(self, path, query_string):
+        """Response for everything except /audio/: (status, content type, body, headers)"""
+        player_frame = self.player_frame
+
+        # Метрики в формате Prometheus
+        if path == '/metrics':
+            body = get_metrics_registry().render().encode('utf-8')
+            return 200, 'text/plain; version=0.0.4; charset=utf-8', body, {}
+
+        # Страница плеера (для браузера или OBS на этой машине)
+        if path == '/player':
+            with open(player_frame.html_path, 'rb') as f:
+                body = f.read()
+            return 200, 'text/html; charset=utf-8', body, {}
+
+        # Остальное - JSON API
+        if path == '/player_ready':
+            print("Player ready notification received")
+            if player_frame:
+                # Schedule on main thread
+                player_frame.call_soon(player_frame._on_player_ready)
+            response = {"status": "ok"}
+
+        elif path == '/video_ended':
+            print("Media ended notification received")
+            if player_frame:
+                player_frame.call_soon(player_frame._on_media_ended)
+            response = {"status": "ok"}
+
+        elif path == '/player_error':
+            query = urllib.parse.parse_qs(query_string)
+            error_code = query.get('code', ['unknown'])[0]
+            print(f"Player error notification received: {error_code}")
+            if player_frame:
+                player_frame.call_soon(lambda: player_frame._on_player_error(error_code))
+            response = {"status": "ok"}
+
+        elif path == '/get_current_video':
+            response = {"video_id": "", "title": "", "audio_src": "", "audio_info": {}}
+            if player_frame:
+                if player_frame.current_video_id:
+                    response = {
+                        "video_id": player_frame.current_video_id,
+                        "title": player_frame.get_current_title(),
+                        "audio_src": "",
+                        "audio_info": {}
+                    }
+                elif player_frame.current_audio_src:
+                    response = {
+                        "video_id": "",
+                        "title": "",
+                        "audio_src": player_frame.current_audio_src,
+                        "audio_info": player_frame.current_audio_info or {}
+                    }
+
+        elif path == '/check_for_commands':
+            response = {"command": "none"}
+            if player_frame:
+                response = player_frame.pending_command
+                player_frame.pending_command = {"command": "none"}
+
+        elif path == '/skip_song':
+            print("Skip song command received")
+            if player_frame:
+                player_frame.call_soon(player_frame._skip_song)
+            response = {"status": "ok"}
+
+        else:
+            response = {"error": "unknown_command"}
+
+        return 200, 'application/json', json.dumps(response).encode(), {'Access-Control-Allow-Origin': '*'}
+
+    def _on_overlay_changed(self, version):
+        # Вызывается из любого потока, обновившего OverlayState
+        loop = self._loop
+        if loop and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._wake_overlay_waiters)
+            except RuntimeError:
+                pass  # Цикл уже остановлен
+
+    def _wake_overlay_waiters(self):
+        # Ожидающие держат событие своего поколения; новое событие - для следующих
+        self._overlay_changed.set()
+        self._overlay_changed = asyncio.Event()
+
+    async def _watch_overlay(self):
+        """Пока есть долгие опросы, проверяем изменения один раз на всех, а не в каждом запросе"""
+        while True:
+            await asyncio.sleep(REFRESH_INTERVAL)
+            if self._overlay_waiters:
+                self.overlay.refresh()
+
+    async def _wait_overlay_change(self, target):
+        """For /overlay?since=N&wait=S: wait until the version passes N or S seconds pass"""
+        parsed_path = urllib.parse.urlparse(target)
+        if parsed_path.path != '/overlay':
+            return
+        query = urllib.parse.parse_qs(parsed_path.query)
+        try:
+            since = int(query['since'][0])
+            wait = min(float(query['wait'][0]), OVERLAY_MAX_WAIT)
+        except (KeyError, ValueError):
+            return  # Обычный запрос; неверные параметры разберет _send_overlay
+        deadline = asyncio.get_running_loop().time() + wait
+        self._overlay_waiters += 1
+        try:
+            while self.overlay.refresh() <= since:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(self._overlay_changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return
+        finally:
+            self._overlay_waiters -= 1
+
+    async def _send_overlay(self, query_string, headers, writer, keep_alive, send_body=True):
+        """Overlay state: full document with ETag/304, or changes since a version.
+
+        /overlay?since=N returns only the fields changed after version N;
+        with &wait=S the request is first held (a coroutine, not a thread,
+        and outside the max_concurrency limit) until something changes or
+        S seconds pass, see _wait_overlay_change.
+        """
+        extra_headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag',
+            'Cache-Control': 'no-cache'
+        }
+        query = urllib.parse.parse_qs(query_string)
+        try:
+            since = int(query['since'][0]) if 'since' in query else None
+            float(query.get('wait', ['0'])[0])  # Ожидание уже прошло в _wait_overlay_change, здесь только проверка
+        except ValueError:
+            body = json.dumps({"error": "bad_request"}).encode()
+            self._write_head(writer, 400, 'application/json', len(body), keep_alive, extra_headers)
+            writer.write(body)
+            return keep_alive
+
+        self.overlay.refresh()
+        if since is not None:
+            delta = self.overlay.delta_since(since)
+            if delta is not None:
+                body = json.dumps(delta, ensure_ascii=False).encode('utf-8')
+                extra_headers['ETag'] = f'"{delta["version"]}"'
+                self._write_head(writer, 200, 'application/json; charset=utf-8', len(body), keep_alive, extra_headers)
+                if send_body:
+                    writer.write(body)
+                return keep_alive
+            # Версия слишком старая (или сервер перезапускался) - отдаем документ целиком
+
+        etag, body = self.overlay.full()
+        extra_headers['ETag'] = etag
+        if since is None and headers.get('if-none-match') == etag:
+            self._write_head(writer, 304, 'application/json', 0, keep_alive, extra_headers)
+            return keep_alive
+        self._write_head(writer, 200, 'application/json; charset=utf-8', len(body), keep_alive, extra_headers)
+        if send_body:
+            writer.write(body)
+        return keep_alive
+
+    async def _send_audio(self, path, writer, keep_alive, send_body=True):
+        """Stream a downloaded track from disk in chunks"""
+        audio_file = urllib.parse.unquote(path[7:])  # Удаляем префикс '/audio/'
+        if not os.path.isfile(audio_file):
+            print(f"Audio file not found: {audio_file}")
+            self._write_head(writer, 404, 'text/plain', 14, keep_alive)
+            writer.write(b'File not found')
+            return keep_alive
+
+        try:
+            f = open(audio_file, 'rb')
+            size = os.fstat(f.fileno()).st_size
+        except OSError as e:
+            print(f"Error serving audio file: {e}")
+            body = f"Error: {str(e)}".encode()
+            self._write_head(writer, 500, 'text/plain', len(body), keep_alive)
+            writer.write(body)
+            return keep_alive
+
+        print(f"Serving audio file: {audio_file}, size: {size} bytes")
+        # Треки Яндекса - mp3, в локальной папке бывают flac / ogg / m4a
+        content_type = mimetypes.guess_type(audio_file)[0] or 'audio/mpeg'
+        with f:
+            self._write_head(writer, 200, content_type, size, keep_alive, {'Access-Control-Allow-Origin': '*'})
+            if send_body:
+                while True:
+                    chunk = f.read(AUDIO_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+        return keep_alive
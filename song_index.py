@@ -0,0 +1,303 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+
+from metrics import get_metrics_registry
+from sqlite_store import BatchWriter, connect
+
+# Совпадение принимается, если оценка не ниже этой и заметно выше следующего кандидата
+MIN_SCORE = 0.7
+MIN_MARGIN = 0.1
+# Слово запроса считается найденным в тексте, если похоже на одно из его слов хотя бы так (опечатки)
+MIN_WORD_SIMILARITY = 0.75
+# Текст намного длиннее запроса (длинный заголовок, другой трек с теми же словами) не подходит
+MIN_DICE = 0.4
+# Короткие запросы ("love") совпадают со слишком многим - для них всегда идем в сеть
+MIN_QUERY_TRIGRAMS = 8
+MAX_ENTRIES = 5000
+MAX_ALIASES = 5  # Сколько прошлых текстов запроса помнить для трека
+CANDIDATES = 20
+# Другая версия песни: такой трек подходит, только если это слово есть и в запросе
+VARIANT_WORDS = {"remix", "cover", "live", "acoustic", "instrumental", "karaoke", "nightcore",
+                 "slowed", "sped", "reverb", "mashup", "ремикс", "кавер", "минус"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    source TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    artist TEXT,
+    duration REAL,
+    track_info TEXT,
+    aliases TEXT,
+    last_used REAL,
+    PRIMARY KEY (source, track_id)
+);
+"""
+
+UPSERT_SONG = """
+INSERT INTO songs (source, track_id, title, artist, duration, track_info, aliases, last_used)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, track_id) DO UPDATE SET
+    title = excluded.title, artist = excluded.artist, duration = excluded.duration,
+    track_info = excluded.track_info, aliases = excluded.aliases, last_used = excluded.last_used
+"""
+
+_index_instances = {}
+
+def get_song_index(db_path='song_index.db', max_entries=MAX_ENTRIES, min_score=MIN_SCORE):
+    """Get shared SongIndex for db_path"""
+    if db_path not in _index_instances:
+        _index_instances[db_path] = SongIndex(db_path, max_entries, min_score)
+    return _index_instances[db_path]
+
+def normalize(text):
+    """Lowercase words without punctuation"""
+    return " ".join(re.findall(r"\w+", text.lower().replace('ё', 'е')))
+
+def _word_found(word, entry_words):
+    if word in entry_words:
+        return True
+    # Короткие слова и числа должны совпадать точно: "2" и "3", "me" и "my" - разные песни
+    if len(word) <= 3 or word.isdigit():
+        return False
+    return any(SequenceMatcher(None, word, candidate).ratio() >= MIN_WORD_SIMILARITY
+               for candidate in entry_words)
+
+def trigrams(text):
+    """Character trigrams of each word of normalized text (words padded with spaces)"""
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+class TrigramIndex:
+    """In-memory trigram search over short texts; each key may have several texts"""
+
+    def __init__(self):
+        self._texts = {}     # ключ -> [(нормализованный текст, триграммы)]
+        self._postings = {}  # триграмма -> ключи
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, key, texts):
+        """Index texts (already normalized) under key, replacing what it had"""
+        self.remove(key)
+        entries = [(text, trigrams(text)) for text in texts if text]
+        self._texts[key] = entries
+        for gram in set().union(*(grams for _, grams in entries)):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        entries = self._texts.pop(key, None)
+        if not entries:
+            return
+        for gram in set().union(*(grams for _, grams in entries)):
+            keys = self._postings.get(gram)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def search(self, text, key_filter=None, min_query_trigrams=MIN_QUERY_TRIGRAMS):
+        """Best-first [(score, key)] for normalized text; score is 0..1"""
+        query_grams = trigrams(text)
+        if len(query_grams) < min_query_trigrams:
+            return []
+        query_words = set(text.split())
+
+        # Кандидаты - ключи с наибольшим числом общих триграмм
+        shared = Counter()
+        for gram in query_grams:
+            for key in self._postings.get(gram, ()):
+                if key_filter is None or key_filter(key):
+                    shared[key] += 1
+
+        scored = []
+        for key, _ in shared.most_common(CANDIDATES):
+            best = 0
+            for entry_text, grams in self._texts[key]:
+                common = len(query_grams & grams)
+                entry_words = set(entry_text.split())
+                # Другая версия песни (remix, live...) подходит, только если она есть и в запросе, и в тексте
+                if not common or (VARIANT_WORDS & entry_words) != (VARIANT_WORDS & query_words):
+                    continue
+                # Каждое слово запроса должно найтись в тексте: общий исполнитель
+                # не делает "imagine dragons thunder" песней "Imagine Dragons - Believer"
+                if not all(_word_found(word, entry_words) for word in query_words):
+                    continue
+                # Доля запроса, найденная в тексте, важнее похожести текстов целиком:
+                # "bohemian rhapsody" должен находить "Queen - Bohemian Rhapsody (Official Video)".
+                # Но текст, в котором запрос - лишь малая часть, не подходит совсем
+                coverage = common / len(query_grams)
+                dice = 2 * common / (len(query_grams) + len(grams))
+                if dice < MIN_DICE:
+                    continue
+                best = max(best, 0.75 * coverage + 0.25 * dice)
+            if best:
+                scored.append((best, key))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+class _Entry:
+    __slots__ = ("source", "track_id", "title", "artist", "duration", "track_info", "aliases", "last_used")
+
+    def __init__(self, source, track_id, title, artist, duration, track_info, aliases, last_used):
+        self.source = source
+        self.track_id = track_id
+        self.title = title
+        self.artist = artist
+        self.duration = duration
+        self.track_info = track_info
+        self.aliases = aliases
+        self.last_used = last_used
+
+    @property
+    def texts(self):
+        # Название с исполнителем и прошлые запросы сравниваются с запросом по отдельности
+        return [normalize(f"{self.artist} {self.title}")] + list(self.aliases)
+
+    @property
+    def key(self):
+        return (self.source, self.track_id)
+
+    def row(self):
+        return (self.source, self.track_id, self.title, self.artist, self.duration,
+                json.dumps(self.track_info, ensure_ascii=False) if self.track_info else None,
+                json.dumps(self.aliases, ensure_ascii=False), self.last_used)
+
+class SongIndex:
+    """Trigram index over titles/artists of resolved tracks and the texts that found them.
+
+    !sr texts are mostly variants of songs played before (typos, reordered
+    words, missing artist); a confident local match is used instead of a
+    yt-dlp / Yandex search. The index is kept in memory (at most
+    max_entries tracks, least recently used are dropped) and in SQLite.
+    """
+
+    def __init__(self, db_path='song_index.db', max_entries=MAX_ENTRIES, min_score=MIN_SCORE):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.min_score = min_score
+        self._entries = {}   # (source, track_id) -> _Entry
+        self._trigrams = TrigramIndex()
+        self._aliases = {}   # (source, нормализованный запрос) -> ключ трека
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+        self.metrics = get_metrics_registry()
+        self.metrics.describe("song_index_lookups_total", "Local song index lookups by result")
+        self.metrics.describe("song_index_entries", "Tracks in the local song index")
+        self.metrics.gauge_callback("song_index_entries", lambda: len(self._entries))
+
+        conn = connect(db_path)
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._writer = BatchWriter(db_path)
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def _load(self):
+        """Read the persisted index in the background (lookups miss until it's done)"""
+        try:
+            conn = connect(self.db_path)
+            rows = conn.execute(
+                "SELECT source, track_id, title, artist, duration, track_info, aliases, last_used "
+                "FROM songs ORDER BY last_used DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            conn.close()
+            with self._lock:
+                for source, track_id, title, artist, duration, track_info, aliases, last_used in reversed(rows):
+                    entry = _Entry(source, track_id, title, artist or "", duration,
+                                   json.loads(track_info) if track_info else None,
+                                   json.loads(aliases) if aliases else [], last_used or 0)
+                    self._insert(entry)
+            print(f"Song index loaded: {len(rows)} tracks")
+        except Exception as e:
+            print(f"Error loading song index: {e}")
+        finally:
+            self._loaded.set()
+
+    def _insert(self, entry):
+        old = self._entries.get(entry.key)
+        if old:
+            self._remove(old)
+        self._entries[entry.key] = entry
+        self._trigrams.add(entry.key, entry.texts)
+        for alias in entry.aliases:
+            self._aliases[(entry.source, alias)] = entry.key
+
+    def _remove(self, entry):
+        del self._entries[entry.key]
+        self._trigrams.remove(entry.key)
+        for alias in entry.aliases:
+            if self._aliases.get((entry.source, alias)) == entry.key:
+                del self._aliases[(entry.source, alias)]
+
+    def _evict(self):
+        """Drop the least recently used tenth of the index once it is over max_entries"""
+        if len(self._entries) <= self.max_entries:
+            return
+        count = len(self._entries) - self.max_entries + self.max_entries // 10
+        for entry in sorted(self._entries.values(), key=lambda e: e.last_used)[:count]:
+            self._remove(entry)
+            self._writer.execute("DELETE FROM songs WHERE source = ? AND track_id = ?", entry.key)
+
+    def add(self, source, track_id, title, duration, artist="", track_info=None, query=None):
+        """Index a resolved track; query is the request text that found it"""
+        alias = normalize(query) if query else None
+        with self._lock:
+            old = self._entries.get((source, track_id))
+            aliases = list(old.aliases) if old else []
+            if alias:
+                if alias in aliases:
+                    aliases.remove(alias)
+                aliases = (aliases + [alias])[-MAX_ALIASES:]
+            entry = _Entry(source, track_id, title, artist or "", duration, track_info, aliases, time.time())
+            self._insert(entry)
+            self._writer.execute(UPSERT_SONG, entry.row())
+            self._evict()
+
+    def lookup(self, query, source):
+        """Confident local match for query as {'id', 'title', 'duration', 'track_info'}, else None"""
+        if not self._loaded.is_set():
+            return None
+        text = normalize(query)
+        with self._lock:
+            # Точно такой же запрос уже находил этот трек
+            key = self._aliases.get((source, text))
+            entry = self._entries.get(key) if key else None
+            if entry is None:
+                entry = self._fuzzy_match(text, source)
+            if entry is None:
+                self.metrics.inc("song_index_lookups_total", labels={"result": "miss"})
+                return None
+
+            entry.last_used = time.time()
+            self._writer.execute("UPDATE songs SET last_used = ? WHERE source = ? AND track_id = ?",
+                                 (entry.last_used, entry.source, entry.track_id))
+            self.metrics.inc("song_index_lookups_total", labels={"result": "hit"})
+            return {
+                'id': entry.track_id,
+                'title': entry.title,
+                'duration': entry.duration,
+                'track_info': entry.track_info
+            }
+
+    def _fuzzy_match(self, text, source):
+        scored = self._trigrams.search(text, key_filter=lambda key: key[0] == source)
+        if not scored:
+            return None
+        best_score, best_key = scored[0]
+        second_score = scored[1][0] if len(scored) > 1 else 0
+        if best_score < self.min_score or best_score - second_score < MIN_MARGIN:
+            return None
+        return self._entries[best_key]
+
+    def close(self):
+        self._writer.close()
@@ -0,0 +1,68 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+# Записи накапливаются и пишутся одной транзакцией раз в это время
+BATCH_INTERVAL = 1.0
+
+def connect(db_path):
+    """SQLite connection in WAL mode, usable from any thread (callers serialize access)"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class BatchWriter:
+    """Background thread that runs queued write statements in batched transactions.
+
+    on_written(items) is called from the writer thread after each batch
+    with the (sql, params) items it committed.
+    """
+
+    def __init__(self, db_path, batch_interval=BATCH_INTERVAL, on_written=None):
+        self.db_path = db_path
+        self.batch_interval = batch_interval
+        self.on_written = on_written
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def execute(self, sql, params=()):
+        """Queue a statement; returns immediately"""
+        self._pending.put((sql, params))
+
+    def _run(self):
+        conn = connect(self.db_path)
+        stop = False
+        while not stop:
+            batch = [self._pending.get()]
+            time.sleep(self.batch_interval)
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            items = [item for item in batch if item is not None]
+            if not items:
+                continue
+            try:
+                with conn:
+                    for sql, params in items:
+                        conn.execute(sql, params)
+            except sqlite3.Error as e:
+                print(f"Error writing to {self.db_path}: {e}")
+
+            if self.on_written:
+                self.on_written(items)
+        conn.close()
+
+    def close(self):
+        """Write queued statements and stop the writer thread"""
+        if self._thread.is_alive():
+            self._pending.put(None)
+            self._thread.join(5)
@@ -0,0 +1,52 @@
+import pytest
+
+from song_index import SongIndex
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    index = SongIndex(str(tmp_path_factory.mktemp("index") / "song_index.db"))
+    index._loaded.wait(5)
+    index.add('youtube', 'believer', 'Imagine Dragons - Believer', 204)
+    index.add('youtube', 'radioactive', 'Imagine Dragons - Radioactive', 187)
+    index.add('youtube', 'blinding', 'The Weeknd - Blinding Lights (Official Video)', 200)
+    index.add('youtube', 'bohemian', 'Queen - Bohemian Rhapsody (Official Video)', 355)
+    yield index
+    index.close()
+
+def found(index, query, source='youtube'):
+    result = index.lookup(query, source)
+    return result and result['id']
+
+@pytest.mark.parametrize("query, expected", [
+    ("imagine dragons believer", "believer"),
+    ("imagine dragon beleiver", "believer"),      # опечатки
+    ("believer imagine dragons", "believer"),     # другой порядок слов
+    ("believer", "believer"),                     # без исполнителя
+    ("bohemian rhapsody", "bohemian"),
+    ("bohemian rapsody", "bohemian"),
+    ("weeknd blinding lights", "blinding"),
+])
+def test_finds_same_song(index, query, expected):
+    assert found(index, query) == expected
+
+@pytest.mark.parametrize("query", [
+    "imagine dragons thunder",          # другая песня того же исполнителя
+    "the weeknd save your tears",
+    "blinding lights remix",            # другая версия
+    "the weeknd blinding lights live",
+    "queen we will rock you",
+])
+def test_rejects_other_songs(index, query):
+    assert found(index, query) is None
+
+def test_variant_entry_needs_variant_in_query(index):
+    index.add('youtube', 'believer_live', 'Imagine Dragons - Believer (Live)', 210)
+    assert found(index, "imagine dragons believer live") == "believer_live"
+    assert found(index, "imagine dragons believer") == "believer"
+
+def test_sources_are_separate(index):
+    assert found(index, "imagine dragons believer", source='yandex') is None
+
+def test_remembered_query_text(index):
+    index.add('yandex', '123:456', 'Believer', 204, artist='Imagine Dragons', query='тот самый верующий трек')
+    assert found(index, "тот самый верующий трек", source='yandex') == '123:456'
@@ -0,0 +1,146 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+_tracer_instance = None
+
+def get_tracer():
+    """Get singleton instance of Tracer"""
+    global _tracer_instance
+    if _tracer_instance is None:
+        _tracer_instance = Tracer()
+    return _tracer_instance
+
+# Текущая трасса (живет в контексте потока / asyncio-задачи)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class _Trace:
+    def __init__(self, name, trace_id):
+        self.name = name
+        self.trace_id = trace_id
+        self.started_at = time.perf_counter()
+        self.events = []
+
+class Tracer:
+    """Span-based tracing of the song-request pipeline.
+
+    Each request gets a trace id; spans are written as Chrome trace events
+    (JSON array format, viewable in chrome://tracing or Perfetto), one file
+    for the whole session. When disabled, spans cost a context-var lookup.
+    """
+
+    def __init__(self, enabled=False, trace_file="sr_trace.json", slow_threshold=2.0):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.slow_threshold = slow_threshold
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def configure(self, enabled=None, trace_file=None, slow_threshold=None):
+        """Apply settings from the "tracing" config section"""
+        if enabled is not None:
+            self.enabled = enabled
+        if trace_file:
+            self.trace_file = trace_file
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+
+    def current_trace_id(self):
+        """Trace id of the active request, if any"""
+        trace = _current_trace.get()
+        return trace.trace_id if trace else None
+
+    def trace_start_time(self):
+        """perf_counter() timestamp at which the active trace started"""
+        trace = _current_trace.get()
+        return trace.started_at if trace else time.perf_counter()
+
+    @contextmanager
+    def trace(self, name, **args):
+        """Start a new trace (one song request) and its root span"""
+        if not self.enabled or _current_trace.get() is not None:
+            # Без трассировки или уже внутри трассы - просто вложенный спан
+            with self.span(name, **args):
+                yield self.current_trace_id()
+            return
+
+        trace = _Trace(name, uuid.uuid4().hex[:16])
+        token = _current_trace.set(trace)
+        start = trace.started_at
+        try:
+            with self.span(name, **args):
+                yield trace.trace_id
+        finally:
+            _current_trace.reset(token)
+            total = time.perf_counter() - start
+            self._write(trace.events)
+            if total >= self.slow_threshold:
+                self._report_slow(trace, total)
+
+    @contextmanager
+    def span(self, name, **args):
+        """Measure a stage of the current trace; no-op outside a trace"""
+        trace = _current_trace.get()
+        if trace is None:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), **args)
+
+    def record(self, name, start, end, **args):
+        """Add a finished span with explicit perf_counter() timestamps"""
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        event_args = {"trace_id": trace.trace_id}
+        event_args.update({key: str(value) for key, value in args.items()})
+        trace.events.append({
+            "name": name,
+            "cat": trace.name,
+            "ph": "X",
+            "ts": int(start * 1_000_000),
+            "dur": max(0, int((end - start) * 1_000_000)),
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+            "args": event_args,
+        })
+
+    def _write(self, events):
+        """Дописать события в файл трассы (закрывающая ']' в формате не обязательна)"""
+        if not events:
+            return
+        try:
+            with self._lock:
+                is_new = not os.path.exists(self.trace_file) or os.path.getsize(self.trace_file) == 0
+                with open(self.trace_file, 'a', encoding='utf-8') as f:
+                    if is_new:
+                        f.write("[\n")
+                    for event in events:
+                        f.write(json.dumps(event, ensure_ascii=False) + ",\n")
+        except Exception as e:
+            print(f"Error writing trace file: {e}")
+
+    def _report_slow(self, trace, total):
+        """Вывести самый медленный конечный этап медленного запроса"""
+        def contains(outer, inner):
+            return (outer is not inner and outer["tid"] == inner["tid"]
+                    and outer["ts"] <= inner["ts"]
+                    and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"])
+
+        # Листовые спаны - те, что не содержат других спанов
+        leaves = [event for event in trace.events
+                  if not any(contains(event, other) for other in trace.events)]
+        slowest = max(leaves, key=lambda event: event["dur"], default=None)
+        if slowest:
+            print(f"Slow request {trace.trace_id} ({trace.name}): {total:.2f}s, "
+                  f"slowest stage '{slowest['name']}' {slowest['dur'] / 1_000_000:.2f}s")
+        else:
+            print(f"Slow request {trace.trace_id} ({trace.name}): {total:.2f}s")
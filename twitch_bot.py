@@ -1,12 +1,21 @@
 from twitchio.ext import commands
+from twitchio import websocket as twitchio_websocket
+import aiohttp
 import asyncio
 import threading
+import time
+from metrics import get_metrics_registry
+from tracing import get_tracer
+
+# Адрес настоящего IRC Twitch (irc_server в конфиге подменяет его, например на fake_twitch_irc.py)
+TWITCH_IRC_HOST = twitchio_websocket.HOST
 
 class TwitchBot:
-    def __init__(self, config_manager, message_callback=None, music_player=None):
+    def __init__(self, config_manager, message_callback=None, music_player=None, music_players=None):
         self.config_manager = config_manager
         self.message_callback = message_callback
         self.music_player = music_player  # Add the music player reference
+        self.music_players = music_players or {}  # channel -> MusicPlayer (своя очередь у каждого канала)
         self.is_running = False
         self.bot_thread = None
         self.bot_instance = None
@@ -53,24 +62,24 @@ class TwitchBot:
             # Get credentials from config
             access_token = self.config_manager.get('access_token')
             bot_username = self.config_manager.get('bot_username')
-            channel = self.config_manager.get('channel', '')
+            channels = self.config_manager.get_channels()  # Без '#', первый - основной канал
+            irc_server = self.config_manager.get('irc_server', '')
             
-            if not access_token or not bot_username or not channel:
+            if not access_token or not bot_username or not channels:
                 raise ValueError("Missing required configuration for Twitch bot")
-            
-            # Make sure channel doesn't start with #
-            if channel.startswith('#'):
-                channel = channel[1:]
                 
             # Create the bot instance
             self.bot_instance = BotInstance(
                 token=access_token,
                 prefix='!',
-                initial_channels=[channel],  # Single channel as a list element
+                initial_channels=channels,
                 nick=bot_username,
                 message_callback=self.message_callback,
                 message_queue=self._message_queue,
-                music_player=self.music_player  # Pass the music player
+                music_player=self.music_player,  # Pass the music player
+                irc_server=irc_server,
+                music_players=self.music_players,
+                channel_settings={channel: self.config_manager.get_channel_settings(channel) for channel in channels}
             )
             
             # Start the message processor task
@@ -98,12 +107,12 @@ class TwitchBot:
         while self.is_running:
             try:
                 # Wait for a message in the queue
-                channel_name, content = await self._message_queue.get()
+                channel_name, content, queued_at = await self._message_queue.get()
                 
                 # If the bot is idle (not fully connected yet), wait a bit
                 if not self.bot_instance.is_ready:
                     await asyncio.sleep(0.5)
-                    self._message_queue.put_nowait((channel_name, content))  # Put it back in the queue
+                    self._message_queue.put_nowait((channel_name, content, queued_at))  # Put it back in the queue
                     continue
                 
                 # Try to find the channel
@@ -122,7 +131,10 @@ class TwitchBot:
                 try:
                     if channel:
                         # Send via channel object
-                        await channel.send(content)
+                        with get_metrics_registry().timer("chat_send_seconds", {"path": "queue"}):
+                            await channel.send(content)
+                        # Полное время от постановки в очередь до отправки
+                        get_metrics_registry().observe("chat_queue_latency_seconds", time.perf_counter() - queued_at)
                         print(f"Message sent to {channel_name} via channel object")
                     else:
                         # Use the ctx object from a dummy command handler
@@ -144,24 +156,23 @@ class TwitchBot:
                 print(f"Error in message processor: {str(e)}")
                 await asyncio.sleep(0.5)  # Brief pause before retry
     
-    def send_message(self, message):
-        """Queue a message to be sent to the channel."""
+    def send_message(self, message, channel=None):
+        """Queue a message to be sent to a channel (the main channel by default)."""
         if not self.is_running or not self._loop:
             return False
         
         try:
-            # Get the channel name from config
-            channel = self.config_manager.get('channel', '')
             if not channel:
-                return False
-            
-            # Remove # if present
-            if channel.startswith('#'):
-                channel = channel[1:]
+                # Основной канал из конфига
+                channels = self.config_manager.get_channels()
+                if not channels:
+                    return False
+                channel = channels[0]
+            channel = channel.lstrip('#')
             
             # Put the message in the queue via the event loop
             asyncio.run_coroutine_threadsafe(
-                self._message_queue.put((channel, message)), 
+                self._message_queue.put((channel, message, time.perf_counter())), 
                 self._loop
             )
             
@@ -177,10 +188,13 @@ class TwitchBot:
 
 # Actual Bot Implementation
 class BotInstance(commands.Bot):
-    def __init__(self, token, prefix, initial_channels, nick, message_callback=None, message_queue=None, music_player=None):
+    def __init__(self, token, prefix, initial_channels, nick, message_callback=None, message_queue=None, music_player=None,
+                 irc_server=None, music_players=None, channel_settings=None):
         self.message_callback = message_callback
         self.message_queue = message_queue
         self.music_player = music_player  # Add the music player reference
+        self.music_players = {channel.lower(): player for channel, player in (music_players or {}).items()}
+        self.channel_settings = channel_settings or {}
         self.is_ready = False
         
         # Initialize the parent class
@@ -190,6 +204,20 @@ class BotInstance(commands.Bot):
             initial_channels=initial_channels,
             nick=nick,
         )
+        
+        # twitchio читает адрес сервера из глобальной переменной модуля при подключении
+        self.irc_server = irc_server
+        twitchio_websocket.HOST = irc_server or TWITCH_IRC_HOST
+        if irc_server:
+            # Локальный сервер: ник известен, проверка токена через Twitch API не нужна
+            self._http.nick = nick
+
+    async def start(self):
+        """Connect to Twitch (or to the local irc_server)."""
+        if self.irc_server and not self._http.session:
+            # Обычно сессию создает проверка токена, которую мы пропускаем
+            self._http.session = aiohttp.ClientSession()
+        await super().start()
 
     async def event_ready(self):
         """Called when the bot is ready."""
@@ -213,10 +241,34 @@ class BotInstance(commands.Bot):
         # Notify the UI about the new message
         if self.message_callback:
             formatted_message = f"{message.author.name}: {message.content}"
+            if len(self.music_players) > 1 and message.channel:
+                formatted_message = f"[#{message.channel.name}] {formatted_message}"
             self.message_callback(formatted_message)
             
-        # Process commands
-        await self.handle_commands(message)
+        # Process commands (каждая команда - отдельная трасса)
+        if message.content and message.content.startswith('!'):
+            command = message.content.split(maxsplit=1)[0]
+            with get_tracer().trace("chat_command", command=command, user=message.author.name):
+                await self.handle_commands(message)
+        else:
+            await self.handle_commands(message)
+    
+    def _player_for(self, ctx):
+        """MusicPlayer with the queue of the channel the command came from."""
+        if self.music_players and ctx.channel:
+            player = self.music_players.get(ctx.channel.name.lower())
+            if player:
+                return player
+        return self.music_player
+    
+    def _is_moderator(self, ctx):
+        """Mod, broadcaster or a moderator listed in channel_settings of this channel."""
+        author = ctx.author.name.lower()
+        channel = ctx.channel.name.lower()
+        if ctx.author.is_mod or author == channel:
+            return True
+        moderators = self.channel_settings.get(channel, {}).get("moderators", [])
+        return author in [name.lower() for name in moderators]
     
     @commands.command(name='hello')
     async def hello_command(self, ctx):
@@ -237,39 +289,47 @@ class BotInstance(commands.Bot):
     @commands.command(name='sr')
     async def song_request(self, ctx, *, query: str):
         """Request a song to be played (!sr <song name or YouTube URL>)."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        tracer = get_tracer()
+        # Время от получения сообщения до вызова обработчика команды
+        tracer.record("twitchio_dispatch", tracer.trace_start_time(), time.perf_counter())
+        
+        if not music_player:
             await ctx.send("Music player is not available.")
             return
             
-        success, message = self.music_player.add_to_queue(query, ctx.author.name)
-        await ctx.send(message)
+        with get_metrics_registry().timer("sr_request_seconds", {"command": "sr"}):
+            success, message = music_player.add_to_queue(query, ctx.author.name)
+        with get_metrics_registry().timer("chat_send_seconds", {"path": "reply"}), tracer.span("ctx_send"):
+            await ctx.send(message)
     
     @commands.command(name='queue', aliases=['q'])
     async def show_queue(self, ctx):
         """Show the current song queue."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
             await ctx.send("Музыкальный плеер недоступен.")
             return
         
         # Если очередь пуста
-        if not self.music_player.queue and not self.music_player.current_song:
+        if not music_player.queue and not music_player.current_song:
             await ctx.send("Очередь пуста. Добавьте песню командой !sr <название или YouTube URL>")
             return
         
         # Показать текущую песню и следующие несколько
         response = ""
-        if self.music_player.current_song:
-            response = f"Сейчас играет: {self.music_player.current_song.title}. "
+        if music_player.current_song:
+            response = f"Сейчас играет: {music_player.current_song.title}. "
         
-        if self.music_player.queue:
+        if music_player.queue:
             response += "В очереди: "
             # Показываем до 3 песен, чтобы избежать слишком длинного сообщения
-            songs_to_show = min(3, len(self.music_player.queue))
-            song_titles = [f"{i+1}. {song.title}" for i, song in enumerate(self.music_player.queue[:songs_to_show])]
+            songs_to_show = min(3, len(music_player.queue))
+            song_titles = [f"{i+1}. {song.title}" for i, song in enumerate(music_player.queue[:songs_to_show])]
             response += ", ".join(song_titles)
             
-            if len(self.music_player.queue) > songs_to_show:
-                response += f" и ещё {len(self.music_player.queue) - songs_to_show} песен"
+            if len(music_player.queue) > songs_to_show:
+                response += f" и ещё {len(music_player.queue) - songs_to_show} песен"
         else:
             response += "В очереди больше нет песен."
         
@@ -278,11 +338,12 @@ class BotInstance(commands.Bot):
     @commands.command(name='np', aliases=['nowplaying'])
     async def now_playing(self, ctx):
         """Show what song is currently playing."""
-        if not self.music_player or not self.music_player.current_song:
+        music_player = self._player_for(ctx)
+        if not music_player or not music_player.current_song:
             await ctx.send("Сейчас ничего не играет.")
             return
         
-        song = self.music_player.current_song
+        song = music_player.current_song
         # Преобразуем duration в целое число для безопасного форматирования
         duration_min = int(song.duration // 60)
         duration_sec = int(song.duration % 60)
@@ -292,27 +353,28 @@ class BotInstance(commands.Bot):
     @commands.command(name='skipsong')
     async def skip_song(self, ctx):
         """Skip the current song."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
             await ctx.send("Музыкальный плеер не инициализирован.")
             return
         
         # Check if user is mod/broadcaster or the requester of the current song
-        is_mod = ctx.author.is_mod or ctx.author.name.lower() == ctx.channel.name.lower()
-        is_requester = (self.music_player.current_song and 
-                       self.music_player.current_song.requester.lower() == ctx.author.name.lower())
+        is_mod = self._is_moderator(ctx)
+        is_requester = (music_player.current_song and 
+                       music_player.current_song.requester.lower() == ctx.author.name.lower())
         
         if not is_mod and not is_requester:
             await ctx.send(f"@{ctx.author.name} Только модераторы и тот, кто запросил песню, могут пропускать песни.")
             return
         
         # Проверка, есть ли текущая песня для пропуска
-        if not self.music_player.current_song:
+        if not music_player.current_song:
             await ctx.send("Сейчас ничего не играет.")
             return
         
         # Теперь используем напрямую метод skip_song из music_player
         # который правильно обрабатывает случай отсутствия песен в очереди
-        success, message = self.music_player.skip_song()
+        success, message = music_player.skip_song()
         
         # Отправляем результат в чат
         await ctx.send(message)
@@ -320,28 +382,30 @@ class BotInstance(commands.Bot):
     @commands.command(name='wrongsong')
     async def wrong_song(self, ctx):
         """Remove the last song you requested from the queue."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
             await ctx.send("Music player is not available.")
             return
             
-        success, message = self.music_player.wrong_song(ctx.author.name)
+        success, message = music_player.wrong_song(ctx.author.name)
         await ctx.send(message)
     
     @commands.command(name='volume')
     async def volume_command(self, ctx, volume=None):
         """Set player volume"""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
             return
             
         # Проверка прав: если запрашивают текущую громкость - показываем всем
         if volume is None:
             # Get current volume
-            current_volume = self.music_player.volume
+            current_volume = music_player.volume
             await ctx.send(f"Текущая громкость: {current_volume}%")
             return
         
         # Если пытаются изменить громкость - проверяем права
-        if not (ctx.author.is_mod or ctx.author.name.lower() == ctx.channel.name.lower()):
+        if not self._is_moderator(ctx):
             await ctx.send("Только модераторы могут менять громкость!")
             return
         
@@ -356,7 +420,7 @@ class BotInstance(commands.Bot):
                 volume_value = 100
                 
             # Set the volume in the music player
-            success = self.music_player.set_volume(volume_value)
+            success = music_player.set_volume(volume_value)
             
             if success:
                 await ctx.send(f"Громкость установлена на {volume_value}%")
@@ -365,8 +429,6 @@ class BotInstance(commands.Bot):
                 # Сохраняем новое значение громкости в конфигурации
                 if hasattr(self, 'config_manager') and self.config_manager:
                     self.config_manager.set_player_volume(volume_value)
-                    self.config_manager.save_config()
-                    print("Volume setting saved to configuration")
                 
             else:
                 await ctx.send("Не удалось установить громкость")
@@ -379,42 +441,76 @@ class BotInstance(commands.Bot):
     @commands.command(name='play')
     async def play(self, ctx):
         """Start or resume playback."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
             await ctx.send("Music player is not available.")
             return
             
-        success, message = self.music_player.toggle_playback()
+        success, message = music_player.toggle_playback()
         await ctx.send(message)
     
     @commands.command(name='stop')
     async def stop(self, ctx):
         """Stop playback."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
             await ctx.send("Music player is not available.")
             return
         
         # Check if user is a mod or broadcaster
-        if not (ctx.author.is_mod or ctx.author.name.lower() == ctx.channel.name.lower()):
+        if not self._is_moderator(ctx):
             await ctx.send("Only moderators can stop the player.")
             return
             
-        success, message = self.music_player.stop_playback()
+        success, message = music_player.stop_playback()
         await ctx.send(message)
     
     @commands.command(name='ymsr')
     async def yandex_music_request(self, ctx, *, query: str):
         """Request a song from Yandex Music (!ymsr <song name>)."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
+            await ctx.send("Музыкальный плеер недоступен.")
+            return
+            
+        with get_metrics_registry().timer("sr_request_seconds", {"command": "ymsr"}):
+            success, message = music_player.add_to_queue(query, ctx.author.name, source='yandex')
+        await ctx.send(message)
+    
+    @commands.command(name='playlist')
+    async def playlist_request(self, ctx, url: str, limit: str = None):
+        """Add a YouTube playlist to the queue, mods only (!playlist <url> [count])."""
+        music_player = self._player_for(ctx)
+        if not music_player:
+            await ctx.send("Музыкальный плеер недоступен.")
+            return
+        
+        if not self._is_moderator(ctx):
+            await ctx.send(f"@{ctx.author.name} Добавлять плейлисты могут только модераторы.")
+            return
+        
+        count = int(limit) if limit and limit.isdigit() else None
+        # Треки добавляются в фоне; итог придет через message_callback
+        success, message = music_player.import_playlist(url, ctx.author.name, count)
+        await ctx.send(message)
+    
+    @commands.command(name='lsr')
+    async def local_song_request(self, ctx, *, query: str):
+        """Request a song from the local music folder (!lsr <song name>)."""
+        music_player = self._player_for(ctx)
+        if not music_player:
             await ctx.send("Музыкальный плеер недоступен.")
             return
             
-        success, message = self.music_player.add_to_queue(query, ctx.author.name, source='yandex')
+        with get_metrics_registry().timer("sr_request_seconds", {"command": "lsr"}):
+            success, message = music_player.add_to_queue(query, ctx.author.name, source='local')
         await ctx.send(message)
     
     @commands.command(name='mywave')
     async def my_wave(self, ctx, count: str = "3"):
         """Add songs from My Wave to the queue (!mywave [count])."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
             await ctx.send("Музыкальный плеер недоступен.")
             return
         
@@ -426,20 +522,21 @@ class BotInstance(commands.Bot):
         except ValueError:
             count_num = 3  # Default if invalid
             
-        success, message = self.music_player.add_yandex_wave_tracks(count_num)
+        success, message = music_player.add_yandex_wave_tracks(count_num)
         await ctx.send(message)
     
     @commands.command(name='togglewave')
     async def toggle_wave(self, ctx):
         """Toggle automatic addition of tracks from My Wave when queue is empty."""
-        if not self.music_player:
+        music_player = self._player_for(ctx)
+        if not music_player:
             await ctx.send("Музыкальный плеер недоступен.")
             return
         
         # Check if user is a mod or broadcaster
-        if not (ctx.author.is_mod or ctx.author.name.lower() == ctx.channel.name.lower()):
+        if not self._is_moderator(ctx):
             await ctx.send("Только модераторы могут изменять настройки Моей Волны.")
             return
             
-        success, message = self.music_player.toggle_auto_play_from_wave()
+        success, message = music_player.toggle_auto_play_from_wave()
         await ctx.send(message)
\ No newline at end of file
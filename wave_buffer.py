@@ -0,0 +1,127 @@
+import threading
+from collections import deque
+
+class WaveBuffer:
+    """Rolling buffer of "My Wave" tracks.
+
+    Keeps every track of a fetched rotor batch instead of discarding the tail,
+    continues the station sequence from the last buffered track, and refills
+    in the background whenever the buffer drops below the low watermark.
+    """
+
+    def __init__(self, yandex_api, low_watermark=10, high_watermark=40, max_batches_per_refill=5):
+        self.yandex_api = yandex_api
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.max_batches_per_refill = max_batches_per_refill
+
+        self._tracks = deque()
+        self._recent_ids = deque(maxlen=500)  # Чтобы не повторять треки между пачками
+        self._last_track_id = None
+        self._lock = threading.Lock()
+        self._refill_thread = None
+        self._refill_callbacks = []
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tracks)
+
+    def clear(self):
+        """Сбросить буфер (например, при смене токена)"""
+        with self._lock:
+            self._tracks.clear()
+            self._recent_ids.clear()
+            self._last_track_id = None
+
+    def take(self, count, wait=False, timeout=15):
+        """Take up to count buffered tracks.
+
+        Without wait this is a purely local operation; a background refill is
+        started if the buffer runs low. With wait the call blocks (up to timeout)
+        on a refill when the buffer has fewer than count tracks.
+        """
+        tracks = self._pop(count)
+
+        if wait and len(tracks) < count:
+            thread = self.request_refill(force=True)
+            if thread:
+                thread.join(timeout)
+            tracks.extend(self._pop(count - len(tracks)))
+
+        self.request_refill()
+        return tracks
+
+    def _pop(self, count):
+        with self._lock:
+            tracks = []
+            while self._tracks and len(tracks) < count:
+                tracks.append(self._tracks.popleft())
+            return tracks
+
+    def request_refill(self, on_refilled=None, force=False):
+        """Start a background refill if the buffer is below the low watermark
+        (or below the high watermark when force is set).
+
+        on_refilled is called from the refill thread after new tracks arrived.
+        Returns the running refill thread or None.
+        """
+        with self._lock:
+            if on_refilled and callable(on_refilled):
+                self._refill_callbacks.append(on_refilled)
+
+            if self._refill_thread and self._refill_thread.is_alive():
+                return self._refill_thread
+
+            threshold = self.high_watermark if force else self.low_watermark
+            if len(self._tracks) >= threshold:
+                callbacks = self._refill_callbacks
+                self._refill_callbacks = []
+            else:
+                self._refill_thread = threading.Thread(target=self._refill, daemon=True)
+                self._refill_thread.start()
+                return self._refill_thread
+
+        # Треков уже достаточно - сразу сообщаем ожидающим
+        self._notify(callbacks)
+        return None
+
+    def _refill(self):
+        """Догружает пачки, пока буфер не достигнет верхней отметки"""
+        added = 0
+        try:
+            for _ in range(self.max_batches_per_refill):
+                with self._lock:
+                    if len(self._tracks) >= self.high_watermark:
+                        break
+                    last_track_id = self._last_track_id
+
+                batch = self.yandex_api.fetch_wave_batch(last_track_id)
+                if not batch:
+                    break
+
+                with self._lock:
+                    for track in batch:
+                        if track['id'] in self._recent_ids:
+                            continue
+                        self._recent_ids.append(track['id'])
+                        self._tracks.append(track)
+                        added += 1
+                    self._last_track_id = batch[-1]['id']
+
+            print(f"Wave buffer refilled: +{added} tracks, {len(self)} buffered")
+        except Exception as e:
+            print(f"Error refilling wave buffer: {e}")
+        finally:
+            with self._lock:
+                callbacks = self._refill_callbacks
+                self._refill_callbacks = []
+
+        if added:
+            self._notify(callbacks)
+
+    def _notify(self, callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in wave buffer callback: {e}")
@@ -6,6 +6,12 @@ import tempfile
 import threading
 import shutil
 from urllib.parse import urlparse, parse_qs
+from wave_buffer import WaveBuffer
+from yandex_track_cache import YandexTrackCache
+from bitrate_policy import BitratePolicy
+from downloader import download_file
+from metrics import get_metrics_registry
+from endpoints import get_endpoints
 
 try:
     from yandex_music import Client
@@ -14,14 +20,45 @@ except ImportError:
     print("Yandex Music API not installed.")
     HAS_YANDEX_MUSIC = False
 
+# Состояния авторизации
+AUTH_UNAUTHORIZED = "unauthorized"
+AUTH_AUTHORIZING = "authorizing"
+AUTH_READY = "ready"
+AUTH_FAILED = "failed"
+
+# Сколько секунд считаем проверенный токен действительным (без повторного Client.init())
+TOKEN_CHECK_TTL = 12 * 60 * 60
+# Сколько секунд запросы ждут завершения фоновой авторизации
+AUTH_WAIT_TIMEOUT = 15
+# Битрейты mp3, в которых Яндекс отдает треки
+BITRATES = (64, 128, 192, 320)
+
 class YandexMusicAPI:
     """Helper class for Yandex Music API operations"""
     
     def __init__(self):
         self.client = None
-        self.is_authorized = False
         self.token = None
         self.token_file = "yandex_token.json"
+        self.token_validated_at = 0
+        self.token_in_use = None  # Токен, для которого заполнен буфер Моей Волны
+        
+        # Состояние авторизации; запросы ждут _ready_event, пока идет авторизация
+        self.auth_state = AUTH_UNAUTHORIZED
+        self._auth_lock = threading.Lock()
+        self._auth_generation = 0
+        self._ready_event = threading.Event()
+        self._ready_event.set()
+        
+        # Буфер треков Моей Волны (пополняется в фоне)
+        self.wave_buffer = WaveBuffer(self)
+        # Уже полученные треки и ссылки на скачивание (чтобы не запрашивать их повторно)
+        self.track_cache = YandexTrackCache(self)
+        # Выбор битрейта по измеренной скорости загрузки (настраивается приложением)
+        self.bitrate_policy = BitratePolicy()
+        self._upgrading = set()
+        self._upgrade_lock = threading.Lock()
+        
         self.temp_dir = os.path.join(tempfile.gettempdir(), "yandex_music_bot")
         
         # Создаем временную папку, если её нет
@@ -30,15 +67,26 @@ class YandexMusicAPI:
             
         self.load_token()
     
+    @property
+    def is_authorized(self):
+        """True, если клиент готов к запросам"""
+        return self.auth_state == AUTH_READY
+    
+    @property
+    def is_authorizing(self):
+        """True, пока идет фоновая авторизация"""
+        return self.auth_state == AUTH_AUTHORIZING
+    
     def load_token(self):
-        """Load token from file if available"""
+        """Load token from file if available and authorize in background"""
         try:
             if os.path.exists(self.token_file):
                 with open(self.token_file, 'r') as f:
                     data = json.load(f)
                     self.token = data.get('token', None)
+                    validated_at = data.get('validated_at', 0)
                     if self.token:
-                        self.authorize(self.token)
+                        self.authorize_async(self.token, validated_at=validated_at)
         except Exception as e:
             print(f"Error loading Yandex Music token: {e}")
     
@@ -46,26 +94,92 @@ class YandexMusicAPI:
         """Save token to file"""
         try:
             with open(self.token_file, 'w') as f:
-                json.dump({'token': self.token}, f)
+                json.dump({'token': self.token, 'validated_at': self.token_validated_at}, f)
         except Exception as e:
             print(f"Error saving Yandex Music token: {e}")
     
+    def _begin_authorization(self, token):
+        """Переводит API в состояние 'authorizing' и возвращает номер попытки"""
+        with self._auth_lock:
+            self._auth_generation += 1
+            self.token = token
+            self.auth_state = AUTH_AUTHORIZING
+            self._ready_event.clear()
+            # Треки из буфера Моей Волны относятся к прежнему аккаунту
+            if token != self.token_in_use:
+                self.wave_buffer.clear()
+                self.track_cache.clear()
+            self.token_in_use = token
+            return self._auth_generation
+    
+    def _finish_authorization(self, generation, client, validated_at):
+        """Фиксирует результат попытки, если она не устарела"""
+        with self._auth_lock:
+            if generation != self._auth_generation:
+                # Пока мы авторизовались, был установлен другой токен
+                return False
+            if client is not None:
+                self.client = client
+                self.token_validated_at = validated_at
+                self.auth_state = AUTH_READY
+            else:
+                self.client = None
+                self.auth_state = AUTH_FAILED
+            self._ready_event.set()
+            return client is not None
+    
+    def _run_authorization(self, generation, token, validated_at=0):
+        """Создает клиент; Client.init() пропускается, если токен недавно проверен"""
+        try:
+            endpoints = get_endpoints()
+            base_url = endpoints.base("yandex_music_api") if endpoints.is_overridden("yandex_music_api") else None
+            if validated_at and time.time() - validated_at < TOKEN_CHECK_TTL:
+                client = Client(token, base_url=base_url)
+            else:
+                client = Client(token, base_url=base_url).init()
+                validated_at = time.time()
+        except Exception as e:
+            print(f"Yandex Music authorization failed: {e}")
+            return self._finish_authorization(generation, None, 0)
+        
+        success = self._finish_authorization(generation, client, validated_at)
+        if success:
+            self.save_token()
+        return success
+    
     def authorize(self, token):
         """Authorize with Yandex Music using token"""
         if not HAS_YANDEX_MUSIC:
             print("Yandex Music API not installed")
+            self.auth_state = AUTH_FAILED
             return False
         
-        try:
-            self.token = token
-            self.client = Client(token).init()
-            self.is_authorized = True
-            self.save_token()
-            return True
-        except Exception as e:
-            print(f"Yandex Music authorization failed: {e}")
-            self.is_authorized = False
-            return False
+        generation = self._begin_authorization(token)
+        return self._run_authorization(generation, token)
+    
+    def authorize_async(self, token, validated_at=0, callback=None):
+        """Авторизоваться в фоне; запросы будут ждать результата"""
+        if not HAS_YANDEX_MUSIC:
+            print("Yandex Music API not installed")
+            self.auth_state = AUTH_FAILED
+            return None
+        
+        generation = self._begin_authorization(token)
+        
+        def authorize_and_callback():
+            success = self._run_authorization(generation, token, validated_at)
+            if callback and callable(callback):
+                callback(success)
+        
+        thread = threading.Thread(target=authorize_and_callback, daemon=True)
+        thread.start()
+        return thread
+    
+    def wait_until_ready(self, timeout=AUTH_WAIT_TIMEOUT):
+        """Дождаться окончания авторизации; True, если клиент готов"""
+        if self.auth_state == AUTH_AUTHORIZING:
+            self._ready_event.wait(timeout)
+        return self.is_authorized
     
     def open_auth_page(self):
         """Open Yandex OAuth page in browser"""
@@ -91,10 +205,13 @@ class YandexMusicAPI:
     
     def get_user_info(self):
         """Get user info to test connection"""
-        if not self.is_authorized:
+        if not self.wait_until_ready():
             return None
         
         try:
+            # Если Client.init() был пропущен по кешу, получаем статус аккаунта сейчас
+            if self.client.me is None:
+                self.client.init()
             return self.client.me
         except Exception as e:
             print(f"Error getting user info: {e}")
@@ -102,12 +219,13 @@ class YandexMusicAPI:
     
     def search_track(self, query, limit=10):
         """Search tracks by query"""
-        if not self.is_authorized:
+        if not self.wait_until_ready():
             return []
         
         try:
             result = self.client.search(query, type_="track")
             if result and result.tracks and result.tracks.results:
+                self.track_cache.remember(result.tracks.results)
                 return result.tracks.results[:limit]
             return []
         except Exception as e:
@@ -115,42 +233,44 @@ class YandexMusicAPI:
             return []
     
     def get_wave_tracks(self, count=1):
-        """Get tracks from user's personal wave"""
-        if not self.is_authorized:
+        """Get tracks from user's personal wave (served from the wave buffer)"""
+        if not self.wait_until_ready():
+            return []
+        
+        return self.wave_buffer.take(count, wait=True)
+    
+    def _wave_track_info(self, track):
+        """Преобразует трек Моей Волны в словарь track_info"""
+        # Extract artists
+        artists = [artist.name for artist in track.artists] if track.artists else ["Unknown Artist"]
+        
+        # Extract album info
+        album_id = track.albums[0].id if track.albums else None
+        
+        return {
+            'id': track.id,
+            'album_id': album_id,
+            'title': track.title,
+            'artists': artists,
+            'duration': track.duration_ms / 1000,  # Convert to seconds
+        }
+    
+    def fetch_wave_batch(self, last_track_id=None):
+        """Fetch one whole batch from My Wave, continuing after last_track_id"""
+        if not self.wait_until_ready():
             return []
         
         try:
             # Get station with ID "user:onyourwave"
             station_id = "user:onyourwave"
             
-            # Get batch of tracks from personal wave
-            station_tracks = self.client.rotor_station_tracks(station_id)
+            # Get batch of tracks from personal wave; queue продолжает последовательность станции
+            station_tracks = self.client.rotor_station_tracks(station_id, queue=last_track_id)
             
             # Preprocess tracks to extract required info
-            tracks = []
-            for batch in station_tracks.sequence:
-                if len(tracks) >= count:
-                    break
-                    
-                track = batch.track
-                if not track:
-                    continue
-                    
-                # Extract artists
-                artists = [artist.name for artist in track.artists] if track.artists else ["Unknown Artist"]
-                
-                # Extract album info
-                album_id = track.albums[0].id if track.albums else None
-                
-                tracks.append({
-                    'id': track.id,
-                    'album_id': album_id,
-                    'title': track.title,
-                    'artists': artists,
-                    'duration': track.duration_ms / 1000,  # Convert to seconds
-                })
-            
-            return tracks[:count]
+            tracks = [item.track for item in station_tracks.sequence if item.track]
+            self.track_cache.remember(tracks)
+            return [self._wave_track_info(track) for track in tracks]
         except Exception as e:
             print(f"Error getting wave tracks: {e}")
             
@@ -174,73 +294,124 @@ class YandexMusicAPI:
                 # Get tracks from the station
                 batch = self.client.rotor_station_tracks(
                     station=wave_station.id.station_id,
-                    settings2=wave_station.id
+                    settings2=wave_station.id,
+                    queue=last_track_id
                 )
                 
-                # Process tracks
-                tracks = []
-                for sequence_item in batch.sequence:
-                    if len(tracks) >= count:
-                        break
-                        
-                    track = sequence_item.track
-                    if not track:
-                        continue
-                        
-                    # Extract artists
-                    artists = [artist.name for artist in track.artists] if track.artists else ["Unknown Artist"]
-                    
-                    # Extract album info
-                    album_id = track.albums[0].id if track.albums else None
-                    
-                    tracks.append({
-                        'id': track.id,
-                        'album_id': album_id,
-                        'title': track.title,
-                        'artists': artists,
-                        'duration': track.duration_ms / 1000,  # Convert to seconds
-                    })
-                
-                return tracks[:count]
+                tracks = [item.track for item in batch.sequence if item.track]
+                self.track_cache.remember(tracks)
+                return [self._wave_track_info(track) for track in tracks]
                 
             except Exception as backup_error:
                 print(f"Alternative method also failed: {backup_error}")
                 return []
     
+    def _track_path(self, track_info, bitrate):
+        """Путь к локальной копии трека в заданном битрейте"""
+        # Создаем имя файла на основе информации о треке
+        artists_str = "_".join(track_info.get('artists', ['Unknown']))
+        title = track_info.get('title', 'Unknown')
+        filename = f"{artists_str} - {title} [{bitrate}].mp3"
+        # Заменяем недопустимые символы для файловой системы
+        for char in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']:
+            filename = filename.replace(char, '_')
+        return os.path.join(self.temp_dir, filename)
+    
+    def _cached_copy(self, track_info):
+        """(битрейт, путь) лучшей уже скачанной копии или (None, None)"""
+        for bitrate in sorted(BITRATES, reverse=True):
+            path = self._track_path(track_info, bitrate)
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                return bitrate, path
+        return None, None
+    
+    def _download_variant(self, track_id, bitrate, local_path):
+        """Скачать трек в заданном битрейте; скорость загрузки учитывается политикой"""
+        info = self.track_cache.download_info(track_id, bitrate=bitrate)
+        if info is None:
+            return False
+        # Обрывы соединения докачиваются внутри download_file; файл появляется под именем кеша только целиком.
+        # Как и клиент yandex_music, токен в хранилище не отправляем - только прокси
+        proxies = self.client.request.proxies
+        started = time.perf_counter()
+        try:
+            size = download_file(info.direct_link, local_path, proxies=proxies)
+        except Exception as e:
+            # Сохраненная ссылка могла устареть - одна попытка со свежей
+            print(f"Download with cached link failed ({e}), retrying with a fresh one")
+            self.track_cache.invalidate(track_id)
+            info = self.track_cache.download_info(track_id, bitrate=bitrate, fresh=True)
+            if info is None:
+                return False
+            started = time.perf_counter()
+            size = download_file(info.direct_link, local_path, proxies=proxies)
+        self.bitrate_policy.record(size, time.perf_counter() - started)
+        get_metrics_registry().inc("yandex_download_bitrate_total", labels={"bitrate": str(bitrate)})
+        return True
+    
+    def _upgrade_async(self, track_info, current_bitrate):
+        """Докачать копию в лучшем битрейте в фоне; текущее воспроизведение не трогаем"""
+        track_id = track_info['id']
+        with self._upgrade_lock:
+            if track_id in self._upgrading:
+                return
+            self._upgrading.add(track_id)
+        
+        def upgrade():
+            bitrate = None
+            try:
+                bitrates = [b for b in self.track_cache.bitrates(track_id) if b <= self.bitrate_policy.max_bitrate]
+                bitrate = max(bitrates, default=0)
+                if bitrate <= current_bitrate:
+                    return
+                if self._download_variant(track_id, bitrate, self._track_path(track_info, bitrate)):
+                    print(f"Upgraded cached copy of {track_info.get('title')} to {bitrate} kbps")
+            except Exception as e:
+                print(f"Error upgrading track {track_id} to {bitrate} kbps: {e}")
+            finally:
+                with self._upgrade_lock:
+                    self._upgrading.discard(track_id)
+        
+        threading.Thread(target=upgrade, daemon=True).start()
+    
     def download_track(self, track_info):
         """Download a track and return the local path"""
-        if not self.is_authorized:
+        if not self.wait_until_ready():
             print("Not authorized to download tracks")
             return None
             
         try:
             track_id = track_info['id']
-            album_id = track_info.get('album_id')
+            title = track_info.get('title', 'Unknown')
             
             print(f"Starting download of track ID: {track_id}")
             
-            # Создаем имя файла на основе информации о треке
-            artists_str = "_".join(track_info.get('artists', ['Unknown']))
-            title = track_info.get('title', 'Unknown')
-            filename = f"{artists_str} - {title}.mp3"
-            # Заменяем недопустимые символы для файловой системы
-            for char in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']:
-                filename = filename.replace(char, '_')
-            
-            # Путь к локальному файлу
-            local_path = os.path.join(self.temp_dir, filename)
+            # Если файл уже скачан, просто возвращаем путь (лучшую из имеющихся копий)
+            metrics = get_metrics_registry()
+            cached_bitrate, cached_path = self._cached_copy(track_info)
+            if cached_path:
+                print(f"Using cached track ({cached_bitrate} kbps): {cached_path}")
+                metrics.inc("yandex_track_cache_total", labels={"result": "hit"})
+                if self.bitrate_policy.fast_start and cached_bitrate < self.bitrate_policy.max_bitrate:
+                    self._upgrade_async(track_info, cached_bitrate)
+                return cached_path
+            metrics.inc("yandex_track_cache_total", labels={"result": "miss"})
             
-            # Если файл уже скачан, просто возвращаем путь
-            if os.path.exists(local_path) and os.path.getsize(local_path) > 0:
-                print(f"Using cached track: {local_path}")
-                return local_path
-            
-            # Получаем трек по ID
-            track = self.client.tracks(track_id)[0]
+            with metrics.timer("yandex_download_seconds"):
+                # Метаданные трека уже есть в track_info; варианты загрузки могли быть получены заранее (prefetch)
+                bitrate, upgrade = self.bitrate_policy.plan(track_info.get('duration'), self.track_cache.bitrates(track_id))
+                if bitrate is None:
+                    print(f"Track {track_id} has no mp3 download variants")
+                    return None
+                
+                # Скачиваем трек
+                local_path = self._track_path(track_info, bitrate)
+                print(f"Starting download of {title} ({bitrate} kbps) to {local_path}")
+                if not self._download_variant(track_id, bitrate, local_path):
+                    return None
             
-            # Скачиваем трек
-            print(f"Starting download of {track.title} to {local_path}")
-            track.download(local_path, bitrate_in_kbps=320)
+            if upgrade:
+                self._upgrade_async(track_info, bitrate)
             
             # Проверяем, что файл успешно скачался
             if os.path.exists(local_path) and os.path.getsize(local_path) > 0:
@@ -256,6 +427,27 @@ class YandexMusicAPI:
             traceback.print_exc()
             return None
     
+    def prefetch_download_info(self, track_info):
+        """Get the download link of a queued track ahead of its download"""
+        if not self.is_authorized or not track_info:
+            return None
+        
+        def prefetch():
+            try:
+                # Если копия уже есть, ссылка не понадобится
+                if self._cached_copy(track_info)[1]:
+                    return
+                track_id = track_info['id']
+                bitrate, _ = self.bitrate_policy.plan(track_info.get('duration'), self.track_cache.bitrates(track_id))
+                if bitrate:
+                    self.track_cache.download_info(track_id, bitrate=bitrate)
+            except Exception as e:
+                print(f"Error prefetching Yandex download info for {track_info.get('id')}: {e}")
+        
+        thread = threading.Thread(target=prefetch, daemon=True)
+        thread.start()
+        return thread
+    
     def clean_temp_directory(self, max_age_hours=24):
         """Очистить временную директорию от старых файлов"""
         try:
@@ -1,11 +1,11 @@
 import customtkinter as ctk
 import tkinter as tk
-import threading
 import webbrowser
-import requests
 from PIL import Image, ImageTk
-from io import BytesIO
 from audio_player import AudioPlayer
+from image_loader import get_image_loader
+from image_cache import ImageCache
+from endpoints import get_endpoints
 
 class YandexMusicPlayerFrame(ctk.CTkFrame):
     def __init__(self, master, skip_callback=None, **kwargs):
@@ -170,6 +170,7 @@ class YandexMusicPlayerFrame(ctk.CTkFrame):
                 self.audio_player.stop()
                 
                 # Возвращаем заглушку
+                get_image_loader().cancel("yandex_cover")
                 self.cover_label.configure(image=self.placeholder_image)
                 
                 # Скрываем плеер
@@ -203,11 +204,8 @@ class YandexMusicPlayerFrame(ctk.CTkFrame):
     
     def load_album_art(self, track_info):
         """Загружает обложку альбома"""
-        # Запускаем в отдельном потоке, чтобы не блокировать UI
-        threading.Thread(target=self._fetch_album_art, args=(track_info,), daemon=True).start()
-    
-    def _fetch_album_art(self, track_info):
-        """Загружает обложку альбома из сети"""
+        # Загрузка, декодирование и масштабирование идут в пуле потоков,
+        # в поток Tk передается только готовое изображение
         try:
             if not isinstance(track_info, dict):
                 return
@@ -218,27 +216,22 @@ class YandexMusicPlayerFrame(ctk.CTkFrame):
             
             if not album_id or not track_id:
                 return
-                
+            
             # Формируем URL обложки (обычно это был бы API-вызов)
             # В данном случае делаем упрощенно - предполагаем, что URL можно сформировать статически
-            try:
-                # У нас нет прямого доступа к API из этого потока, используем статичный URL
-                cover_url = f"https://avatars.yandex.net/get-music-content/{album_id}/{track_id}/400x400"
-                response = requests.get(cover_url)
-                
-                if response.status_code == 200:
-                    img = Image.open(BytesIO(response.content))
-                    
-                    # Создаем CTkImage
-                    ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=(300, 300))
-                    
-                    # Обновляем UI безопасно из главного потока
-                    self.after(0, lambda: self.cover_label.configure(image=ctk_img))
-                    # Сохраняем ссылку, чтобы избежать сборки мусора
-                    self._current_cover = ctk_img
-            except Exception as e:
-                print(f"Error loading album art: {e}")
-                # В случае ошибки оставляем заглушку
+            cover_url = get_endpoints().url("yandex_covers", f"/get-music-content/{album_id}/{track_id}/400x400")
+            
+            def on_loaded(img):
+                # Создаем CTkImage
+                ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=(300, 300))
+                # Сохраняем ссылку, чтобы избежать сборки мусора
+                self._current_cover = ctk_img
+                self.cover_label.configure(image=ctk_img)
+            
+            # В случае ошибки оставляем заглушку
+            cache_key = ImageCache.make_key("yandex", album_id, (300, 300))
+            get_image_loader().load("yandex_cover", cover_url, (300, 300), self, on_loaded,
+                                    cache_key=cache_key)
         
         except Exception as e:
             print(f"Error fetching album art: {e}")
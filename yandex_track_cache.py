@@ -0,0 +1,154 @@
+import threading
+import time
+
+from endpoints import get_endpoints
+from metrics import get_metrics_registry
+
+# Сколько помним разрешенные треки (метаданные почти не меняются)
+TRACK_TTL = 6 * 60 * 60
+# Список вариантов загрузки (кодек/битрейт) живет дольше прямой ссылки: ссылка подписана по времени
+DOWNLOAD_INFO_TTL = 10 * 60
+DIRECT_LINK_TTL = 60
+MAX_TRACKS = 2000
+
+class YandexTrackCache:
+    """Resolved Yandex Music tracks and their download info.
+
+    Tracks seen in search results and My Wave batches are remembered, so a
+    queued track is not looked up again before its download. Lookups of
+    unknown ids are batched: concurrent callers share one multi-id
+    client.tracks() call. Download info (the list of codec/bitrate variants
+    and the direct link of the variant actually used) is cached with expiry.
+    """
+
+    def __init__(self, yandex_api):
+        self.yandex_api = yandex_api
+        self._tracks = {}          # id трека -> (Track, время истечения)
+        self._download_info = {}   # id трека -> (список DownloadInfo, время истечения)
+        self._link_expires = {}    # (id, кодек, битрейт) -> время истечения прямой ссылки
+        self._wanted = set()       # id, которые ждут следующего запроса client.tracks()
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+        self.metrics = get_metrics_registry()
+        self.metrics.describe("yandex_metadata_requests_total", "Yandex Music metadata requests by kind")
+
+    def clear(self):
+        """Забыть все (например, при смене токена)"""
+        with self._lock:
+            self._tracks.clear()
+            self._download_info.clear()
+            self._link_expires.clear()
+
+    def remember(self, tracks):
+        """Keep Track objects that were already received (search, rotor)"""
+        expires = time.monotonic() + TRACK_TTL
+        with self._lock:
+            for track in tracks:
+                if track is not None and track.id is not None:
+                    self._tracks[str(track.id)] = (track, expires)
+            if len(self._tracks) > MAX_TRACKS:
+                # Словарь упорядочен по вставке - выбрасываем самые старые
+                for track_id in list(self._tracks)[:len(self._tracks) - MAX_TRACKS]:
+                    del self._tracks[track_id]
+
+    def _cached_tracks(self, track_ids):
+        now = time.monotonic()
+        with self._lock:
+            found = {}
+            for track_id in track_ids:
+                entry = self._tracks.get(track_id)
+                if entry and entry[1] > now:
+                    found[track_id] = entry[0]
+            return found
+
+    def get_tracks(self, track_ids):
+        """Tracks for ids (missing or unavailable ids are skipped), in one request at most"""
+        track_ids = [str(track_id).split(":")[0] for track_id in track_ids]
+        found = self._cached_tracks(track_ids)
+        missing = [track_id for track_id in track_ids if track_id not in found]
+        if missing:
+            with self._lock:
+                self._wanted.update(missing)
+            # Пока один поток ждет ответа, другие копят id; следующий запрос заберет их все сразу
+            with self._fetch_lock:
+                with self._lock:
+                    batch, self._wanted = self._wanted, set()
+                batch -= set(self._cached_tracks(batch))
+                if batch and self.yandex_api.wait_until_ready():
+                    try:
+                        self.metrics.inc("yandex_metadata_requests_total", labels={"kind": "tracks"})
+                        self.remember(self.yandex_api.client.tracks(sorted(batch)))
+                    except Exception as e:
+                        print(f"Error getting Yandex tracks {sorted(batch)}: {e}")
+            found.update(self._cached_tracks(missing))
+        return [found[track_id] for track_id in track_ids if track_id in found]
+
+    def get_track(self, track_id):
+        tracks = self.get_tracks([track_id])
+        return tracks[0] if tracks else None
+
+    def _download_infos(self, track_id, fresh=False):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._download_info.get(track_id)
+        if not fresh and entry and entry[1] > now:
+            return entry[0]
+        if not self.yandex_api.wait_until_ready():
+            return []
+        # Прямые ссылки не запрашиваем для всех вариантов - только для выбранного
+        self.metrics.inc("yandex_metadata_requests_total", labels={"kind": "download_info"})
+        infos = self.yandex_api.client.tracks_download_info(track_id, get_direct_links=False)
+        with self._lock:
+            self._download_info.pop(track_id, None)
+            self._download_info[track_id] = (infos, now + DOWNLOAD_INFO_TTL)
+            self._evict_download_info(now)
+        return infos
+
+    def _evict_download_info(self, now):
+        """Выбросить истекшие варианты загрузки и ссылки, а сверх MAX_TRACKS - самые старые (под _lock)"""
+        for track_id in [track_id for track_id, entry in self._download_info.items() if entry[1] <= now]:
+            del self._download_info[track_id]
+        if len(self._download_info) > MAX_TRACKS:
+            for track_id in list(self._download_info)[:len(self._download_info) - MAX_TRACKS]:
+                del self._download_info[track_id]
+        # Ссылка без списка вариантов не используется: download_info() сначала берет список
+        for key in [key for key, expires in self._link_expires.items()
+                    if expires <= now or key[0] not in self._download_info]:
+            del self._link_expires[key]
+
+    def bitrates(self, track_id, codec='mp3'):
+        """Bitrates the track can be downloaded in"""
+        track_id = str(track_id).split(":")[0]
+        return sorted({info.bitrate_in_kbps for info in self._download_infos(track_id) if info.codec == codec})
+
+    def download_info(self, track_id, codec='mp3', bitrate=320, fresh=False):
+        """DownloadInfo with a direct link for the track, or None if that bitrate is unavailable"""
+        track_id = str(track_id).split(":")[0]
+        infos = self._download_infos(track_id, fresh)
+        info = next((i for i in infos if i.codec == codec and i.bitrate_in_kbps == bitrate), None)
+        if info is None:
+            return None
+
+        key = (track_id, codec, bitrate)
+        now = time.monotonic()
+        with self._lock:
+            link_expires = self._link_expires.get(key, 0)
+        if fresh or info.direct_link is None or link_expires <= now:
+            self.metrics.inc("yandex_metadata_requests_total", labels={"kind": "direct_link"})
+            info.get_direct_link()
+            # Прямые ссылки всегда https://<host>/...; при подмене хранилища перенаправляем их
+            endpoints = get_endpoints()
+            if endpoints.is_overridden("yandex_storage"):
+                info.direct_link = endpoints.rewrite_storage_link(info.direct_link)
+            with self._lock:
+                self._link_expires[key] = now + DIRECT_LINK_TTL
+        return info
+
+    def invalidate(self, track_id):
+        """Drop cached download info of a track (e.g. after its link failed)"""
+        track_id = str(track_id).split(":")[0]
+        with self._lock:
+            self._download_info.pop(track_id, None)
+            for key in [key for key in self._link_expires if key[0] == track_id]:
+                del self._link_expires[key]
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from endpoints import get_endpoints
+from metrics import get_metrics_registry
+from ytdlp_pool import HAS_YT_DLP, download_audio
+
+FILE_PREFIX = "youtube_"
+# Сколько ждать загрузки аудио, прежде чем играть видео в iframe
+FETCH_TIMEOUT = 60
+
+_cache_instance = None
+
+def youtube_cover_url(song):
+    """Thumbnail shown as the cover of an audio-only YouTube song (None for other sources)"""
+    if song.source != 'youtube':
+        return None
+    return get_endpoints().url("youtube_thumbnails", f"/vi/{song.video_id}/hqdefault.jpg")
+
+def get_youtube_audio_cache():
+    """Get singleton instance of YouTubeAudioCache"""
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = YouTubeAudioCache()
+    return _cache_instance
+
+class YouTubeAudioCache:
+    """Audio-only YouTube playback: the audio stream is downloaded with yt-dlp
+    into the track cache folder and played like a Yandex track through /audio/.
+
+    A track is usually fetched while the previous one plays (prefetch), so it
+    starts as fast as a cached file. Without yt-dlp, or if the download fails,
+    players fall back to the video iframe.
+    """
+
+    def __init__(self, enabled=False, directory=None, workers=2):
+        self.enabled = enabled
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "yandex_music_bot")
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="youtube-audio")
+        self._downloads = {}  # video_id -> Future загрузки
+        self._lock = threading.Lock()
+
+        self.metrics = get_metrics_registry()
+        self.metrics.describe("youtube_audio_cache_total", "Audio-only YouTube lookups by result")
+
+    def configure(self, enabled=None, directory=None):
+        """Apply the player "youtube_audio_only" setting and the cache folder"""
+        if enabled is not None:
+            self.enabled = enabled
+        if directory:
+            self.directory = directory
+
+    @property
+    def available(self):
+        return self.enabled and HAS_YT_DLP
+
+    def cached_path(self, video_id):
+        """Path of an already downloaded audio file, or None"""
+        prefix = f"{FILE_PREFIX}{video_id}."
+        try:
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix) and not name.endswith((".part", ".ytdl")):
+                    path = os.path.join(self.directory, name)
+                    if os.path.getsize(path) > 0:
+                        return path
+        except OSError:
+            pass
+        return None
+
+    def _download(self, video_id):
+        path = self.cached_path(video_id)
+        if path:
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        with self.metrics.timer("youtube_audio_download_seconds"):
+            path = download_audio(video_id, self.directory, prefix=FILE_PREFIX)
+        print(f"Downloaded YouTube audio {video_id} to {path}")
+        return path
+
+    def _submit(self, video_id):
+        with self._lock:
+            future = self._downloads.get(video_id)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._download, video_id)
+            self._downloads[video_id] = future
+        # Законченные загрузки больше не нужны - файл уже лежит в кеше
+        # (вне _lock: у готовой задачи колбэк вызывается сразу)
+        future.add_done_callback(lambda f: self._forget(video_id, f))
+        return future
+
+    def _forget(self, video_id, future):
+        with self._lock:
+            if self._downloads.get(video_id) is future:
+                del self._downloads[video_id]
+
+    def prefetch(self, video_id):
+        """Start downloading the audio of a queued video in the background"""
+        if not self.available or self.cached_path(video_id):
+            return None
+        return self._submit(video_id)
+
+    def fetch(self, video_id, timeout=FETCH_TIMEOUT):
+        """Path of the audio file (waits for the download), or None if it failed"""
+        path = self.cached_path(video_id)
+        if path:
+            self.metrics.inc("youtube_audio_cache_total", labels={"result": "hit"})
+            return path
+        # Загрузка могла уже идти (prefetch) - тогда просто ждем ее
+        self.metrics.inc("youtube_audio_cache_total", labels={"result": "miss"})
+        try:
+            return self._submit(video_id).result(timeout)
+        except Exception as e:
+            print(f"Error downloading YouTube audio {video_id}: {e}")
+            return None
@@ -3,19 +3,19 @@ import customtkinter as ctk
 from PIL import Image, ImageTk
 import os
 import sys
-import socket
-import http.server
-import socketserver
 import subprocess
-import tempfile
 import threading
 import webbrowser
-import json
 import urllib.parse
-import io
+from image_loader import get_image_loader
+from image_cache import ImageCache
+from endpoints import get_endpoints
+from player_interface import PlayerFrameInterface
+from player_server import PlayerServer, create_player_html, find_free_port
+from youtube_audio import get_youtube_audio_cache, youtube_cover_url
 
-class YouTubePlayerFrame(ctk.CTkFrame):
-    def __init__(self, master, music_player, config_manager=None, skip_callback=None, **kwargs):
+class YouTubePlayerFrame(ctk.CTkFrame, PlayerFrameInterface):
+    def __init__(self, master, music_player, config_manager=None, skip_callback=None, server_port=None, **kwargs):
         super().__init__(master, **kwargs)  # Передаем только стандартные параметры в родительский класс
         
         # Сохраняем пользовательские параметры
@@ -25,6 +25,7 @@ class YouTubePlayerFrame(ctk.CTkFrame):
         
         self.master = master
         self.current_video_id = None
+        self.thumbnail_video_id = None  # Видео, чья миниатюра сейчас загружается
         self.is_playing = False
         
         # Для аудиофайлов
@@ -37,7 +38,8 @@ class YouTubePlayerFrame(ctk.CTkFrame):
             self.volume = self.config_manager.get_player_volume()
             print(f"Loaded volume from config: {self.volume}")
         
-        # Храним ссылки на все изображения, чтобы избежать сборки мусора
+        # Храним ссылки только на заглушку и текущую миниатюру, чтобы избежать сборки мусора;
+        # остальные миниатюры хранятся в ограниченном кеше image_cache
         self.image_references = {}
         
         # Добавим placeholder-изображение для случаев ошибок
@@ -45,7 +47,7 @@ class YouTubePlayerFrame(ctk.CTkFrame):
         
         # Player window process
         self.player_process = None
-        self.server_port = self._find_free_port()
+        self.server_port = server_port or self._find_free_port()  # Постоянный порт задается в channel_settings
         self.server = None
         self.server_thread = None
         self.waiting_for_player = False
@@ -105,11 +107,14 @@ class YouTubePlayerFrame(ctk.CTkFrame):
     
     def _find_free_port(self):
         """Find a free port to use for the server."""
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.bind(('', 0))
-        port = s.getsockname()[1]
-        s.close()
-        return port
+        return find_free_port()
+    
+    def call_soon(self, callback):
+        """Run callback on the Tk main thread"""
+        self.master.after(0, callback)
+    
+    def get_current_title(self):
+        return self.title_label.cget("text")
         
     def _create_ui(self):
         """Create the player UI elements."""
@@ -171,821 +176,17 @@ class YouTubePlayerFrame(ctk.CTkFrame):
         
     def _create_player_html(self):
         """Create an HTML file for the media player that supports both YouTube and audio files."""
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Music Bot Player</title>
-            <style>
-                body {{ 
-                    margin: 0; 
-                    padding: 0; 
-                    background-color: #000; 
-                    overflow: hidden;
-                    font-family: Arial, sans-serif;
-                }}
-                #player {{ 
-                    width: 100%; 
-                    height: 100vh; 
-                }}
-                #audio-player {{
-                    position: fixed;
-                    top: 0;
-                    left: 0;
-                    width: 100%;
-                    height: 100vh;
-                    display: flex;
-                    flex-direction: column;
-                    justify-content: center;
-                    align-items: center;
-                    color: white;
-                    background: #000;
-                    z-index: 100;
-                    display: none;
-                }}
-                #audio-player.active {{
-                    display: flex;
-                }}
-                .cover-art {{
-                    width: 300px;
-                    height: 300px;
-                    background-color: #FFCC00;
-                    margin-bottom: 20px;
-                    display: flex;
-                    justify-content: center;
-                    align-items: center;
-                    font-size: 24px;
-                    color: black;
-                    overflow: hidden;
-                    position: relative;
-                }}
-                .cover-art img {{
-                    width: 100%;
-                    height: 100%;
-                    object-fit: cover;
-                }}
-                .track-info {{
-                    text-align: center;
-                    margin-bottom: 20px;
-                    width: 80%;
-                    max-width: 600px;
-                }}
-                .track-title {{
-                    font-size: 24px;
-                    font-weight: bold;
-                    margin-bottom: 10px;
-                }}
-                .track-artist {{
-                    font-size: 18px;
-                    opacity: 0.8;
-                }}
-                .audio-controls {{
-                    display: flex;
-                    justify-content: center;
-                    gap: 15px;
-                    margin-top: 20px;
-                }}
-                .audio-control-btn {{
-                    background: #4CAF50;
-                    color: white;
-                    border: none;
-                    padding: 10px 20px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-size: 16px;
-                    min-width: 100px;
-                }}
-                #audio-progress {{
-                    width: 80%;
-                    max-width: 500px;
-                    margin: 10px 0;
-                }}
-                #audio-volume {{
-                    width: 200px;
-                    margin: 10px 0;
-                }}
-                #controls {{
-                    position: fixed;
-                    bottom: 0;
-                    left: 0;
-                    right: 0;
-                    background: rgba(0,0,0,0.7);
-                    color: white;
-                    padding: 10px;
-                    display: flex;
-                    justify-content: space-between;
-                    align-items: center;
-                    z-index: 1000;
-                }}
-                .control-button {{
-                    background: #4CAF50;
-                    border: none;
-                    color: white;
-                    padding: 5px 10px;
-                    cursor: pointer;
-                    border-radius: 3px;
-                    margin: 0 5px;
-                }}
-                #status {{
-                    margin-left: 10px;
-                }}
-                #song-info {{
-                    flex-grow: 1;
-                    text-align: center;
-                    overflow: hidden;
-                    text-overflow: ellipsis;
-                    white-space: nowrap;
-                }}
-                #autoplay-overlay {{
-                    position: fixed;
-                    top: 0;
-                    left: 0;
-                    right: 0;
-                    bottom: 0;
-                    background: rgba(0,0,0,0.85);
-                    display: flex;
-                    flex-direction: column;
-                    justify-content: center;
-                    align-items: center;
-                    z-index: 2000;
-                    color: white;
-                }}
-                #autoplay-button {{
-                    background: #4CAF50;
-                    color: white;
-                    border: none;
-                    padding: 15px 30px;
-                    font-size: 18px;
-                    cursor: pointer;
-                    border-radius: 4px;
-                    margin-top: 20px;
-                    transition: background 0.3s;
-                }}
-                #autoplay-button:hover {{
-                    background: #3e8e41;
-                }}
-                .source-indicator {{
-                    position: absolute;
-                    top: 10px;
-                    right: 10px;
-                    background: rgba(0,0,0,0.6);
-                    color: white;
-                    padding: 5px 10px;
-                    border-radius: 4px;
-                    font-size: 12px;
-                }}
-            </style>
-        </head>
-        <body>
-            <!-- YouTube Player -->
-            <div id="player"></div>
-            
-            <!-- Audio Player for Yandex Music -->
-            <div id="audio-player">
-                <div class="source-indicator">Yandex Music</div>
-                <div class="cover-art" id="cover-container">
-                    <div id="cover-placeholder">Yandex Music</div>
-                    <img id="cover-image" style="display:none;">
-                </div>
-                <div class="track-info">
-                    <div class="track-title" id="audio-title">Трек не выбран</div>
-                    <div class="track-artist" id="audio-artist">Исполнитель</div>
-                </div>
-                <audio id="audio-element" preload="auto"></audio>
-                <input type="range" id="audio-progress" min="0" max="100" value="0">
-                <div class="time-display">
-                    <span id="current-time">0:00</span> / <span id="total-time">0:00</span>
-                </div>
-                <div class="audio-controls">
-                    <button class="audio-control-btn" id="audio-play-pause">Play</button>
-                    <button class="audio-control-btn" id="audio-skip">Skip</button>
-                </div>
-                <div class="volume-control">
-                    <label for="audio-volume">Громкость:</label>
-                    <input type="range" id="audio-volume" min="0" max="100" value="{self.volume}">
-                </div>
-            </div>
-            
-            <!-- Оверлей для нажатия кнопки автовоспроизведения -->
-            <div id="autoplay-overlay">
-                <h2>Музыкальный плеер готов к работе</h2>
-                <p>Для запуска автоматического воспроизведения нажмите кнопку ниже</p>
-                <button id="autoplay-button" onclick="enableAutoplay()">Запустить воспроизведение</button>
-            </div>
-            
-            <div id="controls">
-                <div id="status">Ready</div>
-                <div id="song-info">No song playing</div>
-                <div>
-                    <button class="control-button" onclick="skipSong()">Skip</button>
-                </div>
-            </div>
-            
-            <script>
-                // Communication with the main app
-                const PORT = {self.server_port};
-                const BASE_URL = `http://localhost:${{PORT}}`;
-                
-                // Сохраняем настройку громкости, чтобы применить её сразу после инициализации
-                let pendingVolume = {self.volume};
-                let pendingVideoId = null;
-                let pendingVideoTitle = null;
-                let pendingAudioSrc = null;
-                let pendingAudioInfo = null;
-                let autoplayEnabled = false;
-                let currentMediaType = null; // 'youtube' или 'audio'
-                
-                // Получаем элементы аудио-плеера
-                const audioPlayer = document.getElementById('audio-player');
-                const audioElement = document.getElementById('audio-element');
-                const audioTitle = document.getElementById('audio-title');
-                const audioArtist = document.getElementById('audio-artist');
-                const audioProgress = document.getElementById('audio-progress');
-                const audioVolume = document.getElementById('audio-volume');
-                const audioPlayPause = document.getElementById('audio-play-pause');
-                const audioSkip = document.getElementById('audio-skip');
-                const currentTimeDisplay = document.getElementById('current-time');
-                const totalTimeDisplay = document.getElementById('total-time');
-                const coverImage = document.getElementById('cover-image');
-                const coverPlaceholder = document.getElementById('cover-placeholder');
-                
-                // Настраиваем аудио-плеер
-                function setupAudioPlayer() {{
-                    // Обновление прогресса
-                    audioElement.addEventListener('timeupdate', function() {{
-                        if (audioElement.duration) {{
-                            const percent = (audioElement.currentTime / audioElement.duration) * 100;
-                            audioProgress.value = percent;
-                            
-                            // Обновляем отображение времени
-                            currentTimeDisplay.textContent = formatTime(audioElement.currentTime);
-                        }}
-                    }});
-                    
-                    // При изменении ползунка прогресса
-                    audioProgress.addEventListener('input', function() {{
-                        const seekTime = (audioProgress.value / 100) * audioElement.duration;
-                        audioElement.currentTime = seekTime;
-                    }});
-                    
-                    // При изменении громкости
-                    audioVolume.addEventListener('input', function() {{
-                        const volume = audioVolume.value / 100;
-                        audioElement.volume = volume;
-                        pendingVolume = audioVolume.value;
-                    }});
-                    
-                    // Кнопка Play/Pause
-                    audioPlayPause.addEventListener('click', function() {{
-                        if (audioElement.paused) {{
-                            audioElement.play();
-                            audioPlayPause.textContent = 'Pause';
-                        }} else {{
-                            audioElement.pause();
-                            audioPlayPause.textContent = 'Play';
-                        }}
-                    }});
-                    
-                    // Кнопка Skip
-                    audioSkip.addEventListener('click', skipSong);
-                    
-                    // При загрузке метаданных трека
-                    audioElement.addEventListener('loadedmetadata', function() {{
-                        totalTimeDisplay.textContent = formatTime(audioElement.duration);
-                    }});
-                    
-                    // При окончании трека
-                    audioElement.addEventListener('ended', function() {{
-                        console.log('Audio ended, playing next song');
-                        audioPlayPause.textContent = 'Play';
-                        skipSong();
-                    }});
-                    
-                    // Устанавливаем начальную громкость
-                    audioVolume.value = pendingVolume;
-                    audioElement.volume = pendingVolume / 100;
-                }}
-                
-                // Форматирование времени в формат MM:SS
-                function formatTime(seconds) {{
-                    const min = Math.floor(seconds / 60);
-                    const sec = Math.floor(seconds % 60);
-                    return `${{min}}:${{sec < 10 ? '0' : ''}}${{sec}}`;
-                }}
-                
-                // Показать аудио-плеер
-                function showAudioPlayer() {{
-                    audioPlayer.classList.add('active');
-                    if (document.querySelector('#player iframe')) {{
-                        document.querySelector('#player iframe').style.display = 'none';
-                    }}
-                    currentMediaType = 'audio';
-                    console.log("Audio player activated");
-                }}
-                
-                // Показать YouTube-плеер
-                function showYouTubePlayer() {{
-                    audioPlayer.classList.remove('active');
-                    if (document.querySelector('#player iframe')) {{
-                        document.querySelector('#player iframe').style.display = 'block';
-                    }}
-                    currentMediaType = 'youtube';
-                    console.log("YouTube player activated");
-                }}
-                
-                // Загрузить аудиофайл и начать воспроизведение
-                function loadAudio(src, info) {{
-                    console.log('Loading audio:', src, info);
-                    
-                    if (!autoplayEnabled) {{
-                        pendingAudioSrc = src;
-                        pendingAudioInfo = info;
-                        document.getElementById('song-info').innerText = "Нажмите кнопку 'Запустить воспроизведение'";
-                        return false;
-                    }}
-                    
-                    showAudioPlayer();
-                    
-                    // Остановим YouTube плеер если он играет
-                    if (player && typeof player.stopVideo === 'function') {{
-                        player.stopVideo();
-                    }}
-                    
-                    // Загружаем аудиофайл
-                    audioElement.src = src;
-                    
-                    // Обновляем информацию о треке
-                    if (info) {{
-                        audioTitle.textContent = info.title || 'Неизвестный трек';
-                        audioArtist.textContent = info.artist || 'Неизвестный исполнитель';
-                        document.getElementById('song-info').innerText = `${{info.title}} - ${{info.artist}}`;
-                        
-                        // Обновляем обложку если есть
-                        if (info.cover) {{
-                            coverImage.src = info.cover;
-                            coverImage.style.display = 'block';
-                            coverPlaceholder.style.display = 'none';
-                        }} else {{
-                            coverImage.style.display = 'none';
-                            coverPlaceholder.style.display = 'block';
-                        }}
-                    }}
-                    
-                    // Воспроизводим трек
-                    audioElement.play()
-                        .then(() => {{
-                            audioPlayPause.textContent = 'Pause';
-                            document.getElementById('status').innerText = "Now playing";
-                        }})
-                        .catch(e => {{
-                            console.error('Error playing audio:', e);
-                            document.getElementById('status').innerText = "Error: " + e;
-                        }});
-                    
-                    return true;
-                }}
-                
-                // Функция для разрешения автовоспроизведения
-                function enableAutoplay() {{
-                    console.log('Enabling autoplay');
-                    
-                    // Скрываем оверлей
-                    document.getElementById('autoplay-overlay').style.display = 'none';
-                    autoplayEnabled = true;
-                    
-                    // Настраиваем аудио-плеер
-                    setupAudioPlayer();
-                    
-                    // Явно применяем громкость сразу после активации
-                    if (player && player.setVolume) {{
-                        player.setVolume(pendingVolume);
-                        console.log(`Applied volume on autoplay enable: ${{pendingVolume}}`);
-                        
-                        // Убедимся, что звук не выключен
-                        if (player.isMuted && player.isMuted()) {{
-                            player.unMute();
-                            console.log("Unmuted player");
-                        }}
-                    }}
-                    
-                    // Небольшая задержка перед проверкой контента
-                    setTimeout(() => {{
-                        // Проверяем, что у нас есть в очереди
-                        if (pendingVideoId) {{
-                            console.log('Loading pending video:', pendingVideoId);
-                            loadVideo(pendingVideoId, pendingVideoTitle);
-                            pendingVideoId = null;
-                            pendingVideoTitle = null;
-                        }} else if (pendingAudioSrc) {{
-                            console.log('Loading pending audio:', pendingAudioSrc);
-                            loadAudio(pendingAudioSrc, pendingAudioInfo);
-                            pendingAudioSrc = null;
-                            pendingAudioInfo = null;
-                        }} else {{
-                            // Иначе просто проверяем, есть ли текущее видео
-                            checkForPendingMedia();
-                        }}
-                    }}, 300);
-                }}
-                
-                // YouTube Player API
-                var tag = document.createElement('script');
-                tag.src = "https://www.youtube.com/iframe_api";
-                var firstScriptTag = document.getElementsByTagName('script')[0];
-                firstScriptTag.parentNode.insertBefore(tag, firstScriptTag);
-                
-                var player;
-                function onYouTubeIframeAPIReady() {{
-                    console.log('YouTube API ready');
-                    player = new YT.Player('player', {{
-                        height: '100%',
-                        width: '100%',
-                        videoId: '',
-                        playerVars: {{
-                            'autoplay': 0, // Начинаем без автовоспроизведения
-                            'controls': 1,
-                            'rel': 0,
-                            'modestbranding': 1
-                        }},
-                        events: {{
-                            'onReady': onPlayerReady,
-                            'onStateChange': onPlayerStateChange,
-                            'onError': onPlayerError
-                        }}
-                    }});
-                }}
-                
-                function onPlayerReady(event) {{
-                    console.log('Player ready');
-                    document.getElementById('status').innerText = "Player ready";
-                    
-                    // Устанавливаем сохраненную громкость
-                    if (pendingVolume) {{
-                        player.setVolume(pendingVolume);
-                        console.log(`Applied initial volume: ${{pendingVolume}}`);
-                    }}
-                    
-                    // Notify main app that player is ready
-                    fetch(`${{BASE_URL}}/player_ready`)
-                        .catch(e => console.error('Error notifying ready:', e));
-                    
-                    // Check for pending media
-                    setTimeout(() => {{
-                        checkForPendingMedia();
-                    }}, 500);
-                }}
-                
-                function onPlayerStateChange(event) {{
-                    // Check if video ended (0 = ended)
-                    if (event.data === 0) {{
-                        console.log('Video ended');
-                        document.getElementById('status').innerText = "Video ended";
-                        
-                        // Notify main app
-                        fetch(`${{BASE_URL}}/video_ended`)
-                            .catch(e => console.error('Error notifying video ended:', e));
-                    }}
-                }}
-                
-                function onPlayerError(event) {{
-                    console.log('Player error: ' + event.data);
-                    document.getElementById('status').innerText = "Error: " + event.data;
-                    
-                    // Notify main app
-                    fetch(`${{BASE_URL}}/player_error?code=${{event.data}}`)
-                        .catch(e => console.error('Error notifying error:', e));
-                }}
-                
-                function loadVideo(videoId, title = "Unknown Title") {{
-                    console.log('Loading video:', videoId, title);
-                    
-                    if (player && player.loadVideoById) {{
-                        if (autoplayEnabled) {{
-                            console.log(`Loading video: ${{videoId}} with volume ${{pendingVolume}}`);
-                            
-                            // Проверяем громкость перед загрузкой видео
-                            if (player.getVolume() != pendingVolume) {{
-                                player.setVolume(pendingVolume);
-                                console.log(`Re-applied volume before loading: ${{pendingVolume}}`);
-                            }}
-                            
-                            // Убедимся, что звук не выключен
-                            if (player.isMuted && player.isMuted()) {{
-                                player.unMute();
-                            }}
-                            
-                            // Показываем YouTube плеер
-                            showYouTubePlayer();
-                            
-                            // Останавливаем аудио если играет
-                            if (audioElement && !audioElement.paused) {{
-                                audioElement.pause();
-                                audioPlayPause.textContent = 'Play';
-                            }}
-                            
-                            // Загружаем видео
-                            player.loadVideoById(videoId);
-                            document.getElementById('song-info').innerText = title;
-                            document.getElementById('status').innerText = "Now playing";
-                            
-                            // Force play
-                            player.playVideo();
-                            
-                            return true;
-                        }} else {{
-                            // Сохраняем видео для автовоспроизведения после нажатия кнопки
-                            console.log(`Saving video for autoplay: ${{videoId}}`);
-                            pendingVideoId = videoId;
-                            pendingVideoTitle = title;
-                            document.getElementById('song-info').innerText = "Нажмите кнопку 'Запустить воспроизведение'";
-                            return false;
-                        }}
-                    }} else {{
-                        console.error("Player not ready");
-                        document.getElementById('status').innerText = "Player not ready";
-                        pendingVideoId = videoId;
-                        pendingVideoTitle = title;
-                        return false;
-                    }}
-                }}
-                
-                function skipSong() {{
-                    // Tell the main app to skip the song
-                    fetch(`${{BASE_URL}}/skip_song`)
-                        .catch(e => console.error('Error sending skip command:', e));
-                }}
-                
-                // Check for pending media from the main app
-                function checkForPendingMedia() {{
-                    fetch(`${{BASE_URL}}/get_current_video`)
-                        .then(response => response.json())
-                        .then(data => {{
-                            console.log('Checking for pending media, received:', data);
-                            if (data.video_id) {{
-                                console.log(`Got pending video: ${{data.video_id}}`);
-                                loadVideo(data.video_id, data.title);
-                            }} else if (data.audio_src) {{
-                                console.log(`Got pending audio: ${{data.audio_src}}`);
-                                loadAudio(data.audio_src, data.audio_info);
-                            }}
-                        }})
-                        .catch(e => console.error('Error checking for pending media:', e));
-                }}
-                
-                // Poll for changes
-                setInterval(() => {{
-                    fetch(`${{BASE_URL}}/check_for_commands`)
-                        .then(response => response.json())
-                        .then(data => {{
-                            if (data.command === 'load') {{
-                                console.log('Load command received:', data);
-                                if (data.video_id) {{
-                                    loadVideo(data.video_id, data.title);
-                                }} else if (data.audio_src) {{
-                                    loadAudio(data.audio_src, data.audio_info);
-                                }}
-                            }} else if (data.command === 'pause') {{
-                                console.log('Pause command received');
-                                if (autoplayEnabled) {{
-                                    if (currentMediaType === 'youtube' && player && player.pauseVideo) {{
-                                        player.pauseVideo();
-                                    }} else if (currentMediaType === 'audio') {{
-                                        audioElement.pause();
-                                        audioPlayPause.textContent = 'Play';
-                                    }}
-                                }}
-                            }} else if (data.command === 'play') {{
-                                console.log('Play command received');
-                                if (autoplayEnabled) {{
-                                    if (currentMediaType === 'youtube' && player && player.playVideo) {{
-                                        player.playVideo();
-                                    }} else if (currentMediaType === 'audio') {{
-                                        audioElement.play().then(() => {{
-                                            audioPlayPause.textContent = 'Pause';
-                                        }}).catch(e => console.error('Error playing audio:', e));
-                                    }}
-                                }} else {{
-                                    // Если воспроизведение не разрешено, подсказываем пользователю
-                                    document.getElementById('autoplay-button').style.animation = 'pulse 1s infinite';
-                                }}
-                            }} else if (data.command === 'volume' && data.value !== undefined) {{
-                                console.log('Volume command received:', data.value);
-                                pendingVolume = data.value;
-                                
-                                // Применяем громкость к активному плееру
-                                if (currentMediaType === 'youtube' && player && player.setVolume) {{
-                                    player.setVolume(data.value);
-                                    console.log(`YouTube volume set to ${{data.value}}`);
-                                }} else if (currentMediaType === 'audio') {{
-                                    audioElement.volume = data.value / 100;
-                                    audioVolume.value = data.value;
-                                    console.log(`Audio volume set to ${{data.value}}`);
-                                }} else {{
-                                    console.log(`Volume value ${{data.value}} saved for later`);
-                                }}
-                            }} else if (data.command === 'clear') {{
-                                console.log('Clear command received');
-                                // Остановка текущего медиа
-                                if (currentMediaType === 'youtube' && player && player.stopVideo) {{
-                                    player.stopVideo();
-                                    player.clearVideo();
-                                }} else if (currentMediaType === 'audio') {{
-                                    audioElement.pause();
-                                    audioElement.currentTime = 0;
-                                    audioElement.src = '';  // Очищаем источник
-                                    audioPlayPause.textContent = 'Play';
-                                }}
-                                
-                                document.getElementById('song-info').innerText = "No song playing";
-                                document.getElementById('status').innerText = "Ready";
-                                
-                                console.log("Playlist ended, player cleared");
-                            }}
-                        }})
-                        .catch(e => console.error('Error checking for commands:', e));
-                }}, 1000);
-            </script>
-        </body>
-        </html>
-        """
-        
-        try:
-            # Create a temporary HTML file that will persist for the session
-            fd, path = tempfile.mkstemp(suffix='.html')
-            
-            # Важно: явно указываем кодировку UTF-8 при записи файла
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            
-            # Закрываем файловый дескриптор, открытый tempfile.mkstemp()
-            os.close(fd)
-            
-            return path
-            
-        except Exception as e:
-            print(f"Error creating player HTML file: {e}")
-            
-            # Запасной вариант без специальных символов
-            backup_html = html_content.replace("Оверлей", "Overlay").replace("Запустить воспроизведение", "Start playback")
-            
-            fd, path = tempfile.mkstemp(suffix='.html')
-            with os.fdopen(fd, 'w') as f:
-                f.write(backup_html)
-                
-            return path
+        return create_player_html(self.server_port, self.volume)
     
     def _start_server(self):
         """Start a simple HTTP server to communicate with the player."""
-        class PlayerHandler(http.server.SimpleHTTPRequestHandler):
-            def __init__(self, *args, player_frame=None, **kwargs):
-                self.player_frame = player_frame
-                super().__init__(*args, **kwargs)
-                
-            def do_GET(self):
-                try:
-                    import urllib.parse
-                    
-                    parsed_path = urllib.parse.urlparse(self.path)
-                    path = parsed_path.path
-                    
-                    print(f"GET request received: {path}")
-                    
-                    # Обработка аудиофайлов
-                    if path.startswith('/audio/'):
-                        # Декодируем путь к файлу
-                        audio_file = urllib.parse.unquote(path[7:])  # Удаляем префикс '/audio/'
-                        print(f"Audio file requested: {audio_file}")
-                        
-                        # Проверяем существование файла
-                        if os.path.exists(audio_file) and os.path.isfile(audio_file):
-                            try:
-                                print(f"Serving audio file: {audio_file}, size: {os.path.getsize(audio_file)} bytes")
-                                
-                                # Отправляем заголовки
-                                self.send_response(200)
-                                self.send_header('Content-type', 'audio/mpeg')
-                                self.send_header('Content-Length', str(os.path.getsize(audio_file)))
-                                self.send_header('Access-Control-Allow-Origin', '*')  # CORS
-                                self.end_headers()
-                                
-                                # Отправляем файл
-                                with open(audio_file, 'rb') as f:
-                                    self.wfile.write(f.read())
-                                    
-                                print(f"File {audio_file} sent successfully")
-                                return
-                            except Exception as e:
-                                print(f"Error serving audio file: {e}")
-                                self.send_response(500)
-                                self.send_header('Content-type', 'text/plain')
-                                self.end_headers()
-                                self.wfile.write(f"Error: {str(e)}".encode())
-                                return
-                        else:
-                            print(f"Audio file not found: {audio_file}")
-                            self.send_response(404)
-                            self.send_header('Content-type', 'text/plain')
-                            self.end_headers()
-                            self.wfile.write(b'File not found')
-                            return
-                    
-                    # Для остальных запросов - стандартная обработка JSON API
-                    self.send_response(200)
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    
-                    # Обработка API запросов
-                    if path == '/player_ready':
-                        print("Player ready notification received")
-                        if self.player_frame:
-                            # Schedule on main thread
-                            self.player_frame.master.after(0, self.player_frame._on_player_ready)
-                        self.wfile.write(json.dumps({"status": "ok"}).encode())
-                        
-                    elif path == '/video_ended':
-                        print("Media ended notification received")
-                        if self.player_frame:
-                            # Schedule on main thread
-                            self.player_frame.master.after(0, self.player_frame._on_media_ended)
-                        self.wfile.write(json.dumps({"status": "ok"}).encode())
-                        
-                    elif path == '/player_error':
-                        query = urllib.parse.parse_qs(parsed_path.query)
-                        error_code = query.get('code', ['unknown'])[0]
-                        print(f"Player error notification received: {error_code}")
-                        if self.player_frame:
-                            # Schedule on main thread
-                            self.player_frame.master.after(0, lambda: self.player_frame._on_player_error(error_code))
-                        self.wfile.write(json.dumps({"status": "ok"}).encode())
-                        
-                    elif path == '/get_current_video':
-                        response = {"video_id": "", "title": "", "audio_src": "", "audio_info": {}}
-                        if self.player_frame:
-                            if self.player_frame.current_video_id:
-                                response = {
-                                    "video_id": self.player_frame.current_video_id,
-                                    "title": self.player_frame.title_label.cget("text"),
-                                    "audio_src": "",
-                                    "audio_info": {}
-                                }
-                            elif hasattr(self.player_frame, 'current_audio_src') and self.player_frame.current_audio_src:
-                                response = {
-                                    "video_id": "",
-                                    "title": "",
-                                    "audio_src": self.player_frame.current_audio_src,
-                                    "audio_info": self.player_frame.current_audio_info or {}
-                                }
-                        self.wfile.write(json.dumps(response).encode())
-                        
-                    elif path == '/check_for_commands':
-                        response = {"command": "none"}
-                        if hasattr(self.player_frame, 'pending_command'):
-                            response = self.player_frame.pending_command
-                            self.player_frame.pending_command = {"command": "none"}
-                        self.wfile.write(json.dumps(response).encode())
-                        
-                    elif path == '/skip_song':
-                        print("Skip song command received")
-                        if self.player_frame:
-                            # Schedule on main thread
-                            self.player_frame.master.after(0, self.player_frame._skip_song)
-                        self.wfile.write(json.dumps({"status": "ok"}).encode())
-                        
-                    else:
-                        self.wfile.write(json.dumps({"error": "unknown_command"}).encode())
-                
-                except Exception as e:
-                    print(f"Error handling request {self.path}: {e}")
-                    try:
-                        self.send_response(500)
-                        self.send_header('Content-type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({"error": str(e)}).encode())
-                    except:
-                        pass
-                        
-            def log_message(self, format, *args):
-                # Suppress default log messages
-                pass
-
         # Initialize pending command
         self.pending_command = {"command": "none"}
         
-        # Create handler with reference to this frame
-        handler = lambda *args, **kwargs: PlayerHandler(*args, player_frame=self, **kwargs)
-        
         try:
-            # Start server on the chosen port
-            self.server = socketserver.ThreadingTCPServer(("localhost", self.server_port), handler)
-            self.server.daemon_threads = True  # Ensure threads exit when main thread exits
-            print(f"Starting server on port {self.server_port}")
-            
-            # Run server in a background thread
-            self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
-            self.server_thread.start()
+            # Start server on the chosen port (in a background thread)
+            self.server = PlayerServer(self, self.server_port)
+            self.server_thread = self.server.start()
             
         except Exception as e:
             print(f"Error starting server: {e}")
@@ -1026,33 +227,38 @@ class YouTubePlayerFrame(ctk.CTkFrame):
             print(f"Error launching player window: {e}")
     
     def _load_thumbnail_from_url(self, video_id):
-        """Load a thumbnail for a YouTube video."""
-        try:
-            # Если у нас уже есть кешированное изображение, используем его
-            if video_id in self.image_references:
-                return self.image_references[video_id]
-                
-            # URL for the YouTube thumbnail (high quality)
-            thumbnail_url = f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-            
-            # Load image from URL
-            with urllib.request.urlopen(thumbnail_url) as url_response:
-                img_data = url_response.read()
-                
-            # Create PIL image from data
-            pil_img = Image.open(io.BytesIO(img_data))
+        """Load a thumbnail for a YouTube video asynchronously."""
+        # Пока миниатюра загружается, показываем заглушку
+        self._show_thumbnail(None)
+        self.thumbnail_video_id = video_id
+        
+        # URL for the YouTube thumbnail (high quality)
+        thumbnail_url = get_endpoints().url("youtube_thumbnails", f"/vi/{video_id}/hqdefault.jpg")
+        cache_key = ImageCache.make_key("youtube", video_id, (640, 360))
+        
+        def on_loaded(pil_img):
+            # Трек мог смениться, пока шла загрузка
+            if self.thumbnail_video_id != video_id:
+                return
             
             # Convert to CTkImage for proper HiDPI support
             ctk_img = ctk.CTkImage(light_image=pil_img, dark_image=pil_img, size=(640, 360))
             
-            # Save reference to prevent garbage collection
-            self.image_references[video_id] = ctk_img
-            
-            return ctk_img
-            
-        except Exception as e:
-            print(f"Error loading thumbnail: {e}")
-            return self.placeholder_image if hasattr(self, "placeholder_image") else None
+            # Save reference to prevent garbage collection (only the current one)
+            self.image_references["current"] = ctk_img
+            self._show_thumbnail(ctk_img)
+        
+        get_image_loader().load("youtube_thumbnail", thumbnail_url, (640, 360), self, on_loaded,
+                                cache_key=cache_key)
+    
+    def _show_thumbnail(self, ctk_img):
+        """Show a thumbnail image or the placeholder."""
+        if ctk_img:
+            self.thumbnail_label.configure(image=ctk_img, text="")
+        elif hasattr(self, "placeholder_image") and self.placeholder_image:
+            self.thumbnail_label.configure(image=self.placeholder_image, text="")
+        else:
+            self.thumbnail_label.configure(image=None, text="Thumbnail not available")
     
     def _on_player_ready(self):
         """Called when the player is ready."""
@@ -1112,6 +318,7 @@ class YouTubePlayerFrame(ctk.CTkFrame):
                 self.is_playing = False
                 
                 # Очищаем изображение
+                get_image_loader().cancel("youtube_thumbnail")
                 self.thumbnail_label.configure(image=None, text="Ready to play videos")
                 
                 # Clear any existing timer
@@ -1131,7 +338,25 @@ class YouTubePlayerFrame(ctk.CTkFrame):
             self.pack(fill=tk.BOTH, expand=True)
                 
             # Определяем тип медиа
-            if song.source == 'yandex':
+            if song.source == 'local':
+                # Файл из локальной папки - сразу отдаем через /audio/
+                self.title_label.configure(text=song.title)
+                self.now_playing_label.configure(text=f"Requested by: {song.requester}")
+                get_image_loader().cancel("youtube_thumbnail")
+                if hasattr(self, "placeholder_image") and self.placeholder_image:
+                    self.thumbnail_label.configure(image=self.placeholder_image, text="")
+                else:
+                    self.thumbnail_label.configure(image=None, text="Local file")
+                
+                if not os.path.isfile(song.video_id):
+                    print(f"Local file not found: {song.video_id}")
+                    return False
+                
+                self.play_pause_btn.configure(text="Pause")
+                self.is_playing = True
+                self._on_track_downloaded(song.video_id, song)
+                return True
+            elif song.source == 'yandex':
                 print("Processing Yandex track")
                 # Yandex Music трек - загружаем и проигрываем как аудио
                 self.title_label.configure(text=song.title)
@@ -1141,6 +366,7 @@ class YouTubePlayerFrame(ctk.CTkFrame):
                 self.current_video_id = None
                 
                 # Загружаем заглушку для Yandex Music
+                get_image_loader().cancel("youtube_thumbnail")
                 if hasattr(self, "placeholder_image") and self.placeholder_image:
                     self.thumbnail_label.configure(image=self.placeholder_image, text="")
                 else:
@@ -1169,20 +395,10 @@ class YouTubePlayerFrame(ctk.CTkFrame):
                 if not video_id:
                     print("Error: No video ID in song object")
                     return False
-                    
-                self.current_video_id = video_id
-                print(f"Set current_video_id to: {self.current_video_id}")
                 
-                # Загружаем миниатюру
+                # Загружаем миниатюру в фоне
                 try:
-                    ctk_img = self._load_thumbnail_from_url(video_id)
-                    if ctk_img:
-                        self.thumbnail_label.configure(image=ctk_img, text="")
-                    else:
-                        if hasattr(self, "placeholder_image") and self.placeholder_image:
-                            self.thumbnail_label.configure(image=self.placeholder_image, text="")
-                        else:
-                            self.thumbnail_label.configure(image=None, text="Thumbnail not available")
+                    self._load_thumbnail_from_url(video_id)
                 except Exception as thumbnail_error:
                     print(f"Error loading thumbnail: {thumbnail_error}")
                     if hasattr(self, "placeholder_image") and self.placeholder_image:
@@ -1194,29 +410,14 @@ class YouTubePlayerFrame(ctk.CTkFrame):
                 self.play_pause_btn.configure(text="Pause")
                 self.is_playing = True
                 
-                # Load video in player
-                self.pending_command = {
-                    "command": "load",
-                    "video_id": video_id,
-                    "title": song.title
-                }
-                print(f"Set pending_command to load video: {video_id}")
-                
-                # Убедимся, что браузер запущен
-                if not hasattr(self, 'browser_launched') or not self.browser_launched:
-                    self._launch_player_window()
-                
-                # Set safety timer
-                duration_secs = getattr(song, 'duration', 300)  # Default to 5 minutes if duration unknown
-                
-                # Clear any existing safety timer
-                if hasattr(self, 'safety_timer') and self.safety_timer:
-                    self.after_cancel(self.safety_timer)
-                    self.safety_timer = None
-                    
-                # Set new safety timer
-                self.safety_timer = self.after(int((duration_secs + 30) * 1000), self._on_safety_timeout)
+                if get_youtube_audio_cache().available:
+                    # Только звук: аудиодорожка играет через /audio/, видео - запасной вариант
+                    self.current_video_id = None
+                    self.title_label.configure(text=f"Загрузка: {song.title}")
+                    threading.Thread(target=self._fetch_youtube_audio, args=(song,), daemon=True).start()
+                    return True
                 
+                self._play_video(song)
                 return True
                 
         except Exception as e:
@@ -1225,6 +426,53 @@ class YouTubePlayerFrame(ctk.CTkFrame):
             traceback.print_exc()
             return False
 
+    def _play_video(self, song):
+        """Play a YouTube song as video in the browser player iframe"""
+        video_id = song.video_id
+        self.current_video_id = video_id
+        print(f"Set current_video_id to: {self.current_video_id}")
+        
+        # Load video in player
+        self.pending_command = {
+            "command": "load",
+            "video_id": video_id,
+            "title": song.title
+        }
+        print(f"Set pending_command to load video: {video_id}")
+        self.music_player.record_track_started()
+        
+        # Убедимся, что браузер запущен
+        if not hasattr(self, 'browser_launched') or not self.browser_launched:
+            self._launch_player_window()
+        
+        # Set safety timer
+        duration_secs = getattr(song, 'duration', 300)  # Default to 5 minutes if duration unknown
+        
+        # Clear any existing safety timer
+        if hasattr(self, 'safety_timer') and self.safety_timer:
+            self.after_cancel(self.safety_timer)
+            self.safety_timer = None
+            
+        # Set new safety timer
+        self.safety_timer = self.after(int((duration_secs + 30) * 1000), self._on_safety_timeout)
+
+    def _fetch_youtube_audio(self, song):
+        """Download the audio of a YouTube song in background thread"""
+        file_path = get_youtube_audio_cache().fetch(song.video_id)
+        self.after(0, lambda: self._on_youtube_audio_ready(file_path, song))
+
+    def _on_youtube_audio_ready(self, file_path, song):
+        """Called on the Tk thread once the audio-only download finished"""
+        # Пока шла загрузка, трек могли пропустить
+        if self.music_player.current_song is not song:
+            return
+        if file_path:
+            self._on_track_downloaded(file_path, song)
+        else:
+            print(f"Audio-only playback failed, playing video: {song.title}")
+            self.title_label.configure(text=song.title)
+            self._play_video(song)
+
     def _prepare_yandex_track(self, song):
         """Prepare Yandex Music track for playback"""
         try:
@@ -1235,7 +483,8 @@ class YouTubePlayerFrame(ctk.CTkFrame):
             from music_player import get_yandex_music_api
             yandex_api = get_yandex_music_api()
             
-            if not yandex_api or not hasattr(yandex_api, 'is_authorized') or not yandex_api.is_authorized:
+            # Пока идет фоновая авторизация, загрузка дождется ее в своем потоке
+            if not yandex_api or not (yandex_api.is_authorized or yandex_api.is_authorizing):
                 print("Yandex Music API not authorized")
                 self.title_label.configure(text=f"Ошибка: API не авторизован")
                 return False
@@ -1268,12 +517,12 @@ class YouTubePlayerFrame(ctk.CTkFrame):
                 self.after(0, lambda: self._on_track_downloaded(file_path, song))
             else:
                 # Ошибка загрузки
-                self.after(0, lambda: self.title_label.configure(text=f"Ошибка загрузки: {song.title}"))
+                self.after(0, lambda: self._on_track_downloaded(None, song))
         
         except Exception as e:
             print(f"Error downloading Yandex track: {e}")
             # Переход обратно в основной поток
-            self.after(0, lambda: self.title_label.configure(text=f"Ошибка: {str(e)}"))
+            self.after(0, lambda: self._on_track_downloaded(None, song))
 
     def _on_track_downloaded(self, file_path, song):
         """Called when Yandex track is downloaded"""
@@ -1281,6 +530,8 @@ class YouTubePlayerFrame(ctk.CTkFrame):
             if not file_path:
                 print(f"Download failed for track: {song.title}")
                 self.title_label.configure(text=f"Ошибка загрузки: {song.title}")
+                # Плеер переходит к следующему треку и учитывает сбой источника
+                self.music_player.report_track_failed(song)
                 return
                 
             print(f"Track downloaded: {file_path}")
@@ -1289,11 +540,10 @@ class YouTubePlayerFrame(ctk.CTkFrame):
             audio_info = {
                 "title": song.title,
                 "artist": " & ".join(song.track_info.get('artists', [])) if isinstance(song.track_info, dict) else "Unknown Artist",
-                "cover": None
+                "cover": youtube_cover_url(song)
             }
             
             # Создаем URL для доступа к файлу через наш HTTP сервер
-            import urllib.parse
             encoded_path = urllib.parse.quote(file_path)
             audio_src = f"http://localhost:{self.server_port}/audio/{encoded_path}"
             
@@ -1310,6 +560,7 @@ class YouTubePlayerFrame(ctk.CTkFrame):
                 "audio_src": audio_src,
                 "audio_info": audio_info
             }
+            self.music_player.record_track_started()
             
             # Запускаем браузер если нужно
             if not hasattr(self, 'browser_launched') or not self.browser_launched:
@@ -1373,8 +624,11 @@ class YouTubePlayerFrame(ctk.CTkFrame):
     def _on_player_error(self, error_code):
         """Called when there's a player error."""
         print(f"Player error: {error_code}")
-        # Skip to next song after a delay
-        self.after(3000, self._skip_song)
+        if self.safety_timer:
+            self.after_cancel(self.safety_timer)
+            self.safety_timer = None
+        # Сразу к следующему треку: пауза перед пропуском - тишина в эфире
+        self.music_player.report_player_error(error_code)
     
     def _on_safety_timeout(self):
         """Called when the safety timer fires."""
@@ -1508,7 +762,6 @@ class YouTubePlayerFrame(ctk.CTkFrame):
             if self.server:
                 try:
                     self.server.shutdown()
-                    self.server.server_close()
                     print("HTTP server stopped")
                 except Exception as e:
                     print(f"Error stopping HTTP server: {e}")
@@ -0,0 +1,201 @@
+import itertools
+import multiprocessing
+import os
+import threading
+
+try:
+    import yt_dlp
+    HAS_YT_DLP = True
+except ImportError:
+    HAS_YT_DLP = False
+
+from metrics import get_metrics_registry
+
+SEARCH_OPTS = {
+    'format': 'bestaudio',
+    'quiet': True,
+    'no_warnings': True,
+    'default_search': 'ytsearch1:',
+    'noplaylist': True,
+    'extract_flat': True
+}
+
+INFO_OPTS = {
+    'format': 'bestaudio',
+    'quiet': True,
+    'no_warnings': True
+}
+
+# Плейлист: только id/название/длительность, страницы запрашиваются по мере перебора
+PLAYLIST_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': 'in_playlist',
+    'lazy_playlist': True
+}
+
+# Только аудиодорожка, без перекодирования (ffmpeg не нужен): m4a, если есть, иначе webm/opus
+AUDIO_OPTS = {
+    'format': 'bestaudio[ext=m4a]/bestaudio',
+    'quiet': True,
+    'no_warnings': True,
+    'noplaylist': True,
+    'retries': 5,
+    'continuedl': True
+}
+
+_pool_instance = None
+
+def get_ytdlp_pool():
+    """Get singleton instance of YtDlpResolverPool"""
+    global _pool_instance
+    if _pool_instance is None:
+        _pool_instance = YtDlpResolverPool()
+    return _pool_instance
+
+def search_entry(ydl, query):
+    """Top ytsearch result as {'id', 'title', 'duration', 'live_status'}, None if nothing found"""
+    info = ydl.extract_info(f'ytsearch1:{query}', download=False)
+    if 'entries' in info and len(info['entries']) > 0:
+        entry = info['entries'][0]
+        return {
+            'id': entry['id'],
+            'title': entry['title'],
+            'duration': entry.get('duration', 180),  # Если длительность недоступна, используем стандартные 3 минуты
+            # В плоской выдаче поиска есть только статус трансляции, остальное проверяется в фоне
+            'live_status': entry.get('live_status')
+        }
+    return None
+
+def video_info(ydl, url):
+    """Title, duration and playability fields of a single video"""
+    info = ydl.extract_info(url, download=False)
+    # Из процесса-воркера возвращаем только нужные поля, а не весь info (он большой)
+    return {
+        'title': info.get('title'),
+        'duration': info.get('duration'),
+        'playable_in_embed': info.get('playable_in_embed'),
+        'availability': info.get('availability'),
+        'live_status': info.get('live_status'),
+        'age_limit': info.get('age_limit')
+    }
+
+def iter_playlist(url, limit):
+    """Yield up to limit {'id', 'title', 'duration'} playlist entries as yt-dlp pages through them"""
+    with yt_dlp.YoutubeDL(dict(PLAYLIST_OPTS, playlistend=limit)) as ydl:
+        # process=False: entries остаются ленивым генератором, а не готовым списком
+        info = ydl.extract_info(url, download=False, process=False)
+        for entry in itertools.islice(info.get('entries') or [], limit):
+            if entry and entry.get('id'):
+                yield {
+                    'id': entry['id'],
+                    'title': entry.get('title') or f"YouTube Video {entry['id']}",
+                    'duration': entry.get('duration') or 180
+                }
+
+def download_audio(video_id, directory, prefix="youtube_"):
+    """Download the audio stream of a video into directory and return the file path"""
+    opts = dict(AUDIO_OPTS, outtmpl=os.path.join(directory, f"{prefix}%(id)s.%(ext)s"))
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        # yt-dlp пишет в .part и переименовывает файл только после полной загрузки
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+        return ydl.prepare_filename(info)
+
+# Прогретые экземпляры YoutubeDL процесса-воркера, живут между задачами
+_worker_ydl = {}
+
+def _worker_get_ydl(kind):
+    ydl = _worker_ydl.get(kind)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(SEARCH_OPTS if kind == "search" else INFO_OPTS)
+        _worker_ydl[kind] = ydl
+    return ydl
+
+def _worker_init():
+    _worker_get_ydl("search")
+    _worker_get_ydl("info")
+
+def _worker_search(query):
+    return search_entry(_worker_get_ydl("search"), query)
+
+def _worker_video_info(url):
+    return video_info(_worker_get_ydl("info"), url)
+
+class YtDlpResolverPool:
+    """Runs yt-dlp extraction in worker processes instead of the calling thread.
+
+    yt-dlp parsing holds the GIL for long stretches; in a separate process it
+    doesn't slow down Tk, the player HTTP server or the twitchio loop. Workers
+    are replaced after max_jobs_per_worker jobs to bound memory growth, and
+    a job that hangs or crashes its worker restarts the pool after timeout.
+    When disabled, MusicPlayer runs extraction inline as before.
+    """
+
+    def __init__(self, enabled=False, processes=2, max_jobs_per_worker=50, timeout=30):
+        self.enabled = enabled
+        self.processes = processes
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+
+        self.metrics = get_metrics_registry()
+        self.metrics.describe("ytdlp_pool_restarts_total", "yt-dlp worker pool restarts after a hung or crashed job")
+
+    def configure(self, enabled=None, processes=None, max_jobs_per_worker=None, timeout=None):
+        """Apply settings from the "ytdlp_pool" config section"""
+        if enabled is not None:
+            self.enabled = enabled
+        if processes:
+            self.processes = processes
+        if max_jobs_per_worker:
+            self.max_jobs_per_worker = max_jobs_per_worker
+        if timeout:
+            self.timeout = timeout
+        if not self.enabled:
+            self.shutdown()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: форк процесса с потоками Tk / twitchio небезопасен
+                context = multiprocessing.get_context("spawn")
+                self._pool = context.Pool(self.processes, initializer=_worker_init,
+                                          maxtasksperchild=self.max_jobs_per_worker)
+            return self._pool
+
+    def _restart(self, pool):
+        with self._lock:
+            # Пул мог уже перезапустить другой поток, ожидавший той же зависшей задачи
+            if self._pool is not pool:
+                return
+            self._pool = None
+        print("Restarting yt-dlp worker pool")
+        self.metrics.inc("ytdlp_pool_restarts_total")
+        pool.terminate()
+
+    def _run(self, func, arg):
+        pool = self._get_pool()
+        result = pool.apply_async(func, (arg,))
+        try:
+            return result.get(self.timeout)
+        except multiprocessing.TimeoutError:
+            # Зависший экстрактор или упавший воркер: задача уже не завершится
+            self._restart(pool)
+            raise TimeoutError(f"yt-dlp job did not finish in {self.timeout} seconds")
+
+    def search(self, query):
+        """Top YouTube search result for query (see search_entry)"""
+        return self._run(_worker_search, query)
+
+    def video_info(self, url):
+        """Title, duration and playability of the video at url (see video_info)"""
+        return self._run(_worker_video_info, url)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.terminate()
+            pool.join()